@@ -17,6 +17,7 @@ a = Analysis(
     hiddenimports=[
         'flask',
         'pyngrok',
+        'waitress',
         'tkinter',
         'tkinter.ttk',
         'tkinter.messagebox',
@@ -0,0 +1,6 @@
+"""
+Benchmarks for the quiz server
+
+Run from the project root, e.g. ``python -m benchmarks.load_test``.
+Synthetic quizzes come from benchmarks.quiz_generator.
+"""
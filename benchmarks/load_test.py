@@ -0,0 +1,440 @@
+"""
+Load test for the quiz server
+
+Simulates a class taking a quiz: N students open the page (arrivals
+spread over a ramp), sync the timer once, start, listen on /api/events like
+index.html does (or, with --poll-interval, poll /api/quiz_data the way
+the page used to), autosave their answers in a few deltas while they
+work, and all submit together at the deadline. Reports
+throughput, p50/p95/p99 latency per endpoint and memory growth.
+
+With --abandon, some anonymous students start and never submit: the
+server finalizes them together once their deadline (plus the submit
+grace period) has passed. Either way the run ends by exporting the
+results and checking that every stored submission got its own JSON file.
+
+Students run as threads against either the Flask test client (in
+process, no networking) or a real server on a local socket (production
+serving mode, started in this process). Everything runs in a scratch
+directory, so the project's data/ and results/ are not touched.
+
+    python -m benchmarks.load_test --students 300 --questions 200
+    python -m benchmarks.load_test --transport socket --students 500 --json report.json
+    python -m benchmarks.load_test --students 200 --abandon 50 --duration 10
+"""
+import argparse
+import http.client
+import json
+import logging
+import os
+import random
+import socket
+import sys
+import tempfile
+import threading
+import time
+from collections import Counter
+from typing import Dict, List, Optional
+
+from benchmarks.quiz_generator import generate_quiz, generate_answers
+from server.deadlines import RECHECK_INTERVAL
+from server.events import EVENT_WAIT
+
+ENDPOINTS = ('GET /', 'GET /api/quiz_data', 'POST /api/start', 'GET /api/events', 'POST /api/answers',
+             'POST /api/submit')
+AUTOSAVES = 4  # Answer uploads per student before the deadline
+
+
+def percentile(sorted_values: List[float], pct: float) -> float:
+    """Nearest-rank percentile of an already sorted list"""
+    if not sorted_values:
+        return 0.0
+    rank = max(0, min(len(sorted_values) - 1, int(round(pct / 100 * len(sorted_values) + 0.5)) - 1))
+    return sorted_values[rank]
+
+
+def rss_bytes() -> Optional[int]:
+    """Resident memory of this process, if the platform exposes it"""
+    try:
+        with open('/proc/self/statm') as f:
+            return int(f.read().split()[1]) * os.sysconf('SC_PAGE_SIZE')
+    except (OSError, ValueError, AttributeError):
+        pass
+    try:
+        import resource
+        peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+        return peak if sys.platform == 'darwin' else peak * 1024  # Peak, not current
+    except ImportError:
+        return None
+
+
+class ClientTransport:
+    """One student's browser, backed by the Flask test client (keeps its own cookies)"""
+
+    def __init__(self, app):
+        self.client = app.test_client()
+        self.body = b''
+
+    def request(self, method: str, path: str, body: Optional[Dict] = None) -> int:
+        if method == 'POST':
+            response = self.client.post(path, json=body)
+        else:
+            response = self.client.get(path)
+        self.body = response.get_data()
+        response.close()
+        return response.status_code
+
+
+class SocketTransport:
+    """One student's browser over a keep-alive HTTP connection"""
+
+    def __init__(self, host: str, port: int):
+        self.host = host
+        self.port = port
+        self.cookie = None
+        self.conn = None
+        self.body = b''
+
+    def request(self, method: str, path: str, body: Optional[Dict] = None) -> int:
+        headers = {}
+        if self.cookie:
+            headers['Cookie'] = self.cookie
+        payload = None
+        if body is not None:
+            payload = json.dumps(body).encode('utf-8')
+            headers['Content-Type'] = 'application/json'
+        for attempt in range(2):
+            if self.conn is None:
+                self.conn = http.client.HTTPConnection(self.host, self.port, timeout=60)
+            try:
+                self.conn.request(method, path, body=payload, headers=headers)
+                response = self.conn.getresponse()
+                self.body = response.read()
+                break
+            except (http.client.HTTPException, OSError):
+                # Server closed the connection (no keep-alive) - reconnect once
+                self.conn.close()
+                self.conn = None
+                if attempt:
+                    raise
+        set_cookie = response.getheader('Set-Cookie')
+        if set_cookie:
+            self.cookie = set_cookie.split(';', 1)[0]
+        if response.getheader('Connection', '').lower() == 'close':
+            self.conn.close()
+            self.conn = None
+        return response.status
+
+    def close(self):
+        if self.conn is not None:
+            self.conn.close()
+
+
+class StudentResult:
+    """Samples recorded by one simulated student"""
+
+    __slots__ = ('latencies', 'statuses', 'errors', 'submit_done')
+
+    def __init__(self):
+        self.latencies: Dict[str, List[float]] = {endpoint: [] for endpoint in ENDPOINTS}
+        self.statuses: Counter = Counter()
+        self.errors = 0
+        self.submit_done = None
+
+
+def run_student(transport, answers: Dict, arrive_at: float, deadline: float,
+                poll_interval: float, result: StudentResult, autosaves: int = AUTOSAVES,
+                student_name: str = 'Load Test Student', submit: bool = True):
+    """
+    Open the quiz, wait for the deadline, then submit
+
+    While waiting the student listens for control events (poll_interval 0)
+    or polls the timer every poll_interval seconds, and uploads its answers
+    in autosaves evenly spaced deltas; the submit carries whatever was not
+    uploaded yet (everything, with autosaves 0). Without submit the student
+    leaves at the deadline, for the server to finalize.
+    """
+    def call(endpoint: str, path: str, body: Optional[Dict] = None) -> Optional[Dict]:
+        method = endpoint.split(' ', 1)[0]
+        started = time.perf_counter()
+        try:
+            status = transport.request(method, path, body)
+        except Exception:
+            result.errors += 1
+            result.statuses[(endpoint, 'error')] += 1
+            return None
+        result.latencies[endpoint].append(time.perf_counter() - started)
+        result.statuses[(endpoint, status)] += 1
+        if status >= 400:
+            result.errors += 1
+            return None
+        try:
+            return json.loads(transport.body)
+        except ValueError:
+            return None
+
+    time.sleep(max(0.0, arrive_at - time.monotonic()))
+    call('GET /', '/')
+    data = call('GET /api/quiz_data', '/api/quiz_data') or {}  # The page's one sync
+    call('POST /api/start', '/api/start', {'student_name': student_name})
+
+    # (due time, answers) deltas, spread between arrival and the deadline
+    positions = list(answers)
+    started = time.monotonic()
+    deltas = [(started + (deadline - started) * (i + 1) / (autosaves + 1),
+               {p: answers[p] for p in positions[i::autosaves]}) for i in range(autosaves)]
+    unsaved = dict(answers)
+
+    def autosave_due(now: float) -> float:
+        """Upload the deltas that are due; return when the next one is"""
+        while deltas and deltas[0][0] <= now:
+            _, delta = deltas.pop(0)
+            if call('POST /api/answers', '/api/answers', {'answers': delta}) is not None:
+                for position in delta:
+                    unsaved.pop(position, None)
+        return deltas[0][0] if deltas else deadline
+
+    if poll_interval > 0:
+        next_poll = time.monotonic() + poll_interval
+        while next_poll < deadline:
+            next_autosave = autosave_due(time.monotonic())
+            time.sleep(max(0.0, min(next_poll, next_autosave) - time.monotonic()))
+            if time.monotonic() >= next_poll:
+                call('GET /api/quiz_data', '/api/quiz_data')
+                next_poll += poll_interval
+    else:
+        seq = data.get('event_seq', 0)
+        next_check = time.monotonic()
+        # A parked long-poll would outlast the deadline - the browser submits
+        # alongside it, this thread can not, so stop listening near the end
+        while deadline - time.monotonic() > EVENT_WAIT:
+            next_autosave = autosave_due(time.monotonic())
+            if time.monotonic() < next_check:
+                time.sleep(max(0.0, min(next_check, next_autosave) - time.monotonic()))
+                continue
+            events = call('GET /api/events', f'/api/events?since={seq}')
+            if events is None:
+                break
+            seq = events.get('seq', seq)
+            next_check = time.monotonic() + events.get('retry_ms', 0) / 1000
+
+    # Like the page: uploads stop when the deadline is close, the submit carries the rest
+    while deltas and deltas[0][0] < deadline - 1:
+        time.sleep(max(0.0, min(deltas[0][0], deadline) - time.monotonic()))
+        autosave_due(time.monotonic())
+    time.sleep(max(0.0, deadline - time.monotonic()))
+    if submit:
+        call('POST /api/submit', '/api/submit', {'student_name': student_name, 'answers': unsaved})
+        result.submit_done = time.monotonic()
+    if hasattr(transport, 'close'):
+        transport.close()
+
+
+def _wait_for_port(host: str, port: int, timeout: float = 10.0):
+    deadline = time.monotonic() + timeout
+    while time.monotonic() < deadline:
+        try:
+            with socket.create_connection((host, port), timeout=0.5):
+                return
+        except OSError:
+            time.sleep(0.05)
+    raise RuntimeError(f"Server did not start listening on {host}:{port}")
+
+
+def run_load_test(students: int = 100, questions: int = 50, duration: float = 60.0,
+                  poll_interval: float = 0.0, ramp: float = 5.0, transport: str = 'client',
+                  threads: int = 32, port: int = 5077, shuffle: bool = False,
+                  seed: int = 0, server_logs: bool = False, autosaves: int = AUTOSAVES,
+                  abandon: int = 0) -> Dict:
+    """
+    Run one simulated class against the app and return the report
+
+    The last abandon students start anonymously and never submit. Must be
+    called with the working directory set to a scratch directory: the app
+    reads data/ and writes results/ and logs/ relative to it.
+    """
+    quiz = generate_quiz(questions, seed=seed, name=f"loadtest_{questions}", shuffle=shuffle)
+    if abandon:
+        # Sessions started at the first arrival reach their deadline with the class
+        quiz['timer_minutes'] = (ramp + duration) / 60
+    os.makedirs('data', exist_ok=True)
+    with open(os.path.join('data', f"{quiz['name']}.json"), 'w', encoding='utf-8') as f:
+        json.dump(quiz, f, ensure_ascii=False)
+
+    from server import app as app_module
+    if not server_logs:
+        # Per-request INFO logging would flood the console
+        logging.getLogger().setLevel(logging.WARNING)
+    app = app_module.create_app(quiz['name'])
+
+    if transport == 'socket':
+        from server.serving import serve
+        host = '127.0.0.1'
+        threading.Thread(target=serve, args=(app,),
+                         kwargs={'host': host, 'port': port, 'mode': 'production', 'threads': threads},
+                         daemon=True).start()
+        _wait_for_port(host, port)
+        make_transport = lambda: SocketTransport(host, port)
+    elif transport == 'client':
+        make_transport = lambda: ClientTransport(app)
+    else:
+        raise ValueError(f"Unknown transport: {transport}")
+
+    rng = random.Random(seed)
+    answer_sets = [generate_answers(quiz, rng) for _ in range(students)]
+    results = [StudentResult() for _ in range(students)]
+
+    rss_start = rss_bytes()
+    start = time.monotonic() + 0.5  # Let every thread start before the first arrival
+    deadline = start + ramp + duration
+    workers = [
+        threading.Thread(target=run_student, daemon=True, args=(
+            make_transport(), answer_sets[i], start + ramp * i / max(1, students),
+            deadline, poll_interval, results[i], autosaves,
+            '' if i >= students - abandon else 'Load Test Student', i < students - abandon))
+        for i in range(students)
+    ]
+    for worker in workers:
+        worker.start()
+    for worker in workers:
+        worker.join()
+    finished = time.monotonic()
+    rss_end = rss_bytes()
+
+    if abandon:
+        # The last student to start is finalized after the ramp and the submit grace period
+        give_up = finished + ramp + app_module.SUBMIT_GRACE_SECONDS + RECHECK_INTERVAL + 10
+        while app_module.FINALIZED.total() < abandon and time.monotonic() < give_up:
+            time.sleep(0.5)
+
+    queue_depth = app_module.RESULTS_QUEUE.depth()
+    drain_started = time.monotonic()
+    app_module.shutdown(export=False)
+    drain_seconds = time.monotonic() - drain_started
+    store = app_module.get_results_store(quiz['name'])
+    stored = store.count()
+    # Every submission gets its own file, even under the same name in the same second
+    store.export()
+    exported = sum(1 for entry in os.scandir(store.results_dir) if entry.name.endswith('.json'))
+
+    return _build_report(quiz, results, students, transport, start, deadline, finished,
+                         rss_start, rss_end, app_module.QUIZZES.get().sessions.stats(),
+                         queue_depth, drain_seconds, stored, int(app_module.FINALIZED.total()), exported)
+
+
+def _build_report(quiz, results, students, transport, start, deadline, finished,
+                  rss_start, rss_end, session_stats, queue_depth, drain_seconds, stored,
+                  finalized, exported) -> Dict:
+    """Aggregate per-student samples into the report dict"""
+    endpoints = {}
+    total_requests = 0
+    for endpoint in ENDPOINTS:
+        samples = sorted(s for r in results for s in r.latencies[endpoint])
+        total_requests += len(samples)
+        endpoints[endpoint] = {
+            'requests': len(samples),
+            'p50_ms': round(percentile(samples, 50) * 1000, 2),
+            'p95_ms': round(percentile(samples, 95) * 1000, 2),
+            'p99_ms': round(percentile(samples, 99) * 1000, 2),
+            'max_ms': round((samples[-1] if samples else 0.0) * 1000, 2)
+        }
+    statuses = Counter()
+    for r in results:
+        statuses.update(r.statuses)
+    submit_times = [r.submit_done for r in results if r.submit_done is not None]
+    burst = max(submit_times) - deadline if submit_times else 0.0
+
+    return {
+        'transport': transport,
+        'students': students,
+        'questions': len(quiz['questions']),
+        'wall_seconds': round(finished - start, 2),
+        'requests': total_requests,
+        'throughput_rps': round(total_requests / max(finished - start, 1e-9), 1),
+        'errors': sum(r.errors for r in results),
+        'statuses': {f"{endpoint} {status}": count for (endpoint, status), count in sorted(
+            statuses.items(), key=lambda item: (item[0][0], str(item[0][1])))},
+        'endpoints': endpoints,
+        'submit_burst_seconds': round(burst, 3),
+        'submit_burst_rps': round(len(submit_times) / burst, 1) if burst > 0 else None,
+        'rss_start_mb': round(rss_start / 2**20, 1) if rss_start else None,
+        'rss_end_mb': round(rss_end / 2**20, 1) if rss_end else None,
+        'rss_growth_mb': round((rss_end - rss_start) / 2**20, 1) if rss_start and rss_end else None,
+        'sessions': session_stats,
+        'queue_depth_at_end': queue_depth,
+        'drain_seconds': round(drain_seconds, 3),
+        'stored_submissions': stored,
+        'auto_finalized': finalized,
+        'exported_files': exported
+    }
+
+
+def print_report(report: Dict):
+    print(f"\n{report['students']} students, {report['questions']} questions, "
+          f"{report['transport']} transport, {report['wall_seconds']} s")
+    print(f"{report['requests']} requests, {report['throughput_rps']} req/s, {report['errors']} errors")
+    print(f"\n{'endpoint':<22}{'requests':>10}{'p50 ms':>10}{'p95 ms':>10}{'p99 ms':>10}{'max ms':>10}")
+    for endpoint, row in report['endpoints'].items():
+        print(f"{endpoint:<22}{row['requests']:>10}{row['p50_ms']:>10}{row['p95_ms']:>10}"
+              f"{row['p99_ms']:>10}{row['max_ms']:>10}")
+    print(f"\nSubmit burst: {report['submit_burst_seconds']} s ({report['submit_burst_rps']} submits/s)")
+    print(f"Memory: {report['rss_start_mb']} MB -> {report['rss_end_mb']} MB "
+          f"(+{report['rss_growth_mb']} MB)")
+    print(f"Sessions: {report['sessions']}")
+    print(f"Results: {report['stored_submissions']} stored, queue depth {report['queue_depth_at_end']} "
+          f"at end, drained in {report['drain_seconds']} s")
+    print(f"Exports: {report['exported_files']} JSON files ({report['auto_finalized']} sessions finalized "
+          f"at the deadline)")
+    print("Statuses: " + ', '.join(f"{key}: {count}" for key, count in report['statuses'].items()))
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Load test the quiz server with simulated students")
+    parser.add_argument('--students', type=int, default=100)
+    parser.add_argument('--questions', type=int, default=50, help="Synthetic quiz size (10-5000)")
+    parser.add_argument('--duration', type=float, default=60.0,
+                        help="Seconds from the last arrival to the shared deadline")
+    parser.add_argument('--poll-interval', type=float, default=0.0,
+                        help="Poll the timer every N seconds (the page's old behaviour) "
+                             "instead of listening for events")
+    parser.add_argument('--autosaves', type=int, default=AUTOSAVES,
+                        help="Answer uploads per student before the deadline (0: all answers in the submit)")
+    parser.add_argument('--abandon', type=int, default=0,
+                        help="Students who start anonymously and never submit, finalized by the server "
+                             "(adds the submit grace period to the run)")
+    parser.add_argument('--ramp', type=float, default=5.0, help="Seconds over which students arrive")
+    parser.add_argument('--transport', choices=('client', 'socket'), default='client')
+    parser.add_argument('--threads', type=int, default=32, help="Server threads (socket transport)")
+    parser.add_argument('--port', type=int, default=5077)
+    parser.add_argument('--shuffle', action='store_true', help="Per-session question/option shuffling")
+    parser.add_argument('--seed', type=int, default=0)
+    parser.add_argument('--workdir', help="Scratch directory (default: a new temporary directory)")
+    parser.add_argument('--server-logs', action='store_true', help="Keep the server's INFO logging")
+    parser.add_argument('--json', help="Also write the report to this file")
+    args = parser.parse_args()
+
+    json_path = os.path.abspath(args.json) if args.json else None
+    workdir = args.workdir or tempfile.mkdtemp(prefix='quiz_loadtest_')
+    os.makedirs(workdir, exist_ok=True)
+    os.chdir(workdir)
+    print(f"Working directory: {workdir}")
+
+    report = run_load_test(students=args.students, questions=args.questions, duration=args.duration,
+                           poll_interval=args.poll_interval, ramp=args.ramp, transport=args.transport,
+                           threads=args.threads, port=args.port, shuffle=args.shuffle,
+                           seed=args.seed, server_logs=args.server_logs, autosaves=args.autosaves,
+                           abandon=min(args.abandon, args.students))
+    print_report(report)
+    if json_path:
+        with open(json_path, 'w', encoding='utf-8') as f:
+            json.dump(report, f, indent=2)
+        print(f"\nReport written to {json_path}")
+    if report['exported_files'] != report['stored_submissions'] or report['auto_finalized'] < args.abandon:
+        print(f"\nFAILED: {report['stored_submissions']} submissions stored ({report['auto_finalized']} "
+              f"finalized) but {report['exported_files']} JSON files exported")
+        return 1
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,244 @@
+"""
+Microbenchmarks for the server's hot functions
+
+Times calculate_score, validate_quiz_data, save_results,
+QuizManager.load_quiz/save_quiz and a dry-run regrade on synthetic
+quizzes of several sizes (and, for grading, several answer
+distributions). Uses only the standard library and runs offline in a
+scratch directory. The dry-run regrade is also checked to leave the
+results store and the quiz store unchanged, and a real regrade after it
+to move the item analysis's correct-answer marks to the fixed key.
+
+Results are written as a JSON baseline with stable key order, so a
+committed baseline shows regressions as a diff; --compare checks a run
+against a baseline and exits non-zero when something got slower.
+
+    python -m benchmarks.microbench --save benchmarks/baselines/microbench.json
+    python -m benchmarks.microbench --compare benchmarks/baselines/microbench.json
+"""
+import argparse
+import hashlib
+import json
+import logging
+import os
+import platform
+import random
+import sqlite3
+import statistics
+import sys
+import tempfile
+import timeit
+from datetime import datetime
+from typing import Callable, Dict, Optional
+
+from benchmarks.quiz_generator import generate_quiz, generate_answers
+
+QUIZ_SIZES = (10, 200, 1000, 5000)
+QUICK_SIZES = (10, 200)
+
+# name -> (correct_rate, skip_rate) passed to generate_answers
+ANSWER_DISTRIBUTIONS = {
+    'all_correct': (1.0, 0.0),
+    'typical': (0.7, 0.05),
+    'all_wrong': (0.0, 0.0),
+    'blank': (0.0, 1.0),
+}
+
+REGRADE_SUBMISSIONS = 100  # Stored submissions the dry-run regrade goes through
+REPEAT = 5
+REGRESSION_THRESHOLD = 1.25  # best time ratio vs baseline that counts as a regression
+
+
+def measure(func: Callable[[], object], repeat: int = REPEAT, min_time: float = 0.2) -> Dict:
+    """Time func with timeit; per-call times in microseconds"""
+    timer = timeit.Timer(func)
+    number, _ = timer.autorange()
+    number = max(1, int(number * min_time / 0.2))
+    timer.timeit(number)  # Warm-up run, discarded
+    runs = [elapsed / number * 1e6 for elapsed in timer.repeat(repeat=repeat, number=number)]
+    return {
+        'best_us': round(min(runs), 3),
+        'median_us': round(statistics.median(runs), 3),
+        'number': number
+    }
+
+
+def database_digest(path: str) -> str:
+    """Hash of a SQLite database's contents (WAL included), read without writing to it"""
+    conn = sqlite3.connect(f"file:{path}?mode=ro", uri=True)
+    try:
+        digest = hashlib.sha256()
+        for statement in conn.iterdump():
+            digest.update(statement.encode('utf-8'))
+        return digest.hexdigest()
+    finally:
+        conn.close()
+
+
+def answers_by_id(quiz_data: Dict, answers: Dict) -> Dict:
+    """Re-key generated answers (by position) the way submissions are stored (by question id)"""
+    from server.grading import question_key
+    questions = quiz_data.get('questions', [])
+    return {question_key(questions[int(position)], int(position)): answer for position, answer in answers.items()}
+
+
+def run_benchmarks(sizes=QUIZ_SIZES, repeat: int = REPEAT, only: Optional[str] = None) -> Dict[str, Dict]:
+    """
+    Run every benchmark and return {name: timings}
+
+    Must be called with the working directory set to a scratch directory:
+    QuizManager and the results store use data/ and results/ relative to it.
+    """
+    from server import app as app_module
+    from server.grading import compile_answer_key, question_key
+    from server.item_analysis import analyze_quiz
+    from server.regrade import regrade_quiz
+    from server.results_store import ResultsStore
+    from server.utils import validate_quiz_data
+    from gui.quiz_manager import QuizManager
+
+    # Handler I/O is not what is being measured (formatting still happens)
+    logging.getLogger().setLevel(logging.WARNING)
+    manager = QuizManager()
+    results = {}
+
+    def bench(name: str, func: Callable[[], object]):
+        if only and only not in name:
+            return
+        results[name] = measure(func, repeat=repeat)
+        print(f"{name:<45}{results[name]['best_us']:>14.1f} us")
+
+    for size in sizes:
+        quiz = generate_quiz(size, seed=size, name=f"microbench_{size}")
+        rng = random.Random(size)
+
+        bench(f"validate_quiz_data/{size}", lambda: validate_quiz_data(quiz))
+
+        # Grading the active quiz uses its precompiled key, like a live submission
+        # (saving gives the questions ids, so the answers are keyed by id)
+        manager.save_quiz(dict(quiz))
+        app_module.create_app(quiz['name'])
+        hosted = app_module.QUIZZES.get(quiz['name'])
+        active = hosted.data
+        for dist, (correct_rate, skip_rate) in ANSWER_DISTRIBUTIONS.items():
+            answers = answers_by_id(active, generate_answers(active, rng, correct_rate=correct_rate,
+                                                             skip_rate=skip_rate))
+            bench(f"calculate_score/{dist}/{size}",
+                  lambda: app_module.calculate_score(answers, active))
+
+        answers = answers_by_id(active, generate_answers(active, rng))
+        score = app_module.calculate_score(answers, active)
+        bench(f"save_results/{size}",
+              lambda: app_module.save_results('Bench Student', answers, score, 'bench-session', hosted=hosted))
+        app_module.shutdown(export=False)
+        app_module.unload_quiz(hosted.prefix)
+
+        bench(f"QuizManager.save_quiz/{size}", lambda: manager.save_quiz(quiz))
+        bench(f"QuizManager.load_quiz/{size}", lambda: manager.load_quiz(quiz['name']))
+
+        if not only or only in f"regrade_dry_run/{size}":
+            # Submissions on the saved quiz, then an answer key fix and a new question to preview
+            saved = manager.load_quiz(quiz['name'])
+            answer_key = compile_answer_key(saved)
+            store = ResultsStore(quiz['name'], 'regrade_results')
+            version = store.register_version(saved)
+            records = []
+            for i in range(REGRADE_SUBMISSIONS):
+                answers = answers_by_id(saved, generate_answers(saved, rng))
+                records.append({'student_name': f"Student {i}", 'session_id': f"regrade-{i}", 'answers': answers,
+                                'score': answer_key.grade(answers), 'quiz_version': version,
+                                'when': datetime.now()})
+            store.append_many(records)
+            store.close()
+            fixed = dict(saved, questions=list(saved['questions']) + [
+                {'type': 'true_false', 'text': 'Added after the submissions?', 'correct_answer': 'True'}])
+            fixed['questions'][0] = dict(fixed['questions'][0], correct_answer=fixed['questions'][0]['options'][0]
+                                         if fixed['questions'][0].get('options') else 'True')
+            manager.save_quiz(fixed)
+
+            databases = [store.path, os.path.join('data', 'quiz_store.db')]
+            before = [database_digest(path) for path in databases]
+            bench(f"regrade_dry_run/{size}",
+                  lambda: regrade_quiz(quiz['name'], results_dir='regrade_results', dry_run=True))
+            if [database_digest(path) for path in databases] != before:
+                raise RuntimeError(f"A dry-run regrade of {quiz['name']} changed the stored data")
+
+            # After the real regrade the item analysis marks the fixed answer as correct
+            regrade_quiz(quiz['name'], results_dir='regrade_results')
+            fixed_question = manager.load_quiz(quiz['name'])['questions'][0]
+            fixed_answer = fixed_question['correct_answer']
+            expected = set(map(str, fixed_answer)) if isinstance(fixed_answer, list) else {str(fixed_answer)}
+            item = next(item for item in analyze_quiz(quiz['name'], 'regrade_results')['items']
+                        if item['question_id'] == question_key(fixed_question, 0))
+            if {c['choice'] for c in item['choices'] if c['correct']} != \
+                    {c['choice'] for c in item['choices'] if c['choice'] in expected}:
+                raise RuntimeError(f"Item analysis of {quiz['name']} does not mark the regraded answer key")
+
+    return results
+
+
+def compare(results: Dict[str, Dict], baseline: Dict[str, Dict],
+            threshold: float = REGRESSION_THRESHOLD) -> int:
+    """Print each benchmark's ratio to the baseline; return how many regressed"""
+    regressions = 0
+    print(f"\n{'benchmark':<45}{'baseline us':>14}{'now us':>14}{'ratio':>8}")
+    for name, timing in results.items():
+        base = baseline.get(name)
+        if base is None:
+            print(f"{name:<45}{'-':>14}{timing['best_us']:>14.1f}{'new':>8}")
+            continue
+        ratio = timing['best_us'] / base['best_us'] if base['best_us'] else float('inf')
+        flag = ''
+        if ratio > threshold:
+            regressions += 1
+            flag = '  REGRESSION'
+        print(f"{name:<45}{base['best_us']:>14.1f}{timing['best_us']:>14.1f}{ratio:>8.2f}{flag}")
+    return regressions
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Microbenchmarks for grading, validation and persistence")
+    parser.add_argument('--quick', action='store_true', help=f"Only quiz sizes {QUICK_SIZES}")
+    parser.add_argument('--sizes', type=int, nargs='+', help="Quiz sizes to run")
+    parser.add_argument('--repeat', type=int, default=REPEAT)
+    parser.add_argument('--only', help="Only benchmarks whose name contains this text")
+    parser.add_argument('--save', help="Write the results as a JSON baseline")
+    parser.add_argument('--compare', help="Compare against a JSON baseline (exit 1 on regression)")
+    parser.add_argument('--threshold', type=float, default=REGRESSION_THRESHOLD,
+                        help="Slowdown ratio that counts as a regression")
+    args = parser.parse_args()
+
+    save_path = os.path.abspath(args.save) if args.save else None
+    compare_path = os.path.abspath(args.compare) if args.compare else None
+    sizes = args.sizes or (QUICK_SIZES if args.quick else QUIZ_SIZES)
+
+    os.chdir(tempfile.mkdtemp(prefix='quiz_microbench_'))
+    results = run_benchmarks(sizes=sizes, repeat=args.repeat, only=args.only)
+
+    if save_path:
+        os.makedirs(os.path.dirname(save_path), exist_ok=True)
+        with open(save_path, 'w', encoding='utf-8') as f:
+            json.dump({
+                'meta': {
+                    'python': platform.python_version(),
+                    'implementation': platform.python_implementation(),
+                    'machine': platform.machine(),
+                    'system': platform.system(),
+                    'created': datetime.now().isoformat(timespec='seconds')
+                },
+                'results': results
+            }, f, indent=2, sort_keys=True)
+            f.write('\n')
+        print(f"\nBaseline written to {save_path}")
+
+    if compare_path:
+        with open(compare_path, 'r', encoding='utf-8') as f:
+            baseline = json.load(f)['results']
+        regressions = compare(results, baseline, args.threshold)
+        if regressions:
+            print(f"\n{regressions} benchmark(s) slower than {args.threshold}x the baseline")
+            sys.exit(1)
+
+
+if __name__ == '__main__':
+    main()
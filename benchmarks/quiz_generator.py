@@ -0,0 +1,121 @@
+"""
+Synthetic quiz generator for benchmarks
+
+Builds valid quizzes of any size with a realistic mix of question types,
+and answer sets with a chosen share of correct answers. Output is
+deterministic for a given seed.
+"""
+import argparse
+import json
+import random
+from typing import Dict, List, Optional
+
+# Share of each question type in a generated quiz
+QUESTION_MIX = (
+    ('multiple_choice_single', 0.45),
+    ('multiple_choice_multiple', 0.15),
+    ('true_false', 0.20),
+    ('short_answer', 0.15),
+    ('paragraph', 0.05),
+)
+
+QUIZ_SIZES = (10, 50, 200, 1000, 5000)
+
+_WORDS = ('alpha', 'beta', 'gamma', 'delta', 'epsilon', 'zeta', 'theta', 'kappa',
+          'lambda', 'sigma', 'omega', 'photon', 'enzyme', 'vector', 'matrix', 'prime',
+          'river', 'empire', 'treaty', 'sonnet', 'القمر', 'été', 'Straße')
+
+
+def _text(rng: random.Random, words: int) -> str:
+    return ' '.join(rng.choice(_WORDS) for _ in range(words))
+
+
+def generate_question(rng: random.Random, q_type: str, index: int) -> Dict:
+    """Build one question of the given type"""
+    question = {
+        'type': q_type,
+        'text': f"Q{index + 1}: {_text(rng, rng.randint(6, 20))}?",
+        'weight': rng.choice((1, 1, 1, 2, 0.5))
+    }
+    if q_type in ('multiple_choice_single', 'multiple_choice_multiple'):
+        options = [f"{chr(65 + i)}. {_text(rng, rng.randint(1, 5))}" for i in range(rng.randint(3, 6))]
+        question['options'] = options
+        if q_type == 'multiple_choice_single':
+            question['correct_answer'] = rng.choice(options)
+        else:
+            question['correct_answer'] = rng.sample(options, rng.randint(1, len(options) - 1))
+    elif q_type == 'true_false':
+        question['correct_answer'] = rng.choice(('True', 'False'))
+    elif q_type == 'short_answer':
+        question['correct_answer'] = rng.choice(_WORDS)
+    else:
+        question['correct_answer'] = ''  # Paragraphs are graded by hand
+    return question
+
+
+def generate_quiz(question_count: int, seed: int = 0, name: Optional[str] = None,
+                  timer_minutes: int = 30, shuffle: bool = False) -> Dict:
+    """Build a valid quiz with question_count questions"""
+    rng = random.Random(seed)
+    types = [q_type for q_type, _ in QUESTION_MIX]
+    weights = [share for _, share in QUESTION_MIX]
+    return {
+        'name': name or f"bench_{question_count}",
+        'title': f"Benchmark quiz ({question_count} questions)",
+        'require_full_name': True,
+        'timer_minutes': timer_minutes,
+        'start_message': 'Synthetic quiz for benchmarking',
+        'end_message': 'Done',
+        'shuffle_questions': shuffle,
+        'shuffle_options': shuffle,
+        'questions': [generate_question(rng, q_type, i)
+                      for i, q_type in enumerate(rng.choices(types, weights, k=question_count))]
+    }
+
+
+def generate_answers(quiz_data: Dict, rng: random.Random, correct_rate: float = 0.7,
+                     skip_rate: float = 0.05) -> Dict[str, object]:
+    """
+    Build a submission's answers dict (keyed by question position)
+    
+    correct_rate is the chance each question is answered correctly and
+    skip_rate the chance it is left unanswered.
+    """
+    answers = {}
+    for i, question in enumerate(quiz_data.get('questions', [])):
+        if rng.random() < skip_rate:
+            continue
+        q_type = question.get('type')
+        correct = question.get('correct_answer', '')
+        right = rng.random() < correct_rate
+        if q_type == 'multiple_choice_single':
+            answers[str(i)] = correct if right else rng.choice(question['options'])
+        elif q_type == 'multiple_choice_multiple':
+            options: List[str] = question['options']
+            answers[str(i)] = list(correct) if right else rng.sample(options, rng.randint(1, len(options)))
+        elif q_type == 'true_false':
+            answers[str(i)] = correct if right else rng.choice(('True', 'False'))
+        elif q_type == 'short_answer':
+            answers[str(i)] = f"  {correct} " if right else _text(rng, 2)
+        else:
+            answers[str(i)] = _text(rng, rng.randint(20, 80))
+    return answers
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Generate a synthetic quiz for benchmarking")
+    parser.add_argument('questions', type=int, help="Number of questions")
+    parser.add_argument('-o', '--output', help="Output file (default: data/bench_<questions>.json)")
+    parser.add_argument('--seed', type=int, default=0)
+    parser.add_argument('--shuffle', action='store_true', help="Enable question and option shuffling")
+    args = parser.parse_args()
+
+    quiz = generate_quiz(args.questions, seed=args.seed, shuffle=args.shuffle)
+    output = args.output or f"data/{quiz['name']}.json"
+    with open(output, 'w', encoding='utf-8') as f:
+        json.dump(quiz, f, indent=2, ensure_ascii=False)
+    print(f"Wrote {output} ({args.questions} questions)")
+
+
+if __name__ == '__main__':
+    main()
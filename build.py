@@ -34,6 +34,7 @@ def build_exe():
         '--add-data=static;static',  # Include static files
         '--hidden-import=flask',
         '--hidden-import=pyngrok',
+        '--hidden-import=waitress',
         '--hidden-import=tkinter',
         '--hidden-import=tkinter.ttk',
         '--hidden-import=tkinter.messagebox',
@@ -0,0 +1,104 @@
+"""
+Question bank window
+
+Searches the questions of every quiz in data/ (see server.question_bank)
+by words of their text or options, tag and type, and copies the selected
+questions into the quiz being edited. Only one page of matches is read
+from the bank at a time.
+"""
+import copy
+import tkinter as tk
+from tkinter import ttk, messagebox
+from typing import Callable, Dict, List
+
+from server.question_bank import get_question_bank, question_tags
+from server.utils import new_question_id
+
+PAGE_SIZE = 100  # Matches listed at a time
+QUESTION_TYPES = ['multiple_choice_single', 'multiple_choice_multiple', 'true_false', 'short_answer', 'paragraph']
+
+
+class QuestionBankBrowser:
+    """Window for finding questions in the bank and adding them to a quiz"""
+
+    def __init__(self, parent, on_add: Callable[[Dict], None]):
+        self.on_add = on_add
+        self.bank = get_question_bank()
+        self._results: List[Dict] = []
+
+        self.window = tk.Toplevel(parent)
+        self.window.title("Question Bank")
+        self.window.geometry("850x550")
+        self.setup_ui()
+        self.bank.sync_files()
+        self.search()
+
+    def setup_ui(self):
+        search_frame = ttk.Frame(self.window)
+        search_frame.pack(fill='x', padx=10, pady=(10, 5))
+        ttk.Label(search_frame, text="Words:").pack(side=tk.LEFT)
+        self.text_var = tk.StringVar()
+        text_entry = ttk.Entry(search_frame, textvariable=self.text_var, width=30)
+        text_entry.pack(side=tk.LEFT, padx=5)
+        text_entry.bind('<Return>', lambda e: self.search())
+        ttk.Label(search_frame, text="Tag:").pack(side=tk.LEFT)
+        self.tag_var = tk.StringVar()
+        tag_entry = ttk.Entry(search_frame, textvariable=self.tag_var, width=15)
+        tag_entry.pack(side=tk.LEFT, padx=5)
+        tag_entry.bind('<Return>', lambda e: self.search())
+        ttk.Label(search_frame, text="Type:").pack(side=tk.LEFT)
+        self.type_var = tk.StringVar(value='any')
+        ttk.Combobox(search_frame, textvariable=self.type_var, values=['any'] + QUESTION_TYPES,
+                     state='readonly', width=24).pack(side=tk.LEFT, padx=5)
+        ttk.Button(search_frame, text="Search", command=self.search).pack(side=tk.LEFT)
+
+        self.count_var = tk.StringVar()
+        ttk.Label(self.window, textvariable=self.count_var).pack(fill='x', padx=10)
+
+        columns = ('type', 'text', 'tags', 'quizzes')
+        self.tree = ttk.Treeview(self.window, columns=columns, show='headings', selectmode='extended')
+        for column, heading, width in zip(columns, ('Type', 'Question', 'Tags', 'Used in'), (150, 400, 120, 150)):
+            self.tree.heading(column, text=heading)
+            self.tree.column(column, width=width)
+        self.tree.pack(fill='both', expand=True, padx=10, pady=5)
+        self.tree.bind('<Double-1>', lambda e: self.add_selected())
+
+        btn_frame = ttk.Frame(self.window)
+        btn_frame.pack(pady=(0, 10))
+        ttk.Button(btn_frame, text="Add to Quiz", command=self.add_selected).pack(side=tk.LEFT, padx=5)
+        ttk.Button(btn_frame, text="Close", command=self.window.destroy).pack(side=tk.LEFT, padx=5)
+
+    def criteria(self) -> Dict:
+        """Search criteria from the form"""
+        q_type = self.type_var.get()
+        tag = self.tag_var.get().strip()
+        return {
+            'text': self.text_var.get(),
+            'tags': [tag] if tag else [],
+            'types': [] if q_type == 'any' else [q_type]
+        }
+
+    def search(self):
+        """List the first page of matching questions"""
+        criteria = self.criteria()
+        total = self.bank.count(**criteria)
+        self._results = self.bank.search(limit=PAGE_SIZE, **criteria)
+        shown = f" (showing the first {PAGE_SIZE})" if total > PAGE_SIZE else ''
+        self.count_var.set(f"{total} matching questions{shown}")
+        self.tree.delete(*self.tree.get_children())
+        for i, result in enumerate(self._results):
+            question = result['question']
+            self.tree.insert('', tk.END, iid=str(i), values=(
+                question.get('type', ''), question.get('text', '').replace('\n', ' '),
+                ', '.join(question_tags(question)), ', '.join(result['quizzes'])))
+
+    def add_selected(self):
+        """Copy the selected questions into the quiz (as new questions with their own ids)"""
+        selection = self.tree.selection()
+        if not selection:
+            messagebox.showwarning("Warning", "Select questions to add", parent=self.window)
+            return
+        for iid in selection:
+            question = copy.deepcopy(self._results[int(iid)]['question'])
+            question['id'] = new_question_id()
+            self.on_add(question)
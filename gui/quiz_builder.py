@@ -3,11 +3,13 @@ Quiz Builder GUI - Main Tkinter interface for creating and editing quizzes
 """
 import tkinter as tk
 from tkinter import ttk, messagebox, simpledialog
-import json
 import os
-from datetime import datetime
 from typing import Dict, List, Optional
+from gui.question_bank_browser import QuestionBankBrowser
+from gui.quiz_history import QuizHistoryWindow
 from gui.quiz_manager import QuizManager
+from gui.results_viewer import ResultsViewer
+from server.utils import new_question_id
 
 
 class QuestionEditor:
@@ -44,13 +46,18 @@ class QuestionEditor:
         self.weight_var = tk.StringVar(value=str(self.question_data.get('weight', 1)))
         ttk.Entry(self.dialog, textvariable=self.weight_var, width=10).grid(row=2, column=1, sticky='w', padx=5, pady=5)
         
+        # Tags (for finding the question in the question bank)
+        ttk.Label(self.dialog, text="Tags (comma separated):").grid(row=3, column=0, sticky='w', padx=5, pady=5)
+        self.tags_var = tk.StringVar(value=', '.join(self.question_data.get('tags', [])))
+        ttk.Entry(self.dialog, textvariable=self.tags_var, width=50).grid(row=3, column=1, sticky='ew', padx=5, pady=5)
+        
         # Options frame
         self.options_frame = ttk.Frame(self.dialog)
-        self.options_frame.grid(row=3, column=0, columnspan=2, sticky='ew', padx=5, pady=5)
+        self.options_frame.grid(row=4, column=0, columnspan=2, sticky='ew', padx=5, pady=5)
         
         # Answers frame
         self.answers_frame = ttk.Frame(self.dialog)
-        self.answers_frame.grid(row=4, column=0, columnspan=2, sticky='ew', padx=5, pady=5)
+        self.answers_frame.grid(row=5, column=0, columnspan=2, sticky='ew', padx=5, pady=5)
         
         self.option_entries = []
         self.correct_vars = []
@@ -60,7 +67,7 @@ class QuestionEditor:
         
         # Buttons
         btn_frame = ttk.Frame(self.dialog)
-        btn_frame.grid(row=5, column=0, columnspan=2, pady=10)
+        btn_frame.grid(row=6, column=0, columnspan=2, pady=10)
         ttk.Button(btn_frame, text="Save", command=self.save).pack(side=tk.LEFT, padx=5)
         ttk.Button(btn_frame, text="Cancel", command=self.cancel).pack(side=tk.LEFT, padx=5)
         
@@ -126,11 +133,16 @@ class QuestionEditor:
             return
         
         result = {
+            # Results are keyed by the id, so an edited question keeps it
+            'id': self.question_data.get('id') or new_question_id(),
             'type': q_type,
             'text': question_text,
             'weight': weight,
             'correct_answer': None
         }
+        tags = [tag.strip() for tag in self.tags_var.get().split(',') if tag.strip()]
+        if tags:
+            result['tags'] = tags
         
         if q_type in ['multiple_choice_single', 'multiple_choice_multiple']:
             options_text = self.option_entries[0].get('1.0', 'end-1c').strip()
@@ -172,6 +184,7 @@ class QuizBuilderGUI:
         self.manager = QuizManager()
         self.current_quiz = None
         self.launched = False
+        self.launched_prefix = None  # URL prefix of the last launched quiz (Extend Time / End Quiz act on it)
         
         self.setup_ui()
         self.load_quiz_list()
@@ -209,7 +222,8 @@ class QuizBuilderGUI:
         ttk.Button(top_frame, text="New", command=self.new_quiz).grid(row=0, column=2, padx=5)
         ttk.Button(top_frame, text="Delete", command=self.delete_quiz).grid(row=0, column=3, padx=5)
         ttk.Button(top_frame, text="Preview", command=self.preview_quiz).grid(row=0, column=4, padx=5)
-        ttk.Button(top_frame, text="Results", command=self.view_results, style='Accent.TButton').grid(row=0, column=5, padx=5)
+        ttk.Button(top_frame, text="History", command=self.view_history).grid(row=0, column=5, padx=5)
+        ttk.Button(top_frame, text="Results", command=self.view_results, style='Accent.TButton').grid(row=0, column=6, padx=5)
         
         # Quiz properties frame
         props_frame = ttk.LabelFrame(main_frame, text="Quiz Properties", padding="10")
@@ -233,7 +247,10 @@ class QuizBuilderGUI:
         ttk.Entry(props_frame, textvariable=self.timer_var, width=10).grid(row=3, column=1, sticky='w', padx=5, pady=2)
         
         self.shuffle_var = tk.BooleanVar(value=False)
-        ttk.Checkbutton(props_frame, text="Shuffle Questions", variable=self.shuffle_var).grid(row=4, column=0, columnspan=2, sticky='w', padx=5, pady=2)
+        ttk.Checkbutton(props_frame, text="Shuffle Questions", variable=self.shuffle_var).grid(row=4, column=0, sticky='w', padx=5, pady=2)
+        
+        self.shuffle_options_var = tk.BooleanVar(value=False)
+        ttk.Checkbutton(props_frame, text="Shuffle Options", variable=self.shuffle_options_var).grid(row=4, column=1, sticky='w', padx=5, pady=2)
         
         ttk.Label(props_frame, text="Start Message:").grid(row=5, column=0, sticky='nw', padx=5, pady=2)
         self.start_msg = tk.Text(props_frame, height=3, width=40)
@@ -264,6 +281,7 @@ class QuizBuilderGUI:
         q_btn_frame = ttk.Frame(q_frame)
         q_btn_frame.pack(fill='x', pady=5)
         ttk.Button(q_btn_frame, text="Add Question", command=self.add_question).pack(side=tk.LEFT, padx=2)
+        ttk.Button(q_btn_frame, text="From Bank...", command=self.add_from_bank).pack(side=tk.LEFT, padx=2)
         ttk.Button(q_btn_frame, text="Edit Question", command=self.edit_question).pack(side=tk.LEFT, padx=2)
         ttk.Button(q_btn_frame, text="Delete Question", command=self.remove_question).pack(side=tk.LEFT, padx=2)
         ttk.Button(q_btn_frame, text="Move Up", command=self.move_question_up).pack(side=tk.LEFT, padx=2)
@@ -280,6 +298,13 @@ class QuizBuilderGUI:
                                      style='Accent.TButton')
         self.launch_btn.pack(side=tk.LEFT, padx=5)
         
+        # Controls for the running quiz, pushed to open student pages
+        self.extend_btn = ttk.Button(action_frame, text="Extend Time", command=self.extend_quiz_time,
+                                     state='disabled')
+        self.extend_btn.pack(side=tk.LEFT, padx=5)
+        self.end_btn = ttk.Button(action_frame, text="End Quiz", command=self.end_quiz, state='disabled')
+        self.end_btn.pack(side=tk.LEFT, padx=5)
+        
         self.status_label = ttk.Label(action_frame, text="Ready", foreground='green')
         self.status_label.pack(side=tk.LEFT, padx=10)
     
@@ -332,6 +357,7 @@ class QuizBuilderGUI:
         self.require_name_var.set(quiz_data.get('require_full_name', True))
         self.timer_var.set(str(quiz_data.get('timer_minutes', 30)))
         self.shuffle_var.set(quiz_data.get('shuffle_questions', False))
+        self.shuffle_options_var.set(quiz_data.get('shuffle_options', False))
         self.start_msg.delete('1.0', 'end')
         self.start_msg.insert('1.0', quiz_data.get('start_message', ''))
         self.end_msg.delete('1.0', 'end')
@@ -397,6 +423,19 @@ class QuizBuilderGUI:
             self.refresh_questions_list()
             self.update_status("Question added")
     
+    def add_from_bank(self):
+        """Add copies of questions found in the question bank"""
+        if not self.current_quiz:
+            messagebox.showwarning("Warning", "Please create or load a quiz first")
+            return
+        
+        def add(question: Dict):
+            self.current_quiz.setdefault('questions', []).append(question)
+            self.refresh_questions_list()
+            self.update_status("Question added from bank")
+        
+        QuestionBankBrowser(self.root, add)
+    
     def edit_question(self):
         """Edit selected question"""
         if not self.current_quiz:
@@ -475,13 +514,19 @@ class QuizBuilderGUI:
             messagebox.showerror("Error", "Timer must be a number")
             return
         self.current_quiz['shuffle_questions'] = self.shuffle_var.get()
+        self.current_quiz['shuffle_options'] = self.shuffle_options_var.get()
         self.current_quiz['start_message'] = self.start_msg.get('1.0', 'end-1c')
         self.current_quiz['end_message'] = self.end_msg.get('1.0', 'end-1c')
         
         if self.manager.save_quiz(self.current_quiz):
             self.load_quiz_list()
             self.quiz_combo.set(self.current_quiz['name'])
-            self.update_status("Quiz saved successfully")
+            if self.manager.history_error:
+                self.update_status("Quiz saved, but not added to its history")
+                messagebox.showwarning("Warning", "The quiz was saved, but this revision could not be added "
+                                       f"to its history:\n{self.manager.history_error}")
+            else:
+                self.update_status("Quiz saved successfully")
         else:
             messagebox.showerror("Error", "Failed to save quiz")
     
@@ -515,6 +560,22 @@ class QuizBuilderGUI:
         text_widget.insert('1.0', preview_text)
         text_widget.config(state='disabled')
     
+    def view_history(self):
+        """List the saved revisions of the selected quiz and restore one into the editor"""
+        quiz_name = self.quiz_combo.get()
+        if not quiz_name:
+            messagebox.showwarning("Warning", "Please select a quiz to see its history")
+            return
+        if self.launched:
+            messagebox.showwarning("Warning", "Cannot edit quiz while it's launched!")
+            return
+        QuizHistoryWindow(self.root, self.manager, quiz_name, self.restore_revision)
+    
+    def restore_revision(self, quiz_data: Dict):
+        """Put an earlier revision in the editor - it becomes the quiz again once saved"""
+        self.load_quiz_data(quiz_data)
+        self.update_status("Earlier revision restored - save to keep it", 'orange')
+    
     def view_results(self):
         """View quiz results for selected quiz"""
         quiz_name = self.quiz_combo.get()
@@ -527,124 +588,8 @@ class QuizBuilderGUI:
             messagebox.showinfo("No Results", f"No results found for quiz: {quiz_name}")
             return
         
-        # Get all JSON result files
-        result_files = [f for f in os.listdir(results_dir) if f.endswith('.json')]
-        if not result_files:
-            messagebox.showinfo("No Results", f"No submissions found for quiz: {quiz_name}")
-            return
-        
-        # Create results window
-        results_window = tk.Toplevel(self.root)
-        results_window.title(f"Results: {quiz_name}")
-        results_window.geometry("900x700")
-        
-        # Add scrollbar and text widget
-        frame = ttk.Frame(results_window)
-        frame.pack(fill='both', expand=True, padx=10, pady=10)
-        
-        scrollbar = ttk.Scrollbar(frame)
-        scrollbar.pack(side='right', fill='y')
-        
-        text_widget = tk.Text(frame, wrap='word', padx=10, pady=10, yscrollcommand=scrollbar.set, font=('Courier', 10))
-        text_widget.pack(side='left', fill='both', expand=True)
-        scrollbar.config(command=text_widget.yview)
-        
-        # Build results text
-        results_text = f"QUIZ RESULTS SUMMARY\n"
-        results_text += f"{'='*80}\n"
-        results_text += f"Quiz: {quiz_name}\n"
-        results_text += f"Total Submissions: {len(result_files)}\n"
-        results_text += f"Generated: {datetime.now().strftime('%Y-%m-%d %H:%M:%S')}\n"
-        results_text += f"{'='*80}\n\n"
-        
-        # Load and display each result
-        for i, filename in enumerate(sorted(result_files), 1):
-            filepath = os.path.join(results_dir, filename)
-            try:
-                with open(filepath, 'r', encoding='utf-8') as f:
-                    result_data = json.load(f)
-                
-                results_text += f"\n{'─'*80}\n"
-                results_text += f"SUBMISSION #{i}\n"
-                results_text += f"{'─'*80}\n"
-                results_text += f"Student Name: {result_data.get('student_name', 'N/A')}\n"
-                results_text += f"Submitted: {result_data.get('timestamp', 'N/A')}\n"
-                results_text += f"Session ID: {result_data.get('session_id', 'N/A')}\n\n"
-                
-                score = result_data.get('score', {})
-                results_text += f"TOTAL POINTS POSSIBLE: {score.get('total_points', 0)}\n"
-                results_text += f"(Teacher: Review answers below and calculate final score)\n\n"
-                
-                results_text += f"STUDENT RESPONSES:\n"
-                results_text += f"{'─'*80}\n"
-                
-                # Get questions from result data
-                questions = result_data.get('questions', [])
-                answers = result_data.get('answers', {})
-                
-                for i, question in enumerate(questions):
-                    q_num = i + 1
-                    q_text = question.get('text', 'N/A')
-                    q_type = question.get('type', 'unknown').replace('_', ' ').title()
-                    q_weight = question.get('weight', 1)
-                    correct_answer = question.get('correct_answer', 'N/A')
-                    
-                    # Get student's answer
-                    student_answer = answers.get(str(i), '[No Answer]')
-                    if isinstance(student_answer, list):
-                        student_answer = ', '.join(str(a) for a in student_answer)
-                    if isinstance(correct_answer, list):
-                        correct_answer = ', '.join(str(a) for a in correct_answer)
-                    
-                    results_text += f"\nQuestion {q_num} [{q_type}] - {q_weight} point(s)\n"
-                    results_text += f"  Question: {q_text}\n"
-                    
-                    # Show options for multiple choice
-                    if 'options' in question:
-                        results_text += f"  Options: {', '.join(question['options'])}\n"
-                    
-                    results_text += f"  STUDENT ANSWERED: {student_answer}\n"
-                    results_text += f"  CORRECT ANSWER:  {correct_answer}\n"
-                
-                results_text += f"\n"
-                
-            except Exception as e:
-                results_text += f"\n[Error loading {filename}: {e}]\n\n"
-        
-        results_text += f"\n{'='*80}\n"
-        results_text += f"END OF RESULTS\n"
-        results_text += f"{'='*80}\n"
-        
-        text_widget.insert('1.0', results_text)
-        text_widget.config(state='disabled')
-        
-        # Auto-save results to text file in the results directory
-        results_txt_path = os.path.join(results_dir, f"{quiz_name}_ALL_RESULTS.txt")
-        try:
-            with open(results_txt_path, 'w', encoding='utf-8') as f:
-                f.write(results_text)
-        except Exception as e:
-            logger.warning(f"Could not auto-save results file: {e}")
-        
-        # Add buttons
-        btn_frame = ttk.Frame(results_window)
-        btn_frame.pack(pady=5)
-        
-        ttk.Label(btn_frame, text=f"Results auto-saved to: {results_txt_path}", 
-                 foreground='green').pack(side=tk.LEFT, padx=10)
-        
-        ttk.Button(btn_frame, text="Open Results Folder", 
-                  command=lambda: os.startfile(results_dir)).pack(side=tk.LEFT, padx=5)
-    
-    def export_results(self, results_text: str, quiz_name: str):
-        """Export results to a text file"""
-        filename = f"{quiz_name}_results_{datetime.now().strftime('%Y%m%d_%H%M%S')}.txt"
-        try:
-            with open(filename, 'w', encoding='utf-8') as f:
-                f.write(results_text)
-            messagebox.showinfo("Export Successful", f"Results exported to:\n{filename}")
-        except Exception as e:
-            messagebox.showerror("Export Error", f"Failed to export results:\n{e}")
+        # Statistics and the submission list stream in from the results store
+        ResultsViewer(self.root, quiz_name)
     
     def launch_quiz(self):
         """Launch the quiz server"""
@@ -667,11 +612,12 @@ class QuizBuilderGUI:
             messagebox.showerror("Error", "Quiz must have at least one question")
             return
         
-        # Warn if another quiz is running
+        # Several quizzes can run at once, each at its own address
         if self.launched:
             if not messagebox.askyesno("Quiz Running", 
                                       "Another quiz is already running.\n\n"
-                                      "Launching a new quiz will replace it.\n\n"
+                                      "The new quiz will be served alongside it at its own address; "
+                                      "Extend Time and End Quiz will then act on the new quiz.\n\n"
                                       "Continue?"):
                 return
         
@@ -684,13 +630,16 @@ class QuizBuilderGUI:
             import webbrowser
             from run_server import launch_quiz_server
             
+            from server.quizzes import prefix_for
+            
             quiz_file = f"{self.current_quiz['name']}.json"
+            prefix = prefix_for(self.current_quiz['name'])
             
             def launch_in_thread():
                 try:
                     url, _ = launch_quiz_server(quiz_file, self.root)
                     # Update UI in main thread - capture url in default parameter
-                    self.root.after(0, lambda url=url: self.on_launch_success(url))
+                    self.root.after(0, lambda url=url: self.on_launch_success(url, prefix))
                 except Exception as e:
                     # Capture error message in default parameter to avoid closure issue
                     error_msg = str(e)
@@ -707,11 +656,14 @@ class QuizBuilderGUI:
             import traceback
             traceback.print_exc()
     
-    def on_launch_success(self, url: str):
+    def on_launch_success(self, url: str, prefix: str):
         """Callback when quiz launches successfully"""
         self.launched = True
+        self.launched_prefix = prefix
         self.save_btn.config(state='disabled')
         self.launch_btn.config(text="Launch Another Quiz", state='normal')
+        self.extend_btn.config(state='normal')
+        self.end_btn.config(state='normal')
         quiz_title = self.current_quiz.get('title', 'Quiz') if self.current_quiz else 'Quiz'
         self.update_status(f"'{quiz_title}' launched - URL: {url}", 'blue')
     
@@ -720,6 +672,31 @@ class QuizBuilderGUI:
         messagebox.showerror("Error", f"Failed to launch quiz server:\n{error_msg}")
         self.update_status("Launch failed", 'red')
     
+    def extend_quiz_time(self):
+        """Give every student of the running quiz extra time"""
+        minutes = simpledialog.askinteger("Extend Time", "Minutes to add for every student:",
+                                          parent=self.root, minvalue=1, maxvalue=600)
+        if not minutes:
+            return
+        try:
+            from server.app import extend_time
+            extend_time(minutes, self.launched_prefix)
+            self.update_status(f"Time extended by {minutes} minutes", 'blue')
+        except Exception as e:
+            messagebox.showerror("Error", f"Failed to extend time:\n{e}")
+    
+    def end_quiz(self):
+        """Make every open student page submit now"""
+        if not messagebox.askyesno("End Quiz", "Submit every student's quiz now?\n\n"
+                                   "Open quiz pages will submit the answers they have."):
+            return
+        try:
+            from server.app import force_submit_all
+            force_submit_all(self.launched_prefix)
+            self.update_status("Quiz ended - students' pages are submitting", 'blue')
+        except Exception as e:
+            messagebox.showerror("Error", f"Failed to end quiz:\n{e}")
+    
     def update_status(self, message: str, color: str = 'green'):
         """Update status label"""
         self.status_label.config(text=message, foreground=color)
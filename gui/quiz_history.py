@@ -0,0 +1,89 @@
+"""
+Quiz history window
+
+Lists the saved revisions of a quiz from the quiz store (see
+server.quiz_store), newest first, with how the questions changed from the
+revision before, and loads a chosen revision back into the editor. Only
+the hash lists of the versions are compared; questions are read when a
+revision is restored.
+"""
+import tkinter as tk
+from tkinter import ttk, messagebox
+from typing import Callable, Dict, List, Optional
+
+
+def describe_changes(changes: Optional[Dict]) -> str:
+    """One line for a diff of two versions (see QuizStore.diff)"""
+    if changes is None:
+        return ''
+    parts = [f"{len(changes[key])} {label}" for key, label in (
+        ('added', 'added'), ('removed', 'removed'), ('changed', 'edited'), ('moved', 'moved')) if changes[key]]
+    return ', '.join(parts) or 'settings only'
+
+
+class QuizHistoryWindow:
+    """Window listing a quiz's saved revisions, with a restore action"""
+
+    def __init__(self, parent, manager, quiz_name: str, on_restore: Callable[[Dict], None]):
+        self.manager = manager
+        self.quiz_name = quiz_name
+        self.on_restore = on_restore
+        self._revisions: List[Dict] = []
+
+        self.window = tk.Toplevel(parent)
+        self.window.title(f"History: {quiz_name}")
+        self.window.geometry("650x400")
+        self.setup_ui()
+        self.load()
+
+    def setup_ui(self):
+        self.count_var = tk.StringVar()
+        ttk.Label(self.window, textvariable=self.count_var).pack(fill='x', padx=10, pady=(10, 0))
+
+        columns = ('saved', 'version', 'changes')
+        self.tree = ttk.Treeview(self.window, columns=columns, show='headings', selectmode='browse')
+        for column, heading, width in zip(columns, ('Saved', 'Questions version', 'Changes to questions'),
+                                          (160, 130, 320)):
+            self.tree.heading(column, text=heading)
+            self.tree.column(column, width=width)
+        self.tree.pack(fill='both', expand=True, padx=10, pady=5)
+        self.tree.bind('<Double-1>', lambda e: self.restore_selected())
+
+        btn_frame = ttk.Frame(self.window)
+        btn_frame.pack(pady=(0, 10))
+        ttk.Button(btn_frame, text="Restore in Editor", command=self.restore_selected).pack(side=tk.LEFT, padx=5)
+        ttk.Button(btn_frame, text="Close", command=self.window.destroy).pack(side=tk.LEFT, padx=5)
+
+    def load(self):
+        """List the revisions, newest first"""
+        try:
+            self._revisions = self.manager.quiz_history(self.quiz_name)
+        except Exception as e:
+            messagebox.showerror("Error", f"Could not read the quiz history:\n{e}", parent=self.window)
+            self._revisions = []
+        self.count_var.set(f"{len(self._revisions)} saved revisions")
+        self.tree.delete(*self.tree.get_children())
+        for i in reversed(range(len(self._revisions))):
+            revision = self._revisions[i]
+            if i == 0:
+                changes = 'first saved'
+            else:
+                changes = describe_changes(self.manager.compare_versions(
+                    self._revisions[i - 1]['version'], revision['version']))
+            self.tree.insert('', tk.END, iid=str(i), values=(
+                revision['saved'][:19].replace('T', ' '), revision['version'][:12], changes))
+
+    def restore_selected(self):
+        """Load the selected revision into the editor (it is saved as a new revision)"""
+        selection = self.tree.selection()
+        if not selection:
+            messagebox.showwarning("Warning", "Select a revision to restore", parent=self.window)
+            return
+        revision = self._revisions[int(selection[0])]
+        quiz_data = self.manager.load_revision(revision['revision'])
+        if quiz_data is None:
+            messagebox.showerror("Error", "This revision is no longer in the quiz store", parent=self.window)
+            return
+        quiz_data['name'] = self.quiz_name
+        self.on_restore(quiz_data)
+        self.window.destroy()
@@ -6,6 +6,9 @@ import os
 from typing import Dict, List, Optional
 from datetime import datetime
 
+from server.quiz_store import get_quiz_store
+from server.utils import assign_question_ids
+
 
 class QuizManager:
     """Manages quiz storage and retrieval"""
@@ -16,6 +19,8 @@ class QuizManager:
         """Initialize quiz manager with data directory"""
         if not os.path.exists(self.DATA_DIR):
             os.makedirs(self.DATA_DIR)
+        # Why the last saved quiz is missing from its history (None when it was recorded)
+        self.history_error: Optional[str] = None
     
     def list_quizzes(self) -> List[str]:
         """Get list of all quiz filenames"""
@@ -37,18 +42,48 @@ class QuizManager:
             return None
     
     def save_quiz(self, quiz_data: Dict) -> bool:
-        """Save a quiz to disk"""
+        """
+        Save a quiz to disk and add the revision to its history in the quiz store
+        
+        Returns whether the file was saved. If only the history could not be
+        updated, history_error says why; the quiz is added to it when it is
+        next saved or loaded by the server.
+        """
         quiz_name = quiz_data.get('name', 'unnamed_quiz')
         filepath = os.path.join(self.DATA_DIR, f"{quiz_name}.json")
+        self.history_error = None
         try:
             # Add metadata
             quiz_data['last_modified'] = datetime.now().isoformat()
-            with open(filepath, 'w', encoding='utf-8') as f:
+            assign_question_ids(quiz_data)
+            # Write a temp file and rename it over the quiz, so a running server
+            # reloading the file never reads half of it
+            temp_path = f"{filepath}.tmp"
+            with open(temp_path, 'w', encoding='utf-8') as f:
                 json.dump(quiz_data, f, indent=2, ensure_ascii=False)
-            return True
+            os.replace(temp_path, filepath)
         except Exception as e:
             print(f"Error saving quiz: {e}")
             return False
+        try:
+            get_quiz_store(self.DATA_DIR).commit(quiz_data)
+        except Exception as e:
+            # The file is saved; the store (e.g. locked by a running server) only misses this revision
+            self.history_error = str(e)
+            print(f"Quiz saved, but its history was not updated: {e}")
+        return True
+    
+    def quiz_history(self, quiz_name: str) -> List[Dict]:
+        """Saved revisions of a quiz, oldest first (see server.quiz_store)"""
+        return get_quiz_store(self.DATA_DIR).history(quiz_name)
+    
+    def load_revision(self, revision: str) -> Optional[Dict]:
+        """Load an earlier revision of a quiz from the quiz store"""
+        return get_quiz_store(self.DATA_DIR).load(revision)
+    
+    def compare_versions(self, old_version: str, new_version: str) -> Optional[Dict]:
+        """How the questions changed between two versions (see QuizStore.diff)"""
+        return get_quiz_store(self.DATA_DIR).diff(old_version, new_version)
     
     def delete_quiz(self, quiz_name: str) -> bool:
         """Delete a quiz file"""
@@ -72,6 +107,7 @@ class QuizManager:
             'start_message': 'Welcome! Please read all questions carefully. Good luck!',
             'end_message': 'Thank you for completing the quiz!',
             'shuffle_questions': False,
+            'shuffle_options': False,
             'questions': []
         }
 
@@ -0,0 +1,403 @@
+"""
+Results viewer window
+
+Submissions are streamed from the quiz's results store on a background
+thread into a ResultsAggregator. The window shows the running statistics
+as they build up and lists one page of submissions at a time, fetched
+from the store's indexed catalog (sorting and name search included), so
+opening a quiz with thousands of submissions never blocks the GUI. The
+full text report is only written when asked for, straight to disk.
+
+Background threads never touch Tk: they queue callbacks, which the window
+drains on the Tk thread every UI_POLL_MS.
+"""
+import os
+import queue
+import threading
+import tkinter as tk
+from tkinter import ttk, messagebox
+from datetime import datetime
+from typing import Dict, List, Optional, TextIO
+
+from server.grading import question_key
+from server.results_store import get_results_store, AUTO_FINALIZED
+from server.results_stats import ResultsAggregator, SCORE_BINS
+from server.item_analysis import analyze_quiz
+from server.utils import result_question_key
+
+PAGE_SIZE = 100    # Submissions listed per page
+BATCH_SIZE = 500   # Submissions folded in between screen updates
+UI_POLL_MS = 50    # How often the window runs callbacks queued by background threads
+
+
+def format_submission(result_data: Dict, number: int) -> str:
+    """One submission in the text report format (header plus every question and answer)"""
+    lines = [
+        f"\n{'─'*80}",
+        f"SUBMISSION #{number}",
+        f"{'─'*80}",
+        f"Student Name: {result_data.get('student_name', 'N/A')}",
+        f"Submitted: {result_data.get('timestamp', 'N/A')}",
+    ]
+    if result_data.get('status') == AUTO_FINALIZED:
+        lines.append("Status: Auto-submitted at the deadline (student did not submit)")
+    lines.append(f"Session ID: {result_data.get('session_id', 'N/A')}\n")
+
+    score = result_data.get('score', {})
+    lines.append(f"TOTAL POINTS POSSIBLE: {score.get('total_points', 0)}")
+    lines.append("(Teacher: Review answers below and calculate final score)\n")
+    lines.append("STUDENT RESPONSES:")
+    lines.append(f"{'─'*80}")
+
+    answers = result_data.get('answers', {})
+    questions = [(question_key(question, i), question)
+                 for i, question in enumerate(result_data.get('questions', []))]
+    # A quiz drawing from the question bank stores every question of its pools;
+    # the submission was graded on the ones its session drew
+    asked = {result_question_key(q_result) for q_result in score.get('question_results', [])}
+    if asked:
+        questions = [(key, question) for key, question in questions if key in asked]
+    for i, (key, question) in enumerate(questions):
+        q_type = question.get('type', 'unknown').replace('_', ' ').title()
+        correct_answer = question.get('correct_answer', 'N/A')
+        student_answer = answers.get(key, '[No Answer]')
+        if isinstance(student_answer, list):
+            student_answer = ', '.join(str(a) for a in student_answer)
+        if isinstance(correct_answer, list):
+            correct_answer = ', '.join(str(a) for a in correct_answer)
+
+        lines.append(f"\nQuestion {i + 1} [{q_type}] - {question.get('weight', 1)} point(s)")
+        lines.append(f"  Question: {question.get('text', 'N/A')}")
+        # Show options for multiple choice
+        if 'options' in question:
+            lines.append(f"  Options: {', '.join(question['options'])}")
+        lines.append(f"  STUDENT ANSWERED: {student_answer}")
+        lines.append(f"  CORRECT ANSWER:  {correct_answer}")
+    return '\n'.join(lines) + '\n\n'
+
+
+def write_report(quiz_name: str, f: TextIO) -> int:
+    """Stream the full text report of a quiz to f; returns the number of submissions"""
+    store = get_results_store(quiz_name)
+    f.write(f"QUIZ RESULTS SUMMARY\n{'='*80}\n")
+    f.write(f"Quiz: {quiz_name}\n")
+    f.write(f"Total Submissions: {store.count()}\n")
+    f.write(f"Generated: {datetime.now().strftime('%Y-%m-%d %H:%M:%S')}\n{'='*80}\n\n")
+
+    versions = {}
+    number = 0
+    for submission in store.iter_submissions():
+        number += 1
+        # Correct answers come from the key the submission's score does (it may have been regraded)
+        version = store.graded_version(submission['id'], submission['quiz_version'])
+        if version not in versions:
+            versions[version] = (store.get_version(version) or {}).get('questions', [])
+        submission['questions'] = versions[version]
+        f.write(format_submission(submission, number))
+
+    f.write(f"\n{'='*80}\nEND OF RESULTS\n{'='*80}\n")
+    return number
+
+
+def _format_percent(value: Optional[float]) -> str:
+    return '-' if value is None else f"{value:.1f}%"
+
+
+class ResultsViewer:
+    """Window with running statistics and a paginated submission list for one quiz"""
+
+    def __init__(self, parent, quiz_name: str):
+        self.quiz_name = quiz_name
+        self.results_dir = os.path.join('results', quiz_name)
+        self.aggregator = ResultsAggregator()
+        self._scores_revision: Optional[int] = None  # Store's scores_revision the aggregator was built at
+        self.page = 0
+        self.order_by = 'id'
+        self.descending = False
+        self._questions: List[Dict] = []  # Per-question figures of the last update
+        self._analysis: Optional[Dict] = None  # Item analysis, once the load has finished
+        self._lock = threading.Lock()
+        self._loader: Optional[threading.Thread] = None
+        self._ui_calls: queue.Queue = queue.Queue()  # (callback, args) from background threads
+        self._closed = False
+
+        self.window = tk.Toplevel(parent)
+        self.window.title(f"Results: {quiz_name}")
+        self.window.geometry("900x700")
+        self.window.protocol("WM_DELETE_WINDOW", self.close)
+        self.setup_ui()
+        self._run_ui_calls()
+        self.refresh(full_sync=False)
+
+    def setup_ui(self):
+        self.summary_var = tk.StringVar(value="Loading results...")
+        ttk.Label(self.window, textvariable=self.summary_var, font=('Arial', 10),
+                  justify=tk.LEFT).pack(fill='x', padx=10, pady=(10, 5))
+
+        search_frame = ttk.Frame(self.window)
+        search_frame.pack(fill='x', padx=10)
+        ttk.Label(search_frame, text="Student name starts with:").pack(side=tk.LEFT)
+        self.search_var = tk.StringVar()
+        search_entry = ttk.Entry(search_frame, textvariable=self.search_var, width=30)
+        search_entry.pack(side=tk.LEFT, padx=5)
+        search_entry.bind('<Return>', lambda e: self.show_page(0))
+        ttk.Button(search_frame, text="Search", command=lambda: self.show_page(0)).pack(side=tk.LEFT)
+        ttk.Button(search_frame, text="Clear",
+                   command=lambda: (self.search_var.set(''), self.show_page(0))).pack(side=tk.LEFT, padx=5)
+
+        self.notebook = ttk.Notebook(self.window)
+        self.notebook.pack(fill='both', expand=True, padx=10, pady=5)
+        self.notebook.bind('<<NotebookTabChanged>>', lambda e: self.update_questions())
+
+        # Submissions: only the current page is ever inserted into the tree
+        list_frame = ttk.Frame(self.notebook)
+        self.notebook.add(list_frame, text="Submissions")
+        columns = ('num', 'student', 'submitted', 'points', 'percentage', 'status')
+        self.tree = ttk.Treeview(list_frame, columns=columns, show='headings', height=20)
+        # Clicking Student, Submitted or Score sorts by that column (again to reverse)
+        sort_keys = {'num': 'id', 'student': 'student_name', 'submitted': 'timestamp', 'percentage': 'percentage'}
+        for column, heading, width in (('num', '#', 50), ('student', 'Student', 220),
+                                       ('submitted', 'Submitted', 170), ('points', 'Points', 90),
+                                       ('percentage', 'Score', 80), ('status', 'Status', 120)):
+            if column in sort_keys:
+                self.tree.heading(column, text=heading,
+                                  command=lambda key=sort_keys[column]: self.sort_by(key))
+            else:
+                self.tree.heading(column, text=heading)
+            self.tree.column(column, width=width, anchor='w')
+        scrollbar = ttk.Scrollbar(list_frame, command=self.tree.yview)
+        self.tree.config(yscrollcommand=scrollbar.set)
+        self.tree.bind('<Double-1>', self.open_submission)
+
+        pager = ttk.Frame(list_frame)
+        pager.pack(side='bottom', fill='x', pady=5)
+        self.prev_btn = ttk.Button(pager, text="< Previous", command=lambda: self.show_page(self.page - 1))
+        self.prev_btn.pack(side=tk.LEFT, padx=5)
+        self.page_var = tk.StringVar()
+        ttk.Label(pager, textvariable=self.page_var).pack(side=tk.LEFT, padx=10)
+        self.next_btn = ttk.Button(pager, text="Next >", command=lambda: self.show_page(self.page + 1))
+        self.next_btn.pack(side=tk.LEFT, padx=5)
+        ttk.Label(pager, text="Double-click a submission to see the answers",
+                  foreground='gray').pack(side=tk.RIGHT, padx=5)
+
+        scrollbar.pack(side='right', fill='y')
+        self.tree.pack(side='left', fill='both', expand=True)
+
+        # Per-question correct rates and item analysis
+        questions_frame = ttk.Frame(self.notebook)
+        self.notebook.add(questions_frame, text="Questions")
+        columns = ('question', 'answered', 'correct', 'rate', 'discrimination', 'choices')
+        self.questions_tree = ttk.Treeview(questions_frame, columns=columns, show='headings')
+        for column, heading, width in (('question', 'Question', 90), ('answered', 'Answered', 80),
+                                       ('correct', 'Correct', 70), ('rate', 'Difficulty (p)', 100),
+                                       ('discrimination', 'Discrimination', 100),
+                                       ('choices', 'Most chosen (* = correct)', 380)):
+            self.questions_tree.heading(column, text=heading)
+            self.questions_tree.column(column, width=width, anchor='w')
+        q_scrollbar = ttk.Scrollbar(questions_frame, command=self.questions_tree.yview)
+        self.questions_tree.config(yscrollcommand=q_scrollbar.set)
+        q_scrollbar.pack(side='right', fill='y')
+        self.questions_tree.pack(side='left', fill='both', expand=True)
+
+        # Score distribution
+        distribution_frame = ttk.Frame(self.notebook)
+        self.notebook.add(distribution_frame, text="Score Distribution")
+        self.distribution_text = tk.Text(distribution_frame, font=('Courier', 10), height=SCORE_BINS + 2,
+                                         padx=10, pady=10)
+        self.distribution_text.pack(fill='both', expand=True)
+        self.distribution_text.config(state='disabled')
+
+        btn_frame = ttk.Frame(self.window)
+        btn_frame.pack(pady=5)
+        self.status_var = tk.StringVar()
+        ttk.Label(btn_frame, textvariable=self.status_var, foreground='green').pack(side=tk.LEFT, padx=10)
+        ttk.Button(btn_frame, text="Refresh", command=self.refresh).pack(side=tk.LEFT, padx=5)
+        ttk.Button(btn_frame, text="Save Text Report", command=self.save_report).pack(side=tk.LEFT, padx=5)
+        ttk.Button(btn_frame, text="Open Results Folder",
+                   command=lambda: os.startfile(self.results_dir)).pack(side=tk.LEFT, padx=5)
+
+    def close(self):
+        self._closed = True
+        self.window.destroy()
+
+    def _call_in_ui(self, callback, *args):
+        """Queue callback to run on the Tk thread (safe to call from any thread)"""
+        if not self._closed:
+            self._ui_calls.put((callback, args))
+
+    def _run_ui_calls(self):
+        """Tk thread: run the queued callbacks, then check again in UI_POLL_MS"""
+        while not self._closed:
+            try:
+                callback, args = self._ui_calls.get_nowait()
+            except queue.Empty:
+                break
+            callback(*args)
+        if not self._closed:
+            self.window.after(UI_POLL_MS, self._run_ui_calls)
+
+    def refresh(self, full_sync: bool = True):
+        """Pick up result files changed on disk and stream submissions added since the last load"""
+        if self._loader is not None and self._loader.is_alive():
+            return
+        self.status_var.set("Loading...")
+        self._loader = threading.Thread(target=self._load, args=(full_sync,), daemon=True)
+        self._loader.start()
+
+    def _load(self, full_sync: bool):
+        """Loader thread: sync the catalog, then fold new submissions into the statistics in batches"""
+        try:
+            store = get_results_store(self.quiz_name)
+            # Opening only stats the folder; Refresh compares every file's mtime
+            store.sync_files(force=full_sync)
+            revision = store.scores_revision()
+            if revision != self._scores_revision:
+                # Scores were edited or regraded in place - they can't be taken back
+                # out of running figures, so start over
+                with self._lock:
+                    self.aggregator = ResultsAggregator()
+                self._scores_revision = revision
+            batch = 0
+            for submission in store.iter_scores(self.aggregator.last_id):
+                if self._closed:
+                    return
+                with self._lock:
+                    self.aggregator.add(submission)
+                batch += 1
+                if batch >= BATCH_SIZE:
+                    batch = 0
+                    self._call_in_ui(self.update_view)
+            self._call_in_ui(self.update_view)
+
+            # Cached sums - only the submissions added since the last report are read
+            self._call_in_ui(self.show_analysis, analyze_quiz(self.quiz_name))
+
+            # Keep the per-student JSON files and the CSV in step with the store
+            store.export()
+            self._call_in_ui(self.status_var.set, f"Results folder: {self.results_dir}")
+        except Exception as e:
+            self._call_in_ui(self.status_var.set, f"Error loading results: {e}")
+
+    def update_view(self):
+        """Redraw the statistics and the current page"""
+        with self._lock:
+            summary = self.aggregator.summary()
+        statuses = summary['statuses']
+        text = (f"Quiz: {self.quiz_name}    Submissions: {summary['count']}"
+                f"    (auto-submitted at the deadline: {statuses.get(AUTO_FINALIZED, 0)})\n"
+                f"Mean: {_format_percent(summary['mean'])}    Median: {_format_percent(summary['median'])}"
+                f"    Std dev: {_format_percent(summary['stdev'])}"
+                f"    Range: {_format_percent(summary['min'])} - {_format_percent(summary['max'])}")
+        if self._analysis is not None and self._analysis['cronbach_alpha'] is not None:
+            text += f"    Cronbach's alpha: {self._analysis['cronbach_alpha']:.2f}"
+        self.summary_var.set(text)
+
+        width = 100 // SCORE_BINS
+        largest = max(summary['bins']) or 1
+        lines = []
+        for i, count in enumerate(summary['bins']):
+            upper = 100 if i == SCORE_BINS - 1 else (i + 1) * width
+            lines.append(f"{i * width:>3}-{upper:<3}% | {'█' * round(40 * count / largest):<40} {count}")
+        self.distribution_text.config(state='normal')
+        self.distribution_text.delete('1.0', tk.END)
+        self.distribution_text.insert('1.0', '\n'.join(lines))
+        self.distribution_text.config(state='disabled')
+
+        self._questions = summary['questions']
+        self.update_questions()
+        self.show_page(self.page)
+
+    def show_analysis(self, analysis: Dict):
+        self._analysis = analysis
+        self.update_view()
+
+    def update_questions(self):
+        """Fill the per-question table (only while its tab is showing)"""
+        if self.notebook.index('current') != 1:
+            return
+        # Matched by question id: the analysis numbers questions in the quiz's current order
+        items = {item['question_id']: item for item in self._analysis['items']} if self._analysis else {}
+        order = {question_id: item['question_num'] for question_id, item in items.items()}
+        questions = sorted(self._questions, key=lambda q: order.get(q['question_id'], len(order) + q['question_num']))
+        self.questions_tree.delete(*self.questions_tree.get_children())
+        for i, question in enumerate(questions, 1):
+            rate = question['correct_rate']
+            item = items.get(question['question_id'])
+            discrimination, choices = '', ''
+            if item is not None:
+                if item['point_biserial'] is not None:
+                    discrimination = f"{item['point_biserial']:.2f}"
+                choices = ', '.join(f"{c['choice']}{'*' if c['correct'] else ''} {c['share']:.0%}"
+                                    for c in item['choices'][:4])
+            self.questions_tree.insert('', tk.END, values=(
+                f"Question {i}", question['answered'],
+                'manual' if rate is None else question['correct'],
+                'needs manual grading' if rate is None else f"{rate:.2f}",
+                discrimination, choices))
+
+    def sort_by(self, order_by: str):
+        """Sort the list by a catalog column (the same column again reverses the order)"""
+        self.descending = not self.descending if order_by == self.order_by else order_by == 'percentage'
+        self.order_by = order_by
+        self.show_page(0)
+
+    def show_page(self, page: int):
+        """Show one page of the submission list, fetched from the catalog"""
+        store = get_results_store(self.quiz_name)
+        name_prefix = self.search_var.get().strip()
+        total = store.count(name_prefix)
+        pages = max(1, -(-total // PAGE_SIZE))
+        self.page = max(0, min(page, pages - 1))
+        start = self.page * PAGE_SIZE
+        rows = store.list_submissions(name_prefix, self.order_by, self.descending, PAGE_SIZE, start)
+
+        self.tree.delete(*self.tree.get_children())
+        for number, row in enumerate(rows, start + 1):
+            status = row['status']
+            self.tree.insert('', tk.END, iid=str(row['id']), values=(
+                number, row['student_name'], row['timestamp'].replace('T', ' ')[:19],
+                f"{row['earned_points']:g} / {row['total_points']:g}", f"{row['percentage']:.1f}%",
+                'auto-submitted' if status == AUTO_FINALIZED else status))
+        matching = f"{total} matching" if name_prefix else f"{total} submissions"
+        self.page_var.set(f"Page {self.page + 1} of {pages}  ({matching})")
+        self.prev_btn.config(state='normal' if self.page > 0 else 'disabled')
+        self.next_btn.config(state='normal' if self.page < pages - 1 else 'disabled')
+
+    def open_submission(self, event=None):
+        """Show the answers of the double-clicked submission"""
+        selection = self.tree.selection()
+        if not selection:
+            return
+        submission = get_results_store(self.quiz_name).get_submission(int(selection[0]))
+        if submission is None:
+            return
+        number = self.tree.item(selection[0], 'values')[0]
+
+        detail = tk.Toplevel(self.window)
+        detail.title(f"{submission['student_name']} - {self.quiz_name}")
+        detail.geometry("800x600")
+        scrollbar = ttk.Scrollbar(detail)
+        scrollbar.pack(side='right', fill='y')
+        text_widget = tk.Text(detail, wrap='word', padx=10, pady=10, yscrollcommand=scrollbar.set,
+                              font=('Courier', 10))
+        text_widget.pack(side='left', fill='both', expand=True)
+        scrollbar.config(command=text_widget.yview)
+        text_widget.insert('1.0', format_submission(submission, number))
+        text_widget.config(state='disabled')
+
+    def save_report(self):
+        """Write every submission to <quiz>_ALL_RESULTS.txt in the background"""
+        path = os.path.join(self.results_dir, f"{self.quiz_name}_ALL_RESULTS.txt")
+        self.status_var.set("Writing report...")
+
+        def write():
+            try:
+                tmp_path = f"{path}.tmp"
+                with open(tmp_path, 'w', encoding='utf-8') as f:
+                    count = write_report(self.quiz_name, f)
+                os.replace(tmp_path, path)
+                self._call_in_ui(self.status_var.set, f"Report with {count} submissions saved to: {path}")
+            except Exception as e:
+                self._call_in_ui(messagebox.showerror, "Error", f"Could not save the report:\n{e}")
+
+        threading.Thread(target=write, daemon=True).start()
@@ -13,35 +13,75 @@ import atexit
 try:
     from flask import Flask
     from pyngrok import ngrok, conf
-    from server.app import create_app
+    from server.app import create_app, load_quiz, parse_quiz_spec, shutdown as shutdown_app
+    from server.quizzes import prefix_for
+    from server.serving import (serve, start_workers, SERVE_MODES, DEFAULT_MODE,
+                                DEFAULT_THREADS, DEFAULT_BACKLOG)
 except ImportError as e:
     print(f"Error importing required modules: {e}")
     print("Please install dependencies: pip install -r requirements.txt")
     sys.exit(1)
 
 
-def launch_quiz_server(quiz_file: str, parent_window=None):
+def launch_quiz_server(quiz_file, parent_window=None, mode: str = None,
+                       threads: int = None, backlog: int = None, workers: int = None):
     """
     Launch Flask server and ngrok tunnel for a quiz
     
+    If the server is already running, the quiz is served alongside the
+    ones it has, under /q/<quiz name>/.
+    
     Args:
-        quiz_file: Name of quiz JSON file (e.g., "my_quiz.json")
+        quiz_file: Name of quiz JSON file (e.g., "my_quiz.json"), or a list of them;
+                   "room1=my_quiz.json" serves a quiz under its own prefix (/q/room1/)
         parent_window: Optional Tkinter window to display URL
+        mode: 'production' (worker pool) or 'development' (Flask dev server);
+              defaults to QUIZ_SERVER_MODE or 'production'
+        threads: Worker threads (production mode); defaults to QUIZ_SERVER_THREADS
+        backlog: Listen backlog (production mode); defaults to QUIZ_SERVER_BACKLOG
+        workers: Worker processes (production mode, needs os.fork); defaults to
+                 QUIZ_SERVER_WORKERS or 1
     """
-    quiz_name = quiz_file.replace('.json', '')
+    global _server_thread, _base_url
+    quiz_specs = [quiz_file] if isinstance(quiz_file, str) else list(quiz_file)
+    if _server_thread is not None and _server_thread.is_alive():
+        return host_another_quiz(quiz_specs, parent_window)
+    
+    mode = mode or os.environ.get('QUIZ_SERVER_MODE', DEFAULT_MODE)
+    threads = threads or int(os.environ.get('QUIZ_SERVER_THREADS', DEFAULT_THREADS))
+    backlog = backlog or int(os.environ.get('QUIZ_SERVER_BACKLOG', DEFAULT_BACKLOG))
+    workers = workers or int(os.environ.get('QUIZ_SERVER_WORKERS', 1))
+    if mode not in SERVE_MODES:
+        raise ValueError(f"Unknown server mode: {mode}")
+    if workers > 1 and (mode != 'production' or not hasattr(os, 'fork')):
+        print("Multiple worker processes need production mode on a platform with fork; "
+              "using a single process")
+        workers = 1
     
-    # Load quiz
+    # Load quizzes (sessions go to a shared store when several processes serve them)
     try:
-        app = create_app(quiz_name)
+        app = create_app(*quiz_specs, shared_sessions=workers > 1)
     except Exception as e:
         raise ValueError(f"Failed to load quiz: {e}")
     
-    # Start Flask server in a thread
-    def run_server():
-        app.run(host='127.0.0.1', port=5000, debug=False, threaded=True, use_reloader=False)
-    
-    server_thread = threading.Thread(target=run_server, daemon=True)
+    if workers > 1:
+        # Fork the workers before starting any threads; this thread just supervises
+        global _worker_pool
+        _worker_pool = start_workers(app, host='127.0.0.1', port=5000, workers=workers,
+                                     threads=threads, backlog=backlog,
+                                     on_exit=lambda: shutdown_app(export=False))
+        server_thread = threading.Thread(target=_worker_pool.wait, daemon=True)
+    else:
+        # Start the server in a thread
+        def run_server():
+            serve(app, host='127.0.0.1', port=5000, mode=mode, threads=threads, backlog=backlog)
+        
+        server_thread = threading.Thread(target=run_server, daemon=True)
     server_thread.start()
+    _server_thread = server_thread
+    _base_url = "http://127.0.0.1:5000"
+    for spec in quiz_specs[1:]:
+        print(f"Also serving {spec}: {_base_url}/q/{quiz_prefix(spec)}/")
     
     # Wait for server to start
     time.sleep(2)
@@ -101,6 +141,7 @@ def launch_quiz_server(quiz_file: str, parent_window=None):
             _current_tunnel = ngrok.connect(5000)
         
         public_url_str = str(_current_tunnel.public_url)
+        _base_url = public_url_str
         print(f"\n{'='*60}")
         print(f"Quiz Server Started!")
         print(f"{'='*60}")
@@ -165,6 +206,47 @@ def launch_quiz_server(quiz_file: str, parent_window=None):
 
 # Global variable to track ngrok tunnel
 _current_tunnel = None
+# Pre-forked worker processes (only when serving with several workers)
+_worker_pool = None
+# Thread serving (or supervising the workers) and the address students use
+_server_thread = None
+_base_url = None
+
+
+def quiz_prefix(spec: str) -> str:
+    """URL prefix a quiz spec ("my_quiz.json" or "room1=my_quiz.json") is served under"""
+    quiz_name, prefix = parse_quiz_spec(spec)
+    return prefix or prefix_for(quiz_name)
+
+
+def host_another_quiz(quiz_specs, parent_window=None):
+    """Serve more quizzes from the running server; returns (url of the last one, server thread)"""
+    if _worker_pool is not None:
+        raise ValueError("Quizzes can't be added while several worker processes are serving - "
+                         "restart the server with every quiz on the command line")
+    url = None
+    for spec in quiz_specs:
+        quiz_name, prefix = parse_quiz_spec(spec)
+        if not load_quiz(quiz_name, prefix):
+            raise ValueError(f"Failed to load quiz: {quiz_name}")
+        url = f"{_base_url}/q/{quiz_prefix(spec)}/"
+        print(f"Now also serving {quiz_name}: {url}")
+    
+    if parent_window:
+        try:
+            from tkinter import messagebox
+            messagebox.showinfo(
+                "Quiz Launched!",
+                f"The quiz is now live alongside the quizzes already running.\n\n"
+                f"URL:\n{url}\n\n"
+                f"Share this URL with the students taking it.\n\n"
+                f"Click OK to open in browser.",
+                parent=parent_window
+            )
+            webbrowser.open(url)
+        except Exception as e:
+            print(f"Error showing dialog: {e}")
+    return url, _server_thread
 
 def stop_ngrok():
     """Stop all ngrok tunnels"""
@@ -180,7 +262,14 @@ def stop_ngrok():
 
 def cleanup():
     """Cleanup on exit"""
+    global _worker_pool
     stop_ngrok()
+    # Workers flush their own queues when stopped
+    if _worker_pool:
+        _worker_pool.stop()
+        _worker_pool = None
+    # Make sure every queued submission reaches the results store
+    shutdown_app()
 
 
 # Register cleanup on exit
@@ -190,13 +279,24 @@ signal.signal(signal.SIGTERM, lambda s, f: (cleanup(), sys.exit(0)))
 
 
 if __name__ == '__main__':
-    if len(sys.argv) < 2:
-        print("Usage: python run_server.py <quiz_name.json>")
-        sys.exit(1)
+    import argparse
+    
+    parser = argparse.ArgumentParser(description="Serve a quiz to students")
+    parser.add_argument('quiz_file', nargs='+',
+                        help="Quiz file(s) in data/ (e.g. my_quiz.json); prefix=my_quiz.json serves "
+                             "one under /q/prefix/. The first is also served at /")
+    parser.add_argument('--mode', choices=SERVE_MODES,
+                        help="Serving mode (default: QUIZ_SERVER_MODE or production)")
+    parser.add_argument('--threads', type=int, help="Worker threads in production mode")
+    parser.add_argument('--backlog', type=int, help="Listen backlog in production mode")
+    parser.add_argument('--workers', type=int,
+                        help="Worker processes in production mode (Linux/macOS only)")
+    args = parser.parse_args()
     
-    quiz_file = sys.argv[1]
+    quiz_file = args.quiz_file
     try:
-        url, thread = launch_quiz_server(quiz_file)
+        url, thread = launch_quiz_server(quiz_file, mode=args.mode, threads=args.threads,
+                                         backlog=args.backlog, workers=args.workers)
         print(f"\nServer running. Press Ctrl+C to stop.\n")
         print(f"Public URL: {url}")
         print(f"Local URL: http://127.0.0.1:5000\n")
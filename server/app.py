@@ -1,13 +1,30 @@
 """
 Flask server for quiz administration and student interface
 """
-from flask import Flask, render_template, request, jsonify, session
+from flask import Flask, render_template, request, jsonify, session, make_response, g, Response
 import os
 import json
 from datetime import datetime, timedelta
 import hashlib
-import random
+import hmac
 import logging
+import threading
+import time
+from typing import Optional, Tuple
+
+from server.grading import AnswerKey, compile_answer_key
+from server.results_store import get_results_store, SUBMITTED, AUTO_FINALIZED
+from server.write_behind import WriteBehindQueue, FAILED
+from server.variants import Variant, new_seed
+from server.sessions import SessionStore, SharedSessionStore, SessionRecord
+from server.audit import AuditLog
+from server.events import EventLog, EXTEND_TIME, FORCE_SUBMIT, EVENT_WAIT, MAX_WAITERS
+from server.deadlines import DeadlineScheduler
+from server.metrics import METRICS, summary_interval
+from server.quizzes import (QuizRegistry, QuizContent, HostedQuiz, PREFIX_PATTERN, prefix_for,
+                            quiz_revision, can_migrate)
+from server.reloader import QuizWatcher, file_signature, reload_interval
+from server.question_bank import resolve_draws
 
 # Setup logging first
 try:
@@ -60,52 +77,342 @@ app = Flask(__name__,
 app.secret_key = os.urandom(24)  # Generate random secret key
 logger.info("Flask app initialized with template and static folders")
 
-# Global quiz data (loaded when quiz is launched)
-CURRENT_QUIZ = None
-QUIZ_START_TIME = None
-ACTIVE_SESSIONS = {}  # Track active sessions to prevent resubmission
+# Quizzes being served, by URL prefix (loaded when a quiz is launched, see server.quizzes)
+QUIZZES = QuizRegistry()
+SUBMIT_GRACE_SECONDS = 60  # Submits accepted this long past the deadline (auto-submit delay, network)
+CLIENT_QUESTION_FIELDS = ('type', 'text', 'options', 'weight')  # What the page needs - never the answer key
+EVENT_WAITER_SLOTS = threading.BoundedSemaphore(MAX_WAITERS)  # Parked long-polls across all quizzes
+_quiz_lock = threading.Lock()  # Serializes load_quiz/unload_quiz; requests never take it
+SHARED_SESSIONS = False  # Keep sessions in SQLite so several worker processes share them
+RESULTS_QUEUE = WriteBehindQueue()  # Group-commits submissions off the request thread
+AUDIT_LOG = AuditLog.from_env()  # Structured submission log (QUIZ_AUDIT_LOG / QUIZ_AUDIT_SAMPLE)
 
 
-def load_quiz(quiz_name: str):
-    """Load quiz data from file"""
-    global CURRENT_QUIZ, QUIZ_START_TIME, ACTIVE_SESSIONS
-    
-    # Clear previous quiz data and sessions
-    CURRENT_QUIZ = None
-    QUIZ_START_TIME = None
-    ACTIVE_SESSIONS = {}
+def live_sessions() -> int:
+    """Live sessions across every hosted quiz"""
+    return sum(len(hosted.sessions) for hosted in QUIZZES.all())
+
+
+# Hot-path instrumentation, exposed at /metrics and summarized to the log
+REQUEST_SECONDS = METRICS.histogram('quiz_request_duration_seconds', 'Request latency by route', ('route',))
+REQUESTS = METRICS.counter('quiz_requests_total', 'Requests by route and status', ('route', 'status'))
+GRADING_SECONDS = METRICS.histogram('quiz_grading_duration_seconds', 'Time to grade one submission')
+SAVE_SECONDS = METRICS.histogram('quiz_save_duration_seconds',
+                                 'Time save_results holds a submit request (queueing and journal wait)')
+SUBMISSIONS = METRICS.counter('quiz_submissions_total', 'Submits by save status (failed ones can be resubmitted)',
+                              ('save_status',))
+LATE_SUBMITS = METRICS.counter('quiz_late_submits_total', 'Submits rejected because the deadline had passed')
+AUTOSAVED = METRICS.counter('quiz_answers_autosaved_total', 'Answers merged into session buffers by /api/answers')
+FINALIZED = METRICS.counter('quiz_sessions_finalized_total',
+                            'Started sessions recorded by the server without a submit (deadline or eviction)')
+RELOADS = METRICS.counter('quiz_reloads_total', 'Quiz file changes picked up by hot reload, by outcome', ('outcome',))
+METRICS.gauge('quiz_hosted', 'Quizzes being served', lambda: len(QUIZZES))
+METRICS.gauge('quiz_sessions_live', 'Live quiz sessions', live_sessions)
+METRICS.gauge('quiz_results_queue_depth', 'Submissions waiting for the results writer', lambda: RESULTS_QUEUE.depth())
+METRICS.gauge('quiz_deadlines_pending', 'Started sessions waiting for their deadline',
+              lambda: sum(hosted.deadlines.pending() for hosted in QUIZZES.all() if hosted.deadlines))
+
+
+def load_quiz(quiz_name: str, prefix: Optional[str] = None, default: bool = False) -> bool:
+    """
+    Load quiz data from file and serve it under /q/<prefix>/
     
-    quiz_path = os.path.join('data', f"{quiz_name}.json")
+    prefix defaults to the quiz name. Quizzes under other prefixes keep
+    running; loading a prefix that is already served replaces that quiz
+    (and starts its sessions afresh). The first quiz loaded, or one loaded
+    with default=True, is also served at the site root.
+    """
+    prefix = prefix or prefix_for(quiz_name)
+    if not PREFIX_PATTERN.match(prefix):
+        logger.error(f"Invalid quiz prefix: {prefix!r} (letters, digits, '-' and '_' only)")
+        return False
     
+    with _quiz_lock:
+        quiz_path = os.path.join('data', f"{quiz_name}.json")
+        
+        try:
+            # Read the signature first: a write that lands while we read shows up as a change
+            signature = file_signature(quiz_path)
+            quiz_data = read_quiz_file(quiz_path)
+            if quiz_data is None:
+                return False
+            
+            # Shuffling is per session (see server.variants) - the loaded quiz keeps its order
+            
+            # Store the questions once; submissions only reference this version
+            name = quiz_data.get('name', quiz_name)
+            version = get_results_store(name).register_version(quiz_data)
+            
+            # Sections taking the same version share its data, answer key and page
+            content = QUIZZES.content(name, quiz_data, version)
+            
+            timer_minutes = content.data.get('timer_minutes', 30)
+            if SHARED_SESSIONS:
+                sessions_path = os.path.join('results', name, f"{prefix}_sessions.db")
+                sessions = SharedSessionStore(sessions_path, timer_minutes)
+                events = EventLog(sessions_path, waiter_slots=EVENT_WAITER_SLOTS)
+            else:
+                sessions = SessionStore(timer_minutes)
+                events = EventLog(waiter_slots=EVENT_WAITER_SLOTS)
+            hosted = HostedQuiz(prefix, content, sessions, events, source=quiz_path)
+            hosted.source_signature = signature
+            sessions.on_evict = lambda records: finalize_evicted(hosted, records)
+            hosted.deadlines = DeadlineScheduler(lambda session_ids: finalize_sessions(hosted, session_ids),
+                                                 lambda: events.extension_seconds() + SUBMIT_GRACE_SECONDS)
+            
+            # Publish last: requests only ever see fully loaded quizzes
+            QUIZZES.add(hosted, default=default)
+            WATCHER.watch(prefix, quiz_path, signature)
+            logger.info(f"Quiz loaded successfully: {quiz_name} (at /q/{prefix}/"
+                        f"{', default' if QUIZZES.default_prefix == prefix else ''})")
+            logger.info(f"Quiz title: {content.data.get('title', 'N/A')}")
+            logger.info(f"Number of questions: {len(content.data.get('questions', []))}")
+            return True
+        except Exception as e:
+            logger.error(f"Error loading quiz: {e}", exc_info=True)
+            return False
+
+
+def read_quiz_file(quiz_path: str) -> Optional[dict]:
+    """Read and validate a quiz file (None, logged, if it is missing or invalid)"""
     if not os.path.exists(quiz_path):
         logger.error(f"Quiz file not found: {quiz_path}")
-        return False
-    
+        return None
     try:
         with open(quiz_path, 'r', encoding='utf-8') as f:
-            CURRENT_QUIZ = json.load(f)
+            quiz_data = json.load(f)
+    except json.JSONDecodeError as e:
+        logger.error(f"Invalid JSON in quiz file: {e}")
+        return None
+    
+    # Validate quiz data
+    is_valid, error_msg = validate_quiz_data(quiz_data)
+    if not is_valid:
+        logger.error(f"Invalid quiz data: {error_msg}")
+        return None
+    
+    # Pools for the quiz's question bank draws; each session picks its questions from them
+    try:
+        return resolve_draws(quiz_data)
+    except ValueError as e:
+        logger.error(f"Could not draw questions from the question bank: {e}")
+        return None
+
+
+def reload_quiz(prefix: str) -> bool:
+    """
+    Re-read a hosted quiz's file and swap the new revision in, keeping its sessions
+    
+    Called by the file watcher, off the request path. A file that doesn't
+    load or validate is logged and the running revision stays. Sessions in
+    progress move to the new revision if it keeps their questions (see
+    server.quizzes.can_migrate) and otherwise finish on the one they
+    started. Returns True if a new revision was swapped in.
+    """
+    with _quiz_lock:
+        hosted = QUIZZES.get(prefix)
+        if hosted is None or not hosted.source:
+            return False
+        signature = file_signature(hosted.source)
+        if signature is None or signature == hosted.source_signature:
+            return False
+        # Noted even if the file turns out invalid, so it is retried on the next change only
+        hosted.source_signature = signature
+        WATCHER.watch(prefix, hosted.source, signature)
         
-        # Validate quiz data
-        is_valid, error_msg = validate_quiz_data(CURRENT_QUIZ)
-        if not is_valid:
-            logger.error(f"Invalid quiz data: {error_msg}")
+        quiz_data = read_quiz_file(hosted.source)
+        if quiz_data is None:
+            RELOADS.inc('invalid')
+            logger.error(f"Kept the running revision of /q/{prefix}/ - {hosted.source} could not be loaded")
+            return False
+        old = hosted.content
+        if quiz_revision(quiz_data) == old.revision:
+            RELOADS.inc('unchanged')
             return False
         
-        # Shuffle questions if requested
-        if CURRENT_QUIZ.get('shuffle_questions', False) and 'questions' in CURRENT_QUIZ:
-            random.shuffle(CURRENT_QUIZ['questions'])
+        try:
+            # Built here, before the swap: compiling the key and storing the version stay off requests
+            version = get_results_store(hosted.name).register_version(quiz_data)
+            content = QUIZZES.content(hosted.name, quiz_data, version)
+        except Exception as e:
+            RELOADS.inc('invalid')
+            logger.error(f"Kept the running revision of /q/{prefix}/ - error building the new one: {e}",
+                         exc_info=True)
+            return False
         
-        QUIZ_START_TIME = datetime.now()
-        logger.info(f"Quiz loaded successfully: {quiz_name}")
-        logger.info(f"Quiz title: {CURRENT_QUIZ.get('title', 'N/A')}")
-        logger.info(f"Number of questions: {len(CURRENT_QUIZ.get('questions', []))}")
+        migrate = can_migrate(old.data, content.data)
+        timer_minutes = content.data.get('timer_minutes', 30)
+        if timer_minutes != old.data.get('timer_minutes', 30):
+            hosted.sessions.set_timer(timer_minutes)
+        hosted.swap(content, migrate)
+        RELOADS.inc('migrated' if migrate else 'pinned')
+        logger.info(f"Reloaded /q/{prefix}/ from {hosted.source}: revision {old.revision} -> {content.revision}, "
+                    f"sessions in progress {'migrated' if migrate else 'kept on their revision'}")
         return True
-    except json.JSONDecodeError as e:
-        logger.error(f"Invalid JSON in quiz file: {e}")
-        return False
-    except Exception as e:
-        logger.error(f"Error loading quiz: {e}", exc_info=True)
+
+
+WATCHER = QuizWatcher(reload_quiz)
+
+
+def unload_quiz(prefix: str) -> bool:
+    """
+    Stop serving the quiz at prefix (other quizzes keep running)
+    
+    Queued submissions are still written; sessions that have not
+    submitted are dropped.
+    """
+    with _quiz_lock:
+        hosted = QUIZZES.remove(prefix)
+        WATCHER.unwatch(prefix)
+    if hosted is None:
         return False
+    logger.info(f"Quiz unloaded: {hosted.name} (was at /q/{prefix}/, {len(hosted.sessions)} sessions dropped)")
+    return True
+
+
+@app.url_value_preprocessor
+def pull_quiz_prefix(endpoint, values):
+    """Take <quiz_prefix> out of the view arguments - views ask current_quiz()"""
+    g.quiz_prefix = values.pop('quiz_prefix', None) if values else None
+
+
+def quiz_route(rule: str, **options):
+    """Register a view at rule for the default quiz and at /q/<prefix>rule for every hosted quiz"""
+    def decorator(view):
+        app.add_url_rule(rule, view_func=view, **options)
+        app.add_url_rule(f"/q/<quiz_prefix>{rule}", view_func=view, **options)
+        return view
+    return decorator
+
+
+def current_quiz() -> Optional[HostedQuiz]:
+    """The quiz this request is for (None if it is not being served)"""
+    return QUIZZES.get(g.get('quiz_prefix'))
+
+
+def current_record(hosted: HostedQuiz) -> Optional[SessionRecord]:
+    """This browser's session of hosted"""
+    return hosted.sessions.get(session.get(hosted.session_key))
+
+
+def record_content(hosted: HostedQuiz, record: SessionRecord) -> QuizContent:
+    """The quiz revision a session is pinned to"""
+    content = hosted.content_for(record)
+    if content is None:
+        # Started on a revision another worker process loaded first - catch up with the file
+        reload_quiz(hosted.prefix)
+        content = hosted.content_for(record) or hosted.content
+    return content
+
+
+def get_variant(hosted: HostedQuiz, record: SessionRecord):
+    """Return the session's question/option permutation, deriving it on first use"""
+    if record.seed is None:
+        return None
+    variant = record.variant
+    if variant is None:
+        variant = record.variant = Variant(record.seed, record_content(hosted, record).data)
+    return variant
+
+
+def session_deadline(hosted: HostedQuiz, record: SessionRecord) -> float:
+    """The session's deadline (time.time(), before extensions)"""
+    return record.started.timestamp() + record_content(hosted, record).data.get('timer_minutes', 30) * 60
+
+
+def is_past_deadline(hosted: HostedQuiz, record: SessionRecord) -> bool:
+    """True once the session can no longer submit"""
+    return time.time() > session_deadline(hosted, record) + hosted.events.extension_seconds() + SUBMIT_GRACE_SECONDS
+
+
+def clean_answers(quiz_data: dict, changes) -> Optional[dict]:
+    """
+    Answers from a request body, keyed by display position
+    
+    Unknown positions and values that are not text or lists of text are
+    dropped; None if the payload is not an object at all.
+    """
+    if not isinstance(changes, dict):
+        return None
+    question_count = len(quiz_data.get('questions', []))
+    cleaned = {}
+    for position, answer in changes.items():
+        try:
+            index = int(position)
+        except (TypeError, ValueError):
+            continue
+        if not 0 <= index < question_count:
+            continue
+        if isinstance(answer, str) or (isinstance(answer, list) and all(isinstance(a, str) for a in answer)):
+            cleaned[str(index)] = answer
+    return cleaned
+
+
+def collect_answers(hosted: HostedQuiz, record: SessionRecord, changes: Optional[dict] = None) -> dict:
+    """The session's autosaved answers plus any final changes, keyed by question id"""
+    answers = hosted.sessions.answers(record)
+    if changes:
+        answers.update(changes)
+    # Answers are keyed by display position - map them back for shuffled sessions
+    variant = get_variant(hosted, record)
+    if variant is not None:
+        answers = variant.to_canonical(answers)
+    # ...and from the position in the session's revision to the question's id
+    question_ids = record_content(hosted, record).answer_key.question_ids
+    keyed = {}
+    for position, answer in answers.items():
+        try:
+            keyed[question_ids[int(position)]] = answer
+        except (ValueError, IndexError):
+            continue  # Unknown position - nothing to grade it against
+    return keyed
+
+
+def session_answer_key(hosted: HostedQuiz, record: SessionRecord, content: QuizContent) -> AnswerKey:
+    """The answer key a session is graded with: only its drawn questions if the quiz draws from the bank"""
+    variant = get_variant(hosted, record)
+    if variant is None or not variant.drawn:
+        return content.answer_key
+    return content.answer_key.select(sorted(variant.question_order))
+
+
+def finalize_sessions(hosted: HostedQuiz, session_ids):
+    """
+    Record started sessions that reached their deadline without submitting
+    
+    Called in batches by the quiz's deadline scheduler. The session is
+    claimed like a submit, so a racing late submit and the finalizer can't
+    both win.
+    """
+    records = [hosted.sessions.get(session_id) for session_id in session_ids]
+    finalized = finalize_records(hosted, [record for record in records if record is not None])
+    if finalized:
+        logger.info(f"Recorded {finalized} sessions of /q/{hosted.prefix}/ that reached their deadline "
+                    f"without submitting")
+
+
+def finalize_evicted(hosted: HostedQuiz, records):
+    """Record quizzes in progress the full session table had to evict, instead of losing them"""
+    finalized = finalize_records(hosted, records)
+    logger.warning(f"Session table of /q/{hosted.prefix}/ is full - recorded {finalized} evicted quizzes "
+                   f"in progress as auto-submitted: {', '.join(record.session_id for record in records)}")
+
+
+def finalize_records(hosted: HostedQuiz, records) -> int:
+    """Grade and queue the answers of each session not yet submitted; returns how many were recorded"""
+    finalized = 0
+    for record in records:
+        if record.submitted or not hosted.sessions.try_submit(record):
+            continue
+        content = record_content(hosted, record)
+        answers = collect_answers(hosted, record)
+        score_result = session_answer_key(hosted, record, content).grade(answers)
+        save_results(record.student_name or '', answers, score_result, record.session_id,
+                     status=AUTO_FINALIZED, wait=False, hosted=hosted, content=content)
+        finalized += 1
+    if finalized:
+        FINALIZED.inc(amount=finalized)
+    return finalized
 
 
 def generate_session_id():
@@ -115,166 +422,371 @@ def generate_session_id():
 
 def calculate_score(answers: dict, quiz_data: dict) -> dict:
     """Calculate quiz score based on answers"""
-    total_points = 0
-    earned_points = 0
-    question_results = []
+    # Answers are kept in the results store (and the audit log) - not in the server log
+    logger.debug("Scoring %d answers against %d questions", len(answers), len(quiz_data.get('questions', [])))
     
-    logger.info(f"Starting score calculation. Total questions: {len(quiz_data.get('questions', []))}")
-    logger.info(f"Received answers: {answers}")
+    # Use the precompiled key of a hosted quiz, compile on demand otherwise
+    hosted = QUIZZES.find(quiz_data)
+    answer_key = hosted.answer_key if hosted is not None else compile_answer_key(quiz_data)
     
-    for i, question in enumerate(quiz_data.get('questions', [])):
-        question_id = str(i)
-        weight = question.get('weight', 1)
-        total_points += weight
-        
-        if question_id not in answers:
-            question_results.append({
-                'question_num': i + 1,
-                'correct': False,
-                'points_earned': 0,
-                'points_possible': weight,
-                'type': question.get('type', 'unknown')
-            })
-            continue
-        
-        user_answer = answers[question_id]
-        correct_answer = question.get('correct_answer', '')
-        q_type = question.get('type', '')
-        is_correct = False
-        points_earned = 0
-        
-        # Debug logging
-        logger.debug(f"Q{i+1}: type={q_type}, user={user_answer}, correct={correct_answer}")
-        
-        if q_type == 'multiple_choice_single':
-            # Exact match - strip whitespace only, preserve case for Arabic/special chars
-            if str(user_answer).strip() == str(correct_answer).strip():
-                is_correct = True
-                points_earned = weight
-                logger.debug(f"Q{i+1}: CORRECT match!")
-            else:
-                logger.debug(f"Q{i+1}: INCORRECT - '{str(user_answer).strip()}' != '{str(correct_answer).strip()}'")
-        elif q_type == 'multiple_choice_multiple':
-            if isinstance(correct_answer, list):
-                # Exact match - strip whitespace only, preserve case
-                user_ans_set = set([str(a).strip() for a in user_answer]) if isinstance(user_answer, list) else set()
-                correct_ans_set = set([str(a).strip() for a in correct_answer])
-                if user_ans_set == correct_ans_set:
-                    is_correct = True
-                    points_earned = weight
-        elif q_type == 'true_false':
-            # Exact match - strip whitespace only, preserve case
-            if str(user_answer).strip() == str(correct_answer).strip():
-                is_correct = True
-                points_earned = weight
-                logger.debug(f"Q{i+1}: CORRECT match!")
-            else:
-                logger.debug(f"Q{i+1}: INCORRECT - '{str(user_answer).strip()}' != '{str(correct_answer).strip()}'")
-        elif q_type in ['short_answer', 'paragraph']:
-            if correct_answer:  # Only auto-grade if correct answer is provided
-                # Exact match - strip whitespace only, preserve case for Arabic
-                if str(user_answer).strip() == str(correct_answer).strip():
-                    is_correct = True
-                    points_earned = weight
-            else:
-                # Manual grading needed
-                is_correct = None
-                points_earned = 0
-        
-        earned_points += points_earned
-        question_results.append({
-            'question_num': i + 1,
-            'correct': is_correct,
-            'points_earned': points_earned,
-            'points_possible': weight,
-            'type': q_type,
-            'user_answer': user_answer
-        })
-    
-    percentage = (earned_points / total_points * 100) if total_points > 0 else 0
-    
-    return {
-        'total_points': total_points,
-        'earned_points': earned_points,
-        'percentage': round(percentage, 2),
-        'question_results': question_results
+    return answer_key.grade(answers)
+
+
+def client_question(question: dict) -> dict:
+    """A question as sent to the browser (no correct answer)"""
+    return {field: question[field] for field in CLIENT_QUESTION_FIELDS if field in question}
+
+
+def own_question_count(quiz_data: dict) -> int:
+    """Questions every session gets; bank pools follow them (see server.question_bank.resolve_draws)"""
+    pools = quiz_data.get('draw_pools')
+    return pools[0]['start'] if pools else len(quiz_data.get('questions', []))
+
+
+def render_quiz_page(quiz_data: dict) -> Tuple[str, str]:
+    """Render the quiz page; returns (etag, html)"""
+    # Per-session data (session id, start time, questions drawn from the bank) is not part of the page
+    questions = quiz_data.get('questions', [])
+    quiz_display = {
+        'title': quiz_data.get('title', 'Quiz'),
+        'start_message': quiz_data.get('start_message', ''),
+        'timer_minutes': quiz_data.get('timer_minutes', 30),
+        'require_full_name': quiz_data.get('require_full_name', True),
+        'questions': [client_question(question) for question in questions[:own_question_count(quiz_data)]]
     }
+    html = render_template('index.html', quiz=quiz_display)
+    etag = hashlib.sha256(html.encode('utf-8')).hexdigest()[:32]
+    return etag, html
+
+
+def get_quiz_page(hosted: HostedQuiz):
+    """Return (etag, html) for a hosted quiz's current revision, rendered once per revision"""
+    return hosted.content.page(render_quiz_page)
+
+
+@app.before_request
+def start_request_timer():
+    """Note when the request started (and make sure metrics get summarized and quiz files watched)"""
+    g.request_started = time.perf_counter()
+    METRICS.start_reporter(summary_interval())
+    WATCHER.start(reload_interval())
+
+
+@app.after_request
+def record_request(response):
+    """Record the request's latency and status under its route"""
+    started = g.get('request_started')
+    if started is not None:
+        route = request.url_rule.rule if request.url_rule is not None else 'unmatched'
+        REQUEST_SECONDS.observe(time.perf_counter() - started, route)
+        REQUESTS.inc(route, str(response.status_code))
+    return response
+
+
+def token_matches(token: str) -> bool:
+    """Check the request's ?token= or 'Authorization: Bearer' value against token"""
+    supplied = request.args.get('token', '')
+    authorization = request.headers.get('Authorization', '')
+    if not supplied and authorization.startswith('Bearer '):
+        supplied = authorization[len('Bearer '):]
+    return hmac.compare_digest(supplied.encode('utf-8'), token.encode('utf-8'))
 
 
-@app.route('/')
+def is_admin() -> bool:
+    """True for requests carrying QUIZ_ADMIN_TOKEN (admin routes are disabled when it is not set)"""
+    token = os.environ.get('QUIZ_ADMIN_TOKEN')
+    return bool(token) and token_matches(token)
+
+
+@app.route('/metrics')
+def metrics():
+    """Prometheus text metrics (needs ?token= when QUIZ_METRICS_TOKEN is set)"""
+    token = os.environ.get('QUIZ_METRICS_TOKEN')
+    if token and not token_matches(token):
+        return jsonify({'error': 'Forbidden'}), 403
+    return Response(METRICS.render(), mimetype='text/plain; version=0.0.4')
+
+
+@quiz_route('/')
 def index():
     """Serve the quiz interface"""
-    if not CURRENT_QUIZ:
+    hosted = current_quiz()
+    if not hosted:
         return render_template('error.html', message="No quiz is currently active. Please contact your instructor."), 404
     
     # Always generate a new session ID for each page load
     # This ensures each student gets their own independent session
     session_id = generate_session_id()
-    session['session_id'] = session_id
+    session[hosted.session_key] = session_id
     session.permanent = False  # Session expires when browser closes
     
-    # Initialize new session
-    ACTIVE_SESSIONS[session_id] = {
-        'started': datetime.now(),
-        'submitted': False,
-        'student_name': None
-    }
-    
-    quiz_display = {
-        'title': CURRENT_QUIZ.get('title', 'Quiz'),
-        'start_message': CURRENT_QUIZ.get('start_message', ''),
-        'timer_minutes': CURRENT_QUIZ.get('timer_minutes', 30),
-        'require_full_name': CURRENT_QUIZ.get('require_full_name', True),
-        'questions': CURRENT_QUIZ.get('questions', []),
-        'session_id': session_id,
-        'start_time': datetime.now().isoformat()  # Each student gets their own start time
-    }
+    # Initialize new session on the current revision (shuffle seed is None if not shuffled)
+    content = hosted.content
+    record = hosted.sessions.create(session_id, new_seed(content.data), content.revision)
     
-    return render_template('index.html', quiz=quiz_display)
+    # The page itself is identical for every student - serve it from cache
+    etag, html = content.page(render_quiz_page)
+    if etag in request.if_none_match:
+        response = make_response('', 304)
+    else:
+        response = make_response(html)
+    response.set_etag(etag)
+    response.headers['Cache-Control'] = 'no-cache'  # Revalidate so every load gets a session
+    response.headers['X-Quiz-Session'] = session_id
+    response.headers['X-Quiz-Start-Time'] = record.started.isoformat()
+    return response
 
 
-@app.route('/api/quiz_data')
+@quiz_route('/api/quiz_data')
 def get_quiz_data():
     """API endpoint to get quiz data"""
-    if not CURRENT_QUIZ:
+    hosted = current_quiz()
+    if not hosted:
         return jsonify({'error': 'No quiz active'}), 404
     
-    session_id = session.get('session_id')
-    if not session_id or session_id not in ACTIVE_SESSIONS:
+    record = current_record(hosted)
+    if record is None:
         return jsonify({'error': 'Invalid session'}), 403
     
-    if ACTIVE_SESSIONS.get(session_id, {}).get('submitted', False):
+    if record.submitted:
         return jsonify({'error': 'Already submitted'}), 403
     
     # Calculate time remaining based on THIS student's start time
-    session_data = ACTIVE_SESSIONS.get(session_id, {})
-    session_start = session_data.get('started', datetime.now())
+    session_start = record.started
     elapsed = (datetime.now() - session_start).total_seconds()
-    timer_minutes = CURRENT_QUIZ.get('timer_minutes', 30)
-    time_remaining = max(0, (timer_minutes * 60) - elapsed)
+    timer_minutes = record_content(hosted, record).data.get('timer_minutes', 30)
+    extension = hosted.events.extension_seconds()
+    time_remaining = max(0, (timer_minutes * 60) + extension - elapsed)
     
-    return jsonify({
+    # The page fetches this once and counts down locally; changes arrive via /api/events
+    quiz_data = {
         'timer_minutes': timer_minutes,
         'time_remaining_seconds': int(time_remaining),
-        'start_time': session_start.isoformat()
+        'start_time': session_start.isoformat(),
+        'deadline_ms': int((session_start.timestamp() + timer_minutes * 60 + extension) * 1000),
+        'server_time_ms': int(time.time() * 1000),
+        'extension_seconds': extension,
+        'event_seq': hosted.events.latest_seq(),
+        'force_submitted': hosted.events.force_submitted()
+    }
+    variant = get_variant(hosted, record)
+    if variant is not None:
+        quiz_data.update(variant.to_json())
+        if variant.drawn:
+            # The page only has the questions every session gets; send this session's draw
+            data = record_content(hosted, record).data
+            questions = data['questions']
+            own = own_question_count(data)
+            quiz_data['drawn_questions'] = {str(i): client_question(questions[i])
+                                            for i in variant.question_order if i >= own}
+    return jsonify(quiz_data)
+
+
+@quiz_route('/api/start', methods=['POST'])
+def start_session():
+    """The student entered their name and started - from now on the session is finalized at its deadline"""
+    hosted = current_quiz()
+    if not hosted:
+        return jsonify({'error': 'No quiz active'}), 404
+    
+    record = current_record(hosted)
+    if record is None:
+        return jsonify({'error': 'Invalid session'}), 403
+    if record.submitted:
+        return jsonify({'error': 'Already submitted'}), 403
+    if is_past_deadline(hosted, record):
+        return jsonify({'error': 'Time is up'}), 403
+    
+    data = request.get_json(silent=True) or {}
+    student_name = str(data.get('student_name', '')).strip()
+    already_started = record.student_name is not None
+    hosted.sessions.start(record, student_name)
+    if not already_started:
+        hosted.deadlines.schedule(record.session_id, session_deadline(hosted, record))
+    return jsonify({'success': True})
+
+
+@quiz_route('/api/answers', methods=['POST'])
+def autosave_answers():
+    """Merge the answers a student changed since the last autosave into the session's buffer"""
+    hosted = current_quiz()
+    if not hosted:
+        return jsonify({'error': 'No quiz active'}), 404
+    
+    record = current_record(hosted)
+    if record is None:
+        return jsonify({'error': 'Invalid session'}), 403
+    if record.submitted:
+        return jsonify({'error': 'Already submitted'}), 403
+    if is_past_deadline(hosted, record):
+        return jsonify({'error': 'Time is up'}), 403
+    
+    data = request.get_json(silent=True) or {}
+    changes = clean_answers(record_content(hosted, record).data, data.get('answers'))
+    if changes is None:
+        return jsonify({'error': 'No answers provided'}), 400
+    if changes and not hosted.sessions.save_answers(record, changes):
+        return jsonify({'error': 'Already submitted'}), 403
+    AUTOSAVED.inc(amount=len(changes))
+    return jsonify({'success': True, 'saved': len(changes)})
+
+
+@quiz_route('/api/events')
+def get_events():
+    """
+    Long-poll for control events after ?since=<seq>
+    
+    Parks the request until an event arrives (up to EVENT_WAIT seconds)
+    while a waiter slot is free; otherwise answers at once. retry_ms tells
+    the page when to ask again.
+    """
+    hosted = current_quiz()
+    if not hosted:
+        return jsonify({'error': 'No quiz active'}), 404
+    
+    events_log = hosted.events
+    since = request.args.get('since', 0, type=int)
+    wait = EVENT_WAIT if request.args.get('wait', '1') != '0' else 0
+    events = events_log.wait(since, wait)
+    if events is None:
+        # No free slot - check back later instead of holding a worker thread
+        events, retry = [], events_log.retry_seconds(live_sessions())
+    else:
+        retry = 0 if wait else events_log.retry_seconds(live_sessions())
+    return jsonify({
+        'seq': events[-1].seq if events else max(since, events_log.latest_seq()),
+        'events': [event.to_json() for event in events],
+        'retry_ms': int(retry * 1000)
     })
 
 
-@app.route('/api/submit', methods=['POST'])
+def get_hosted(prefix: Optional[str] = None) -> HostedQuiz:
+    """The quiz served at prefix (the default quiz when None); ValueError if there is none"""
+    hosted = QUIZZES.get(prefix)
+    if hosted is None:
+        raise ValueError(f"No quiz is being served at /q/{prefix}/" if prefix else "No quiz active")
+    return hosted
+
+
+def extend_time(minutes: float, prefix: Optional[str] = None):
+    """Give every student of one quiz extra time (published to its open pages)"""
+    hosted = get_hosted(prefix)
+    hosted.sessions.extend(minutes * 60)
+    event = hosted.events.publish(EXTEND_TIME, {'seconds': minutes * 60,
+                                                'total_seconds': hosted.events.extension_seconds() + minutes * 60})
+    logger.info(f"Time of /q/{hosted.prefix}/ extended by {minutes:g} minutes (event {event.seq})")
+    return event
+
+
+def force_submit_all(prefix: Optional[str] = None):
+    """End one quiz: every open page of it submits what it has"""
+    hosted = get_hosted(prefix)
+    event = hosted.events.publish(FORCE_SUBMIT)
+    logger.info(f"Force-submit sent to all students of /q/{hosted.prefix}/ (event {event.seq})")
+    return event
+
+
+@quiz_route('/api/admin/<action>', methods=['POST'])
+def admin_action(action: str):
+    """Teacher controls for one quiz - needs QUIZ_ADMIN_TOKEN (disabled when it is not set)"""
+    if not is_admin():
+        return jsonify({'error': 'Forbidden'}), 403
+    hosted = current_quiz()
+    if not hosted:
+        return jsonify({'error': 'No quiz active'}), 404
+    
+    if action == 'extend':
+        try:
+            minutes = float((request.get_json(silent=True) or {}).get('minutes', 0))
+        except (TypeError, ValueError):
+            minutes = 0
+        if minutes <= 0:
+            return jsonify({'error': 'minutes must be a positive number'}), 400
+        event = extend_time(minutes, hosted.prefix)
+    elif action == 'force_submit':
+        event = force_submit_all(hosted.prefix)
+    else:
+        return jsonify({'error': f'Unknown action: {action}'}), 404
+    return jsonify({'success': True, 'event': event.to_json()})
+
+
+def describe_quiz(hosted: HostedQuiz) -> dict:
+    """Admin listing entry for a hosted quiz"""
+    return {
+        'prefix': hosted.prefix,
+        'quiz': hosted.name,
+        'title': hosted.data.get('title', ''),
+        'version': hosted.version,
+        'revision': hosted.content.revision,
+        'pinned_revisions': hosted.pinned_revisions(),
+        'default': hosted.prefix == QUIZZES.default_prefix,
+        'started': hosted.started.isoformat(),
+        'live_sessions': len(hosted.sessions)
+    }
+
+
+@app.route('/api/admin/quizzes', methods=['GET', 'POST'])
+def admin_quizzes():
+    """List the hosted quizzes, or load one: {"quiz": name, "prefix": optional, "default": optional}"""
+    if not is_admin():
+        return jsonify({'error': 'Forbidden'}), 403
+    if request.method == 'GET':
+        return jsonify({'quizzes': [describe_quiz(hosted) for hosted in QUIZZES.all()]})
+    
+    # Worker processes each hold their own registry, fixed when they were forked
+    if SHARED_SESSIONS:
+        return jsonify({'error': 'Quizzes are loaded at startup when several worker processes serve them'}), 409
+    data = request.get_json(silent=True) or {}
+    quiz_name = str(data.get('quiz', '')).replace('.json', '')
+    prefix = data.get('prefix') or None
+    if not quiz_name or os.path.basename(quiz_name) != quiz_name:
+        return jsonify({'error': 'quiz must be the name of a quiz in data/'}), 400
+    if not load_quiz(quiz_name, prefix, default=bool(data.get('default'))):
+        return jsonify({'error': f'Failed to load quiz: {quiz_name}'}), 400
+    return jsonify({'success': True, 'quiz': describe_quiz(QUIZZES.get(prefix or prefix_for(quiz_name)))})
+
+
+@app.route('/api/admin/quizzes/<prefix>', methods=['DELETE'])
+def admin_unload_quiz(prefix: str):
+    """Stop serving one quiz"""
+    if not is_admin():
+        return jsonify({'error': 'Forbidden'}), 403
+    if SHARED_SESSIONS:
+        return jsonify({'error': 'Quizzes are loaded at startup when several worker processes serve them'}), 409
+    if not unload_quiz(prefix):
+        return jsonify({'error': f'No quiz is being served at /q/{prefix}/'}), 404
+    return jsonify({'success': True})
+
+
+@quiz_route('/api/submit', methods=['POST'])
 def submit_quiz():
     """Handle quiz submission"""
-    if not CURRENT_QUIZ:
+    hosted = current_quiz()
+    if not hosted:
         logger.warning("Submit attempted with no active quiz")
         return jsonify({'error': 'No quiz active'}), 404
-    
-    session_id = session.get('session_id')
+    session_id = session.get(hosted.session_key)
     if not session_id:
         logger.warning("Submit attempted without session ID")
         return jsonify({'error': 'No session ID'}), 403
     
-    # Check if already submitted
-    if ACTIVE_SESSIONS.get(session_id, {}).get('submitted', False):
-        logger.warning(f"Resubmission attempted for session: {session_id}")
+    record = hosted.sessions.get(session_id)
+    if record is None:
+        logger.warning("Submit attempted with unknown or expired session: %s", session_id)
+        return jsonify({'error': 'Invalid session'}), 403
+    content = record_content(hosted, record)  # The revision this student is taking
+    quiz_data = content.data
+    
+    # The deadline is enforced here, not only in the browser. Checked first: once the
+    # deadline passes the finalizer claims the session, and a late submit is still late
+    if is_past_deadline(hosted, record):
+        LATE_SUBMITS.inc()
+        logger.warning("Late submit rejected for session: %s", session_id)
+        return jsonify({'error': 'Time is up - the quiz can no longer be submitted'}), 403
+    
+    # Cheap early check; try_submit below makes the final decision atomically
+    if record.submitted:
+        logger.warning("Resubmission attempted for session: %s", session_id)
         return jsonify({'error': 'Already submitted'}), 403
     
     try:
@@ -285,131 +797,130 @@ def submit_quiz():
         student_name = data.get('student_name', '').strip()
         
         # Validate name if required
-        if CURRENT_QUIZ.get('require_full_name', True) and not student_name:
-            logger.warning(f"Submission attempted without name for session: {session_id}")
+        if quiz_data.get('require_full_name', True) and not student_name:
+            logger.warning("Submission attempted without name for session: %s", session_id)
             return jsonify({'error': 'Full name is required'}), 400
         
-        answers = data.get('answers', {})
+        # Claim the session's single submission - only one concurrent submit can win
+        if not hosted.sessions.try_submit(record):
+            logger.warning("Resubmission attempted for session: %s", session_id)
+            return jsonify({'error': 'Already submitted'}), 403
+        record.student_name = student_name
         
-        # Calculate score
-        score_result = calculate_score(answers, CURRENT_QUIZ)
-        
-        # Mark session as submitted
-        ACTIVE_SESSIONS[session_id]['submitted'] = True
-        ACTIVE_SESSIONS[session_id]['submitted_at'] = datetime.now()
+        try:
+            # The page sends only what changed since its last autosave
+            answers = collect_answers(hosted, record, clean_answers(quiz_data, data.get('answers', {})))
+            
+            # Calculate score
+            grading_started = time.perf_counter()
+            score_result = session_answer_key(hosted, record, content).grade(answers)
+            GRADING_SECONDS.observe(time.perf_counter() - grading_started)
+        except Exception:
+            # Nothing was recorded - let the student retry
+            hosted.sessions.release_submit(record)
+            raise
         
-        # Save results
+        # Save results - queued for the writer thread, acknowledged once journaled
+        save_status = FAILED
+        save_started = time.perf_counter()
         try:
-            save_results(student_name, answers, score_result, session_id)
-            logger.info(f"Quiz submitted successfully: {student_name} (Session: {session_id})")
+            save_status = save_results(student_name, answers, score_result, session_id,
+                                       hosted=hosted, content=content)
         except Exception as e:
-            logger.error(f"Error saving results: {e}", exc_info=True)
-            # Continue even if save fails - user has submitted
+            logger.error("Error saving results: %s", e, exc_info=True)
+        SAVE_SECONDS.observe(time.perf_counter() - save_started)
+        SUBMISSIONS.inc(save_status)
+        AUDIT_LOG.record_submission(hosted.name, content.version, session_id,
+                                    student_name, answers, score_result, save_status)
+        if save_status == FAILED:
+            # Nothing was stored - give the session back so the student can submit again
+            hosted.sessions.release_submit(record)
+            logger.warning("Submission could not be saved, student can resubmit: %s (Session: %s)",
+                           student_name, session_id)
+            return jsonify({'error': 'Your answers could not be saved - please submit again'}), 503
+        logger.info("Quiz submitted successfully: %s (Session: %s, %s)", student_name, session_id, save_status)
         
         return jsonify({
             'success': True,
-            'message': CURRENT_QUIZ.get('end_message', 'Thank you for completing the quiz!')
+            'save_status': save_status,
+            'message': quiz_data.get('end_message', 'Thank you for completing the quiz!')
         })
     except Exception as e:
-        logger.error(f"Error processing submission: {e}", exc_info=True)
+        logger.error("Error processing submission: %s", e, exc_info=True)
         return jsonify({'error': 'Server error processing submission'}), 500
 
 
-def save_results(student_name: str, answers: dict, score_result: dict, session_id: str):
-    """Save quiz results to files"""
-    quiz_name = CURRENT_QUIZ.get('name', 'unknown_quiz')
-    results_dir = os.path.join('results', quiz_name)
-    os.makedirs(results_dir, exist_ok=True)
+def save_results(student_name: str, answers: dict, score_result: dict, session_id: str,
+                 status: str = SUBMITTED, wait: bool = True, hosted: Optional[HostedQuiz] = None,
+                 content: Optional[QuizContent] = None) -> str:
+    """
+    Queue quiz results for the quiz's results store
     
-    timestamp = datetime.now().strftime('%Y%m%d_%H%M%S')
-    # Sanitize filename
-    safe_name = "".join(c for c in student_name if c.isalnum() or c in (' ', '-', '_')).strip()[:50]
-    if not safe_name:
-        safe_name = 'Student'
-    
-    # Prepare result data
-    result_data = {
-        'quiz_name': quiz_name,
-        'quiz_title': CURRENT_QUIZ.get('title', ''),
+    hosted defaults to the default quiz, content (the revision that graded
+    the answers) to its current one. Returns 'journaled' once the
+    submission is committed to disk, or 'pending' if the writer has not
+    reached it yet (always, when wait is False).
+    """
+    hosted = hosted or get_hosted()
+    content = content or hosted.content
+    store = get_results_store(hosted.name)
+    return RESULTS_QUEUE.submit(store, {
         'student_name': student_name,
         'session_id': session_id,
-        'timestamp': datetime.now().isoformat(),
-        'score': score_result,
         'answers': answers,
-        'questions': CURRENT_QUIZ.get('questions', [])
-    }
-    
-    # Save JSON
-    json_filename = f"{safe_name}_{timestamp}.json"
-    json_path = os.path.join(results_dir, json_filename)
-    try:
-        with open(json_path, 'w', encoding='utf-8') as f:
-            json.dump(result_data, f, indent=2, ensure_ascii=False)
-        logger.info(f"Results saved to JSON: {json_path}")
-    except Exception as e:
-        logger.error(f"Error saving JSON results: {e}", exc_info=True)
-        raise
-    
-    # Save CSV
-    csv_path = os.path.join(results_dir, f"{quiz_name}_results.csv")
-    import csv
-    
-    try:
-        # Check if CSV exists and write header if new
-        file_exists = os.path.exists(csv_path)
-        with open(csv_path, 'a', newline='', encoding='utf-8') as f:
-            writer = csv.writer(f)
-            if not file_exists:
-                # Write header
-                header = ['Timestamp', 'Student Name', 'Session ID', 'Total Points', 
-                         'Earned Points', 'Percentage']
-                # Add question columns
-                for i in range(len(CURRENT_QUIZ.get('questions', []))):
-                    header.extend([f'Q{i+1}_Answer', f'Q{i+1}_Correct', f'Q{i+1}_Points'])
-                writer.writerow(header)
-            
-            # Write data row
-            row = [
-                result_data['timestamp'],
-                student_name,
-                session_id,
-                score_result['total_points'],
-                score_result['earned_points'],
-                score_result['percentage']
-            ]
-            
-            # Add question answers
-            for q_result in score_result['question_results']:
-                q_idx = str(q_result['question_num'] - 1)
-                user_ans = answers.get(q_idx, '')
-                if isinstance(user_ans, list):
-                    user_ans = '; '.join(str(a) for a in user_ans)
-                row.extend([
-                    str(user_ans),
-                    str(q_result['correct']) if q_result['correct'] is not None else 'Manual',
-                    f"{q_result['points_earned']}/{q_result['points_possible']}"
-                ])
-            
-            writer.writerow(row)
-        logger.info(f"Results appended to CSV: {csv_path}")
-    except Exception as e:
-        logger.error(f"Error saving CSV results: {e}", exc_info=True)
-        raise
+        'score': score_result,
+        'quiz_version': content.version,
+        'status': status,
+        'when': datetime.now()
+    }, wait=wait)
+
 
+def shutdown(export: bool = True):
+    """Flush queued results and (optionally) refresh the exports of the hosted quizzes"""
+    WATCHER.stop()
+    hosted_quizzes = QUIZZES.all()
+    for hosted in hosted_quizzes:
+        hosted.stop()
+    RESULTS_QUEUE.drain(timeout=30)
+    if export:
+        for name in sorted({hosted.name for hosted in hosted_quizzes}):
+            try:
+                get_results_store(name).export()
+            except Exception as e:
+                logger.error(f"Error exporting results of {name} on shutdown: {e}", exc_info=True)
 
-def create_app(quiz_name: str):
-    """Create Flask app with loaded quiz"""
-    if not load_quiz(quiz_name):
-        raise ValueError(f"Failed to load quiz: {quiz_name}")
+
+def parse_quiz_spec(spec: str) -> Tuple[str, Optional[str]]:
+    """'quiz_name' or 'prefix=quiz_name' (a .json suffix is allowed) -> (quiz_name, prefix)"""
+    prefix, _, quiz_name = spec.rpartition('=')
+    return quiz_name.replace('.json', ''), prefix or None
+
+
+def create_app(*quiz_specs: str, shared_sessions: bool = False):
+    """
+    Create Flask app with loaded quizzes
+    
+    Each spec is a quiz name, or prefix=quiz_name to serve it under a
+    prefix of its own (e.g. two rooms taking the same exam). The first
+    one is also served at the site root. Pass shared_sessions=True when
+    the app will be served by several worker processes.
+    """
+    global SHARED_SESSIONS
+    SHARED_SESSIONS = shared_sessions
+    if not quiz_specs:
+        raise ValueError("No quiz to serve")
+    for spec in quiz_specs:
+        quiz_name, prefix = parse_quiz_spec(spec)
+        if not load_quiz(quiz_name, prefix):
+            raise ValueError(f"Failed to load quiz: {spec}")
     return app
 
 
 if __name__ == '__main__':
     import sys
     if len(sys.argv) > 1:
-        quiz_name = sys.argv[1].replace('.json', '')
-        create_app(quiz_name)
-        app.run(host='127.0.0.1', port=5000, debug=False, threaded=True)
+        create_app(*sys.argv[1:])
+        from server.serving import serve
+        serve(app, host='127.0.0.1', port=5000)
     else:
-        print("Usage: python app.py <quiz_name>")
-
+        print("Usage: python app.py <quiz_name | prefix=quiz_name> ...")
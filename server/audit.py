@@ -0,0 +1,86 @@
+"""
+Submission audit log
+
+One JSON line per accepted submission, written to logs/audit_<date>.jsonl
+through the queued logging pipeline (see server.utils.setup_logging), so
+the request thread never formats or writes it.
+
+QUIZ_AUDIT_LOG picks what is recorded: 'summary' (default - who, when,
+score, save status), 'full' (also the answers) or 'off'. The answers are
+always kept in the results store; 'full' is for debugging.
+QUIZ_AUDIT_SAMPLE (0-1, default 1) records only that share of submissions.
+"""
+import json
+import logging
+import os
+import random
+from datetime import datetime
+from typing import Dict, Optional
+
+from server.utils import AUDIT_LOGGER
+
+AUDIT_MODES = ('off', 'summary', 'full')
+DEFAULT_AUDIT_MODE = 'summary'
+
+logger = logging.getLogger(__name__)
+
+
+class _JsonLine:
+    """Serialized only when the listener thread formats the record"""
+
+    __slots__ = ('payload',)
+
+    def __init__(self, payload: Dict):
+        self.payload = payload
+
+    def __str__(self) -> str:
+        return json.dumps(self.payload, ensure_ascii=False, default=str)
+
+
+class AuditLog:
+    """Sampled, structured record of submissions"""
+
+    def __init__(self, mode: str = DEFAULT_AUDIT_MODE, sample_rate: float = 1.0):
+        if mode not in AUDIT_MODES:
+            raise ValueError(f"Unknown audit mode: {mode} (expected one of {', '.join(AUDIT_MODES)})")
+        self.mode = mode
+        self.sample_rate = min(1.0, max(0.0, sample_rate))
+        self._logger = logging.getLogger(AUDIT_LOGGER)
+
+    @classmethod
+    def from_env(cls) -> 'AuditLog':
+        """Configure from QUIZ_AUDIT_LOG / QUIZ_AUDIT_SAMPLE, falling back to the defaults"""
+        mode = os.environ.get('QUIZ_AUDIT_LOG', DEFAULT_AUDIT_MODE).strip().lower()
+        if mode not in AUDIT_MODES:
+            logger.warning(f"Ignoring unknown QUIZ_AUDIT_LOG={mode!r}, using {DEFAULT_AUDIT_MODE!r}")
+            mode = DEFAULT_AUDIT_MODE
+        try:
+            sample_rate = float(os.environ.get('QUIZ_AUDIT_SAMPLE', 1.0))
+        except ValueError:
+            logger.warning("Ignoring non-numeric QUIZ_AUDIT_SAMPLE, recording every submission")
+            sample_rate = 1.0
+        return cls(mode, sample_rate)
+
+    def record_submission(self, quiz_name: str, quiz_version: Optional[str], session_id: str,
+                          student_name: str, answers: Dict, score_result: Dict, save_status: str):
+        """Record one accepted submission (if enabled and sampled)"""
+        if self.mode == 'off' or not self._logger.isEnabledFor(logging.INFO):
+            return
+        if self.sample_rate < 1.0 and random.random() >= self.sample_rate:
+            return
+        payload = {
+            'time': datetime.now(),
+            'event': 'submission',
+            'quiz': quiz_name,
+            'quiz_version': quiz_version,
+            'session_id': session_id,
+            'student_name': student_name,
+            'answered': len(answers),
+            'earned_points': score_result['earned_points'],
+            'total_points': score_result['total_points'],
+            'percentage': score_result['percentage'],
+            'save_status': save_status
+        }
+        if self.mode == 'full':
+            payload['answers'] = answers
+        self._logger.info('%s', _JsonLine(payload))
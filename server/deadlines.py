@@ -0,0 +1,92 @@
+"""
+Server-side deadline scheduler
+
+Sessions whose student has started the quiz are pushed onto a heap keyed
+by their deadline. One thread sleeps until the earliest deadline (plus
+any time extension granted since), pops every session that is due and
+hands them to a finalize callback in batches, so a student whose tab
+died still gets a recorded submission.
+"""
+import heapq
+import logging
+import os
+import threading
+import time
+from typing import Callable, List, Optional, Tuple
+
+logger = logging.getLogger(__name__)
+
+BATCH_SIZE = 256        # Sessions handed to one finalize call
+RECHECK_INTERVAL = 5.0  # Max sleep, so extensions published by other processes are noticed
+
+
+class DeadlineScheduler:
+    """Min-heap of (deadline, session_id) drained by a finalizer thread"""
+
+    def __init__(self, finalize: Callable[[List[str]], None],
+                 extension: Callable[[], float] = lambda: 0.0, batch_size: int = BATCH_SIZE):
+        self.finalize = finalize
+        self.extension = extension  # Seconds added to every deadline, read at each check
+        self.batch_size = batch_size
+        self._heap: List[Tuple[float, str]] = []
+        self._cond = threading.Condition()
+        self._thread: Optional[threading.Thread] = None
+        self._pid = None
+        self._stopped = False
+
+    def _ensure_started(self):
+        """Start the finalizer thread on first use (in this process)"""
+        if self._thread is None or self._pid != os.getpid():
+            self._thread = threading.Thread(target=self._run, name='deadline-finalizer', daemon=True)
+            self._pid = os.getpid()
+            self._thread.start()
+
+    def schedule(self, session_id: str, deadline: float):
+        """Finalize session_id once deadline (time.time(), before extensions) has passed"""
+        with self._cond:
+            if self._stopped:
+                return
+            self._ensure_started()
+            heapq.heappush(self._heap, (deadline, session_id))
+            if self._heap[0][1] == session_id:
+                self._cond.notify()  # New earliest deadline
+
+    def pending(self) -> int:
+        """Number of sessions waiting for their deadline"""
+        return len(self._heap)
+
+    def _pop_due(self) -> List[str]:
+        """Wait for the earliest deadline and pop a batch of due sessions"""
+        with self._cond:
+            while not self._stopped:
+                if not self._heap:
+                    self._cond.wait()
+                    continue
+                now = time.time()
+                extension = self.extension()
+                wait = self._heap[0][0] + extension - now
+                if wait > 0:
+                    self._cond.wait(min(wait, RECHECK_INTERVAL))
+                    continue
+                due = []
+                while self._heap and len(due) < self.batch_size and self._heap[0][0] + extension <= now:
+                    due.append(heapq.heappop(self._heap)[1])
+                return due
+        return []
+
+    def _run(self):
+        while not self._stopped:
+            due = self._pop_due()
+            if not due:
+                continue
+            try:
+                self.finalize(due)
+            except Exception as e:
+                logger.error(f"Error finalizing {len(due)} expired sessions: {e}", exc_info=True)
+
+    def stop(self):
+        """Stop finalizing; sessions still waiting are dropped"""
+        with self._cond:
+            self._stopped = True
+            self._heap.clear()
+            self._cond.notify_all()
@@ -0,0 +1,189 @@
+"""
+Quiz control events pushed to students
+
+Students get their deadline once and count down locally; what can change
+afterwards (the teacher extends the time or ends the quiz) is published
+here as sequence-numbered events. Browsers pick them up with a long-poll
+on /api/events.
+
+A parked long-poll holds one of the server's worker threads, so only
+max_waiters requests are parked at a time (a slot pool that the event
+logs of several hosted quizzes can share); the rest are answered at once
+and told when to check again, with the interval stretched as the class
+grows so event traffic stays near TARGET_CHECK_RATE requests per second.
+
+With several worker processes the events live in a SQLite table next to
+the shared sessions, and parked requests re-read it about once a second.
+"""
+import json
+import os
+import sqlite3
+import threading
+import time
+from typing import Dict, List, Optional
+
+EXTEND_TIME = 'extend_time'
+FORCE_SUBMIT = 'force_submit'
+
+EVENT_WAIT = 25.0          # Seconds a long-poll is parked waiting for an event
+MAX_WAITERS = 16           # Parked long-polls at once (keep well below the server's threads)
+TARGET_CHECK_RATE = 10.0   # Event checks per second aimed for across all unparked students
+MIN_RETRY = 15.0           # Bounds of the check interval handed to unparked students
+MAX_RETRY = 120.0
+SYNC_INTERVAL = 1.0        # Seconds between re-reads of the shared event table
+
+
+class QuizEvent:
+    """One control event"""
+
+    __slots__ = ('seq', 'event_type', 'data', 'created')
+
+    def __init__(self, seq: int, event_type: str, data: Dict, created: float):
+        self.seq = seq
+        self.event_type = event_type
+        self.data = data
+        self.created = created
+
+    def to_json(self) -> Dict:
+        return {'seq': self.seq, 'type': self.event_type, 'data': self.data}
+
+
+class EventLog:
+    """Ordered control events of the running quiz, with long-poll waiting"""
+
+    _SCHEMA = """
+    CREATE TABLE IF NOT EXISTS events (
+        seq INTEGER PRIMARY KEY AUTOINCREMENT,
+        event_type TEXT NOT NULL,
+        data TEXT NOT NULL,
+        created REAL NOT NULL
+    );
+    """
+
+    def __init__(self, path: Optional[str] = None, max_waiters: int = MAX_WAITERS, reset: bool = True,
+                 waiter_slots: Optional[threading.Semaphore] = None):
+        self.path = path
+        self.max_waiters = max_waiters
+        self._events: List[QuizEvent] = []
+        self._cond = threading.Condition()
+        self._slots = waiter_slots or threading.BoundedSemaphore(max_waiters)
+        self._extension = 0.0
+        self._forced = False
+        self._local = threading.local()
+        self._synced_at = 0.0
+
+        if path:
+            os.makedirs(os.path.dirname(path) or '.', exist_ok=True)
+            conn = self._connect()
+            with conn:
+                conn.executescript(self._SCHEMA)
+                if reset:
+                    conn.execute('DELETE FROM events')
+            self._sync(force=True)
+
+    def _connect(self) -> sqlite3.Connection:
+        """Return this thread's connection (re-opened after a fork)"""
+        conn = getattr(self._local, 'conn', None)
+        if conn is None or self._local.pid != os.getpid():
+            conn = sqlite3.connect(self.path, timeout=30)
+            conn.execute('PRAGMA journal_mode=WAL')
+            self._local.conn = conn
+            self._local.pid = os.getpid()
+        return conn
+
+    def _apply(self, event: QuizEvent):
+        """Fold an event into the derived state (caller holds the condition)"""
+        self._events.append(event)
+        if event.event_type == EXTEND_TIME:
+            self._extension += event.data.get('seconds', 0)
+        elif event.event_type == FORCE_SUBMIT:
+            self._forced = True
+
+    def _sync(self, force: bool = False):
+        """Pick up events other processes wrote to the shared table"""
+        if not self.path:
+            return
+        now = time.monotonic()
+        if not force and now - self._synced_at < SYNC_INTERVAL:
+            return
+        self._synced_at = now
+        rows = self._connect().execute(
+            'SELECT seq, event_type, data, created FROM events WHERE seq > ? ORDER BY seq',
+            (self.latest_seq(),)
+        ).fetchall()
+        if rows:
+            with self._cond:
+                for seq, event_type, data, created in rows:
+                    if seq > self.latest_seq():
+                        self._apply(QuizEvent(seq, event_type, json.loads(data), created))
+                self._cond.notify_all()
+
+    def publish(self, event_type: str, data: Optional[Dict] = None) -> QuizEvent:
+        """Record an event and wake parked long-polls"""
+        data = data or {}
+        created = time.time()
+        if self.path:
+            conn = self._connect()
+            with conn:
+                seq = conn.execute('INSERT INTO events (event_type, data, created) VALUES (?, ?, ?)',
+                                   (event_type, json.dumps(data), created)).lastrowid
+            self._sync(force=True)
+            return next(event for event in reversed(self._events) if event.seq == seq)
+        with self._cond:
+            event = QuizEvent(self.latest_seq() + 1, event_type, data, created)
+            self._apply(event)
+            self._cond.notify_all()
+        return event
+
+    def latest_seq(self) -> int:
+        events = self._events
+        return events[-1].seq if events else 0
+
+    def since(self, seq: int) -> List[QuizEvent]:
+        """Events after seq"""
+        self._sync()
+        events = self._events
+        if not events or events[-1].seq <= seq:
+            return []
+        return [event for event in events if event.seq > seq]
+
+    def extension_seconds(self) -> float:
+        """Total time added to every deadline"""
+        self._sync()
+        return self._extension
+
+    def force_submitted(self) -> bool:
+        """True once the teacher has ended the quiz"""
+        self._sync()
+        return self._forced
+
+    def wait(self, seq: int, timeout: float = EVENT_WAIT) -> Optional[List[QuizEvent]]:
+        """
+        Wait up to timeout for events after seq
+
+        Returns the events (empty on timeout), or None when no waiter slot
+        is free - the caller should answer at once.
+        """
+        events = self.since(seq)
+        if events or timeout <= 0:
+            return events
+        if not self._slots.acquire(blocking=False):
+            return None
+        try:
+            deadline = time.monotonic() + timeout
+            while True:
+                remaining = deadline - time.monotonic()
+                if remaining <= 0:
+                    return []
+                with self._cond:
+                    if self.latest_seq() <= seq:
+                        self._cond.wait(min(remaining, SYNC_INTERVAL) if self.path else remaining)
+                events = self.since(seq)
+                if events:
+                    return events
+        finally:
+            self._slots.release()
+
+    def retry_seconds(self, live_sessions: int) -> float:
+        """How long an unparked student should wait before checking again"""
+        return min(MAX_RETRY, max(MIN_RETRY, live_sessions / TARGET_CHECK_RATE))
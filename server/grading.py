@@ -0,0 +1,160 @@
+"""
+Compiled answer keys for fast quiz grading
+
+A quiz is compiled once (when it is loaded) into an AnswerKey holding
+normalized correct answers, numeric weights and a grader callable per
+question, so grading a submission is a single pass over the key.
+
+Answers are keyed by question id (see question_key), so stored results
+keep pointing at the right question when questions are reordered.
+"""
+from typing import Any, Callable, Dict, List, Optional
+
+
+# Grader signature: (user_answer, normalized_correct_answer) -> True / False / None
+# None means the question needs manual grading.
+Grader = Callable[[Any, Any], Optional[bool]]
+
+
+def _normalize(value: Any) -> str:
+    """Normalize a single answer value - strip whitespace only, preserve case"""
+    if value.__class__ is str:
+        return value.strip()
+    return str(value).strip()
+
+
+def _grade_exact(user_answer: Any, correct: str) -> bool:
+    """Exact match after stripping whitespace (case preserved for Arabic/special chars)"""
+    return _normalize(user_answer) == correct
+
+
+def _grade_set(user_answer: Any, correct: frozenset) -> bool:
+    """Unordered match of a list of selected options (anything but a list selects nothing)"""
+    if not isinstance(user_answer, list):
+        # Correct only when no option should be selected
+        return not correct
+    if len(user_answer) < len(correct):
+        # A shorter list can never cover every correct option
+        return False
+    return frozenset(_normalize(a) for a in user_answer) == correct
+
+
+def _grade_never(user_answer: Any, correct: Any) -> bool:
+    """Question can not be auto-graded as correct (unknown type or bad key)"""
+    return False
+
+
+def _grade_manual(user_answer: Any, correct: Any) -> None:
+    """Question needs manual grading by the teacher"""
+    return None
+
+
+def question_key(question: Dict, index: int) -> str:
+    """Key a question's answer is stored under: its id, or its position in quizzes saved before ids"""
+    question_id = question.get('id')
+    return str(question_id) if question_id else str(index)
+
+
+def _normalize_weight(weight: Any):
+    """Convert a question weight to a number once, at compile time"""
+    if isinstance(weight, (int, float)) and not isinstance(weight, bool):
+        return weight
+    weight = float(weight)
+    return int(weight) if weight.is_integer() else weight
+
+
+class CompiledQuestion:
+    """A single question reduced to what grading needs"""
+
+    __slots__ = ('index', 'answer_id', 'question_num', 'q_type', 'weight', 'correct', 'grader')
+
+    def __init__(self, index: int, question: Dict):
+        self.index = index
+        self.answer_id = question_key(question, index)
+        self.question_num = index + 1
+        self.q_type = question.get('type', '')
+        self.weight = _normalize_weight(question.get('weight', 1))
+        self.correct, self.grader = self._compile(question)
+
+    def _compile(self, question: Dict):
+        """Pick the grader and pre-normalize the correct answer for this question type"""
+        correct_answer = question.get('correct_answer', '')
+        q_type = self.q_type
+
+        if q_type in ('multiple_choice_single', 'true_false'):
+            return _normalize(correct_answer), _grade_exact
+        if q_type == 'multiple_choice_multiple':
+            if isinstance(correct_answer, list):
+                return frozenset(_normalize(a) for a in correct_answer), _grade_set
+            return None, _grade_never
+        if q_type in ('short_answer', 'paragraph'):
+            if correct_answer:  # Only auto-grade if correct answer is provided
+                return _normalize(correct_answer), _grade_exact
+            return None, _grade_manual
+        return None, _grade_never
+
+
+class AnswerKey:
+    """Precompiled answer key for one quiz"""
+
+    __slots__ = ('questions', 'question_ids', 'total_points')
+
+    def __init__(self, questions: List[CompiledQuestion]):
+        self.questions = questions
+        self.question_ids = [q.answer_id for q in questions]  # Answer key of each position
+        self.total_points = sum(q.weight for q in questions)
+
+    def select(self, positions) -> 'AnswerKey':
+        """The key of the questions at positions only (a session's draw from the question bank)"""
+        return AnswerKey([self.questions[i] for i in positions])
+
+    def grade(self, answers: Dict) -> Dict:
+        """Grade one submission (answers keyed by question id)"""
+        earned_points = 0
+        question_results = []
+        append = question_results.append
+        get_answer = answers.get
+
+        for q in self.questions:
+            user_answer = get_answer(q.answer_id, _MISSING)
+            if user_answer is _MISSING:
+                append({
+                    'question_num': q.question_num,
+                    'question_id': q.answer_id,
+                    'correct': False,
+                    'points_earned': 0,
+                    'points_possible': q.weight,
+                    'type': q.q_type or 'unknown'
+                })
+                continue
+
+            is_correct = q.grader(user_answer, q.correct)
+            points_earned = q.weight if is_correct else 0
+            earned_points += points_earned
+            append({
+                'question_num': q.question_num,
+                'question_id': q.answer_id,
+                'correct': is_correct,
+                'points_earned': points_earned,
+                'points_possible': q.weight,
+                'type': q.q_type,
+                'user_answer': user_answer
+            })
+
+        total_points = self.total_points
+        percentage = (earned_points / total_points * 100) if total_points > 0 else 0
+
+        return {
+            'total_points': total_points,
+            'earned_points': earned_points,
+            'percentage': round(percentage, 2),
+            'question_results': question_results
+        }
+
+
+_MISSING = object()
+
+
+def compile_answer_key(quiz_data: Dict) -> AnswerKey:
+    """Compile quiz questions into an AnswerKey (call once per loaded quiz)"""
+    return AnswerKey([CompiledQuestion(i, q) for i, q in enumerate(quiz_data.get('questions', []))])
@@ -0,0 +1,333 @@
+"""
+Item analysis of stored submissions
+
+Per question: difficulty (p-value, the share of students who got it
+right), discrimination (point-biserial correlation between getting it
+right and the score on the rest of the quiz) and how often each option
+was chosen; for the quiz, Cronbach's alpha.
+
+All of these follow from a handful of running sums per question, built
+from the question_results grading already stores with each submission.
+New submissions are folded in as a batch (column-wise, with NumPy when
+it is installed) and the sums are cached in the results store, so a
+report costs only the submissions added since the last one. Regrading
+changes scores in place, which invalidates the cache.
+
+Usage:
+    python -m server.item_analysis <quiz_name> [--json report.json]
+"""
+import json
+import logging
+import math
+import sys
+from typing import Dict, Iterable, List, Optional
+
+from server.grading import question_key
+from server.results_store import RESULTS_DIR, get_results_store
+from server.utils import result_question_key
+
+try:
+    import numpy as np
+except ImportError:  # NumPy is optional - fall back to pure Python sums
+    np = None
+
+logger = logging.getLogger(__name__)
+
+CACHE_NAME = 'item_analysis'
+CACHE_FORMAT = 2
+BATCH_SIZE = 1000
+OPTION_TYPES = ('multiple_choice_single', 'multiple_choice_multiple', 'true_false')
+MAX_CHOICES = 50  # Distinct choices counted per question
+
+
+class _ItemSums:
+    """Running sums for one question (x = answered correctly, t = student's total points)"""
+
+    __slots__ = ('n', 'sx', 'st', 'stt', 'sxt', 'answered', 'weight', 'q_type', 'choices')
+
+    def __init__(self):
+        self.n = 0          # Auto-graded submissions
+        self.sx = 0.0
+        self.st = 0.0
+        self.stt = 0.0
+        self.sxt = 0.0
+        self.answered = 0
+        self.weight = 1
+        self.q_type = ''
+        self.choices: Dict[str, int] = {}
+
+    def to_state(self) -> List:
+        return [self.n, self.sx, self.st, self.stt, self.sxt, self.answered, self.weight, self.q_type, self.choices]
+
+    @classmethod
+    def from_state(cls, state: List) -> '_ItemSums':
+        item = cls()
+        (item.n, item.sx, item.st, item.stt, item.sxt, item.answered, item.weight,
+         item.q_type, item.choices) = state
+        return item
+
+    def point_biserial(self) -> Optional[float]:
+        """Correlation of x with the rest score t - weight * x (None when either is constant)"""
+        n = self.n
+        if n < 2:
+            return None
+        w = self.weight
+        sr = self.st - w * self.sx
+        srr = self.stt - 2 * w * self.sxt + w * w * self.sx  # x is 0/1, so x*x = x
+        sxr = self.sxt - w * self.sx
+        p = self.sx / n
+        var_x = p * (1 - p)
+        var_r = srr / n - (sr / n) ** 2
+        if var_x <= 0 or var_r <= 1e-12:
+            return None
+        return (sxr / n - p * sr / n) / math.sqrt(var_x * var_r)
+
+
+class ItemAnalysis:
+    """Sufficient statistics for item analysis, updated a batch at a time"""
+
+    def __init__(self):
+        self.count = 0
+        self.sum_total = 0.0
+        self.sum_total_sq = 0.0
+        self.items: List[_ItemSums] = []
+        self.question_ids: List[str] = []  # Question id of each item, in order first seen
+        self._columns: Dict[str, int] = {}
+        self.last_id = 0
+        self.revision = 0
+        self.quiz_version = None  # Version of the newest submission (labels the report)
+
+    def add_batch(self, submissions: Iterable[Dict]):
+        """Fold in submissions as yielded by ResultsStore.iter_scores"""
+        totals = []
+        correct_rows = []
+        graded_rows = []
+        for submission in submissions:
+            question_results = submission['score'].get('question_results', [])
+            columns = [self._column(result_question_key(result)) for result in question_results]
+            correct = [0] * len(self.items)
+            graded = [0] * len(self.items)
+            for j, result in zip(columns, question_results):
+                item = self.items[j]
+                item.weight = result.get('points_possible', item.weight)
+                item.q_type = result.get('type', item.q_type)
+                if result.get('correct') is not None:
+                    graded[j] = 1
+                    correct[j] = 1 if result['correct'] else 0
+                if 'user_answer' in result:
+                    item.answered += 1
+                    if item.q_type in OPTION_TYPES:
+                        self._count_choices(item, result['user_answer'])
+            totals.append(float(submission['score'].get('earned_points', 0)))
+            correct_rows.append(correct)
+            graded_rows.append(graded)
+            self.last_id = max(self.last_id, submission.get('id', 0))
+            self.quiz_version = submission.get('quiz_version', self.quiz_version)
+
+        if not totals:
+            return
+        k = len(self.items)
+        self.count += len(totals)
+        self.sum_total += sum(totals)
+        self.sum_total_sq += sum(t * t for t in totals)
+
+        if np is not None:
+            # One matrix product per sum instead of a Python loop over every cell
+            x = np.zeros((len(totals), k))
+            g = np.zeros((len(totals), k))
+            for s, (correct, graded) in enumerate(zip(correct_rows, graded_rows)):
+                x[s, :len(correct)] = correct
+                g[s, :len(graded)] = graded
+            t = np.array(totals)
+            x *= g
+            columns = zip(g.sum(0), x.sum(0), g.T @ t, g.T @ (t * t), x.T @ t)
+            for item, (n, sx, st, stt, sxt) in zip(self.items, columns):
+                item.n += int(n)
+                item.sx += float(sx)
+                item.st += float(st)
+                item.stt += float(stt)
+                item.sxt += float(sxt)
+            return
+
+        for correct, graded, t in zip(correct_rows, graded_rows, totals):
+            for item, x, is_graded in zip(self.items, correct, graded):
+                if is_graded:
+                    item.n += 1
+                    item.sx += x
+                    item.st += t
+                    item.stt += t * t
+                    item.sxt += x * t
+
+    def _column(self, question_id: str) -> int:
+        """Item index of a question, added on first sight (items follow questions across reorders)"""
+        j = self._columns.get(question_id)
+        if j is None:
+            j = self._columns[question_id] = len(self.items)
+            self.items.append(_ItemSums())
+            self.question_ids.append(question_id)
+        return j
+
+    @staticmethod
+    def _count_choices(item: _ItemSums, answer):
+        for choice in (answer if isinstance(answer, list) else [answer]):
+            choice = str(choice).strip()
+            if choice in item.choices or len(item.choices) < MAX_CHOICES:
+                item.choices[choice] = item.choices.get(choice, 0) + 1
+
+    def cronbach_alpha(self) -> Optional[float]:
+        """Internal consistency over the auto-graded questions (None below two questions)"""
+        graded = [item for item in self.items if item.n]
+        k = len(graded)
+        if k < 2 or self.count < 2:
+            return None
+        mean = self.sum_total / self.count
+        var_total = self.sum_total_sq / self.count - mean * mean
+        if var_total <= 1e-12:
+            return None
+        var_items = 0.0
+        for item in graded:
+            p = item.sx / item.n
+            var_items += item.weight * item.weight * p * (1 - p)
+        return k / (k - 1) * (1 - var_items / var_total)
+
+    def report(self, questions: Optional[List[Dict]] = None) -> Dict:
+        """
+        The analysis as plain data; questions (of the answer key the scores come from) add text and mark correct choices
+
+        Items follow the order of questions, matched by question id; items
+        of questions no longer in it come last.
+        """
+        by_id = {question_key(question, i): question for i, question in enumerate(questions or [])}
+        order = [self._columns[key] for key in by_id if key in self._columns]
+        order += [j for j in range(len(self.items)) if j not in set(order)]
+        items = []
+        for num, j in enumerate(order, 1):
+            item = self.items[j]
+            question = by_id.get(self.question_ids[j], {})
+            correct_answer = question.get('correct_answer')
+            correct_set = {str(a).strip() for a in correct_answer} if isinstance(correct_answer, list) \
+                else {str(correct_answer).strip()} if correct_answer is not None else set()
+            choices = {option: 0 for option in question.get('options', [])}
+            choices.update(item.choices)
+            items.append({
+                'question_num': num,
+                'question_id': self.question_ids[j],
+                'text': question.get('text', ''),
+                'type': item.q_type,
+                'answered': item.answered,
+                'graded': item.n,
+                'difficulty': item.sx / item.n if item.n else None,
+                'point_biserial': item.point_biserial(),
+                'choices': [{
+                    'choice': choice,
+                    'count': count,
+                    'share': count / item.answered if item.answered else 0.0,
+                    'correct': choice in correct_set
+                } for choice, count in sorted(choices.items(), key=lambda c: -c[1])]
+            })
+        return {
+            'submissions': self.count,
+            'quiz_version': self.quiz_version,
+            'cronbach_alpha': self.cronbach_alpha(),
+            'items': items
+        }
+
+    def to_state(self) -> Dict:
+        return {
+            'format': CACHE_FORMAT,
+            'count': self.count,
+            'sum_total': self.sum_total,
+            'sum_total_sq': self.sum_total_sq,
+            'items': [item.to_state() for item in self.items],
+            'question_ids': self.question_ids,
+            'last_id': self.last_id,
+            'revision': self.revision,
+            'quiz_version': self.quiz_version
+        }
+
+    @classmethod
+    def from_state(cls, state: Dict) -> 'ItemAnalysis':
+        analysis = cls()
+        analysis.count = state['count']
+        analysis.sum_total = state['sum_total']
+        analysis.sum_total_sq = state['sum_total_sq']
+        analysis.items = [_ItemSums.from_state(item) for item in state['items']]
+        analysis.question_ids = state['question_ids']
+        analysis._columns = {question_id: j for j, question_id in enumerate(analysis.question_ids)}
+        analysis.last_id = state['last_id']
+        analysis.revision = state['revision']
+        analysis.quiz_version = state['quiz_version']
+        return analysis
+
+
+def analyze_quiz(quiz_name: str, results_dir: str = RESULTS_DIR) -> Dict:
+    """
+    Item analysis report of a quiz's stored submissions
+
+    Starts from the cached sums, folds in submissions added since, and
+    saves the sums back.
+    """
+    store = get_results_store(quiz_name, results_dir)
+    revision = store.scores_revision()
+    state = store.load_cache(CACHE_NAME)
+    if state and state.get('format') == CACHE_FORMAT and state.get('revision') == revision:
+        analysis = ItemAnalysis.from_state(state)
+    else:
+        analysis = ItemAnalysis()
+        analysis.revision = revision
+
+    added = 0
+    batch = []
+    for submission in store.iter_scores(analysis.last_id):
+        batch.append(submission)
+        if len(batch) >= BATCH_SIZE:
+            analysis.add_batch(batch)
+            added += len(batch)
+            batch = []
+    analysis.add_batch(batch)
+    added += len(batch)
+    if added:
+        store.save_cache(CACHE_NAME, analysis.to_state())
+        logger.info(f"Item analysis of {quiz_name}: {added} new submissions ({analysis.count} total)")
+
+    # Correct choices are marked with the key the scores come from - after a regrade
+    # that is the regraded version, not the one the newest submission was given on
+    version = store.get_version(store.graded_version(analysis.last_id, analysis.quiz_version)) \
+        if analysis.quiz_version else None
+    return analysis.report(version['questions'] if version else None)
+
+
+def _format(value: Optional[float], digits: int = 2) -> str:
+    return '-' if value is None else f"{value:.{digits}f}"
+
+
+def main(argv: List[str]) -> int:
+    """Command line entry point"""
+    args = [a for a in argv if not a.startswith('--')]
+    json_path = None
+    if '--json' in argv:
+        index = argv.index('--json')
+        json_path = argv[index + 1] if index + 1 < len(argv) else None
+        args = [a for a in args if a != json_path]
+    if len(args) != 1:
+        print("Usage: python -m server.item_analysis <quiz_name> [--json report.json]")
+        return 1
+
+    logging.basicConfig(level=logging.INFO)
+    report = analyze_quiz(args[0].replace('.json', ''))
+    print(f"{report['submissions']} submissions, Cronbach's alpha {_format(report['cronbach_alpha'])}")
+    print(f"\n{'question':<10}{'answered':>10}{'p-value':>10}{'r_pb':>8}  most chosen")
+    for item in report['items']:
+        top = ', '.join(f"{c['choice'][:20]}{'*' if c['correct'] else ''} {c['share']:.0%}"
+                        for c in item['choices'][:3])
+        print(f"{item['question_num']:<10}{item['answered']:>10}{_format(item['difficulty']):>10}"
+              f"{_format(item['point_biserial']):>8}  {top}")
+    if json_path:
+        with open(json_path, 'w', encoding='utf-8') as f:
+            json.dump(report, f, indent=2, ensure_ascii=False)
+        print(f"\nReport written to {json_path}")
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main(sys.argv[1:]))
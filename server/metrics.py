@@ -0,0 +1,283 @@
+"""
+In-process metrics for the quiz server
+
+Counters, fixed-bucket histograms and callback gauges, rendered in the
+Prometheus text format for /metrics and summarized to the log at a fixed
+interval. Recording is a dict lookup, a bisect and a few additions under
+a per-metric lock, so instrumentation stays on in production.
+
+Metrics are per process: with several worker processes each worker
+reports its own counters (gauges backed by shared state, such as live
+sessions, agree across workers).
+"""
+import bisect
+import logging
+import os
+import threading
+import time
+from typing import Callable, Dict, List, Optional, Sequence, Tuple
+
+logger = logging.getLogger(__name__)
+
+# Seconds - request, grading and write latencies all fall in this range
+DEFAULT_BUCKETS = (0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+SUMMARY_INTERVAL = 60.0  # Seconds between log summaries (QUIZ_METRICS_INTERVAL, 0 disables)
+
+LabelValues = Tuple[str, ...]
+
+
+def _format_labels(names: Sequence[str], values: LabelValues, extra: str = '') -> str:
+    pairs = [f'{name}="{value}"' for name, value in zip(names, values)]
+    if extra:
+        pairs.append(extra)
+    return '{' + ','.join(pairs) + '}' if pairs else ''
+
+
+def _format_value(value: float) -> str:
+    if value == float('inf'):
+        return '+Inf'
+    return repr(float(value)) if isinstance(value, float) else str(value)
+
+
+def _format_bound(value: Optional[float], unit: str) -> str:
+    if value is None:
+        return 'inf'
+    return f"{value * 1000:g}ms" if unit == 'seconds' else f"{value:g}"
+
+
+class Counter:
+    """Monotonic counter, optionally split by label values"""
+
+    kind = 'counter'
+
+    def __init__(self, name: str, help_text: str, labels: Sequence[str] = ()):
+        self.name = name
+        self.help = help_text
+        self.labels = tuple(labels)
+        self._values: Dict[LabelValues, float] = {}
+        self._lock = threading.Lock()
+
+    def inc(self, *label_values: str, amount: float = 1):
+        with self._lock:
+            self._values[label_values] = self._values.get(label_values, 0) + amount
+
+    def total(self) -> float:
+        with self._lock:
+            return sum(self._values.values())
+
+    def render(self) -> List[str]:
+        with self._lock:
+            values = sorted(self._values.items())
+        return [f"{self.name}{_format_labels(self.labels, key)} {_format_value(value)}"
+                for key, value in values]
+
+
+class _HistogramSeries:
+    """Bucket counts of one label combination"""
+
+    __slots__ = ('counts', 'sum', 'count')
+
+    def __init__(self, size: int):
+        self.counts = [0] * size  # Non-cumulative; the last slot is +Inf
+        self.sum = 0.0
+        self.count = 0
+
+
+class Histogram:
+    """Fixed-bucket histogram, optionally split by label values"""
+
+    kind = 'histogram'
+
+    def __init__(self, name: str, help_text: str, labels: Sequence[str] = (),
+                 buckets: Sequence[float] = DEFAULT_BUCKETS, unit: str = 'seconds'):
+        self.name = name
+        self.help = help_text
+        self.labels = tuple(labels)
+        self.buckets = tuple(sorted(buckets))
+        self.unit = unit  # Only used to format log summaries
+        self._series: Dict[LabelValues, _HistogramSeries] = {}
+        self._lock = threading.Lock()
+
+    def observe(self, value: float, *label_values: str):
+        index = bisect.bisect_left(self.buckets, value)
+        with self._lock:
+            series = self._series.get(label_values)
+            if series is None:
+                series = self._series[label_values] = _HistogramSeries(len(self.buckets) + 1)
+            series.counts[index] += 1
+            series.sum += value
+            series.count += 1
+
+    def snapshot(self) -> Dict[LabelValues, Tuple[List[int], float, int]]:
+        """Copy of {label values: (bucket counts, sum, count)}"""
+        with self._lock:
+            return {key: (list(s.counts), s.sum, s.count) for key, s in self._series.items()}
+
+    def quantile(self, q: float, counts: List[int]) -> Optional[float]:
+        """Upper bound of the bucket holding quantile q (None if empty or past the last bucket)"""
+        total = sum(counts)
+        if not total:
+            return None
+        rank = q * total
+        seen = 0
+        for bound, count in zip(self.buckets, counts):
+            seen += count
+            if seen >= rank:
+                return bound
+        return None
+
+    def render(self) -> List[str]:
+        lines = []
+        for key, (counts, total, count) in sorted(self.snapshot().items()):
+            cumulative = 0
+            for bound, bucket_count in zip(self.buckets + (float('inf'),), counts):
+                cumulative += bucket_count
+                le = f'le="{_format_value(bound)}"'
+                lines.append(f"{self.name}_bucket{_format_labels(self.labels, key, le)} {cumulative}")
+            lines.append(f"{self.name}_sum{_format_labels(self.labels, key)} {_format_value(total)}")
+            lines.append(f"{self.name}_count{_format_labels(self.labels, key)} {count}")
+        return lines
+
+
+class Gauge:
+    """Value read from a callback when metrics are collected"""
+
+    kind = 'gauge'
+
+    def __init__(self, name: str, help_text: str, callback: Callable[[], float]):
+        self.name = name
+        self.help = help_text
+        self.callback = callback
+
+    def value(self) -> Optional[float]:
+        try:
+            return self.callback()
+        except Exception as e:
+            logger.debug("Gauge %s unavailable: %s", self.name, e)
+            return None
+
+    def render(self) -> List[str]:
+        value = self.value()
+        return [] if value is None else [f"{self.name} {_format_value(value)}"]
+
+
+class MetricsRegistry:
+    """Named metrics of this process"""
+
+    def __init__(self):
+        self._metrics: Dict[str, object] = {}
+        self._lock = threading.Lock()
+        self._reporter: Optional[threading.Thread] = None
+        self._reporter_pid = None
+        self._last: Dict[str, object] = {}  # Values at the previous summary
+
+    def _register(self, metric):
+        with self._lock:
+            existing = self._metrics.get(metric.name)
+            if existing is not None:
+                return existing
+            self._metrics[metric.name] = metric
+            return metric
+
+    def counter(self, name: str, help_text: str, labels: Sequence[str] = ()) -> Counter:
+        return self._register(Counter(name, help_text, labels))
+
+    def histogram(self, name: str, help_text: str, labels: Sequence[str] = (),
+                  buckets: Sequence[float] = DEFAULT_BUCKETS, unit: str = 'seconds') -> Histogram:
+        return self._register(Histogram(name, help_text, labels, buckets, unit))
+
+    def gauge(self, name: str, help_text: str, callback: Callable[[], float]) -> Gauge:
+        """Register (or re-point) a gauge read from callback"""
+        with self._lock:
+            gauge = self._metrics[name] = Gauge(name, help_text, callback)
+            return gauge
+
+    def get(self, name: str):
+        return self._metrics.get(name)
+
+    def render(self) -> str:
+        """All metrics in the Prometheus text exposition format"""
+        with self._lock:
+            metrics = list(self._metrics.values())
+        lines = []
+        for metric in metrics:
+            lines.append(f"# HELP {metric.name} {metric.help}")
+            lines.append(f"# TYPE {metric.name} {metric.kind}")
+            lines.extend(metric.render())
+        return '\n'.join(lines) + '\n'
+
+    def summary(self, elapsed: float) -> str:
+        """
+        One-line digest of the last elapsed seconds
+
+        Counters show their total and rate, histograms the count and
+        approximate p50/p95 of observations since the previous summary,
+        gauges their current value.
+        """
+        with self._lock:
+            metrics = list(self._metrics.values())
+        elapsed = max(elapsed, 1e-9)
+        parts = []
+        for metric in metrics:
+            if isinstance(metric, Counter):
+                total = metric.total()
+                previous = self._last.get(metric.name, 0)
+                self._last[metric.name] = total
+                parts.append(f"{metric.name}={total:g} ({(total - previous) / elapsed:.1f}/s)")
+            elif isinstance(metric, Histogram):
+                for key, (counts, _, _) in sorted(metric.snapshot().items()):
+                    name = metric.name + _format_labels(metric.labels, key)
+                    previous = self._last.get(name)
+                    self._last[name] = counts
+                    if previous is not None:
+                        counts = [now - before for now, before in zip(counts, previous)]
+                    if not sum(counts):
+                        continue
+                    p50, p95 = metric.quantile(0.5, counts), metric.quantile(0.95, counts)
+                    parts.append(f"{name} n={sum(counts)} p50<={_format_bound(p50, metric.unit)} "
+                                 f"p95<={_format_bound(p95, metric.unit)}")
+            else:
+                value = metric.value()
+                if value is not None:
+                    parts.append(f"{metric.name}={value:g}")
+        return '; '.join(parts)
+
+    def start_reporter(self, interval: float):
+        """
+        Log a summary every interval seconds
+
+        Safe to call on every request: the thread is started once per
+        process (forked workers start their own).
+        """
+        if interval <= 0 or (self._reporter is not None and self._reporter_pid == os.getpid()):
+            return
+        with self._lock:
+            if self._reporter is not None and self._reporter_pid == os.getpid():
+                return
+
+            def run():
+                last = time.monotonic()
+                while True:
+                    time.sleep(interval)
+                    now = time.monotonic()
+                    try:
+                        logger.info("Metrics: %s", self.summary(now - last))
+                    except Exception as e:
+                        logger.error(f"Error summarizing metrics: {e}", exc_info=True)
+                    last = now
+
+            self._reporter = threading.Thread(target=run, name='metrics-reporter', daemon=True)
+            self._reporter_pid = os.getpid()
+            self._reporter.start()
+
+
+# Process-wide registry used by the server modules
+METRICS = MetricsRegistry()
+
+
+def summary_interval() -> float:
+    """Log summary interval from QUIZ_METRICS_INTERVAL (seconds, 0 disables)"""
+    try:
+        return float(os.environ.get('QUIZ_METRICS_INTERVAL', SUMMARY_INTERVAL))
+    except ValueError:
+        return SUMMARY_INTERVAL
@@ -0,0 +1,380 @@
+"""
+Question bank: search and random draws over every quiz's questions
+
+The bank indexes the questions of every quiz file in data/. Question
+bodies live in the quiz store (see server.quiz_store), once per content
+hash; the bank adds, in the same database:
+
+- an inverted index from each word of a question's text and options to
+  the questions containing it
+- each question's tags (the optional "tags" list of a question) and type
+- which quizzes use each question, and where
+
+Only questions that pass validate_question are indexed, so a broken
+question in one quiz file never reaches another quiz through a draw.
+Search narrows the candidates with these indexes and reads only the
+questions it returns. Quiz files are re-read only when their mtime or
+size changed, so keeping the bank current costs a stat per quiz file.
+
+A quiz can draw some of its questions from the bank ("bank_draws", see
+resolve_draws): when it is loaded the matching questions become a pool,
+and each session gets its own random selection from the pool (see
+server.variants).
+
+Usage:
+    python -m server.question_bank index
+    python -m server.question_bank search [words] [--tag TAG] [--type TYPE] [--quiz NAME]
+"""
+import argparse
+import json
+import logging
+import os
+import random
+import re
+import sqlite3
+import sys
+import threading
+from typing import Dict, Iterable, List, Optional
+
+from server.quiz_store import DATA_DIR, QuizStore, get_quiz_store, question_hash
+from server.utils import validate_question
+
+logger = logging.getLogger(__name__)
+
+POOL_LIMIT = 500  # Most questions one draw puts in a quiz's pool (each session picks from it)
+_WORD = re.compile(r'\w+')
+
+_SCHEMA = """
+CREATE TABLE IF NOT EXISTS bank_files (
+    filename TEXT PRIMARY KEY,
+    quiz_name TEXT NOT NULL,
+    mtime_ns INTEGER NOT NULL,
+    size INTEGER NOT NULL
+);
+CREATE TABLE IF NOT EXISTS bank_questions (
+    id INTEGER PRIMARY KEY AUTOINCREMENT,
+    hash TEXT NOT NULL UNIQUE,
+    type TEXT NOT NULL
+);
+CREATE INDEX IF NOT EXISTS idx_bank_questions_type ON bank_questions(type);
+CREATE TABLE IF NOT EXISTS bank_entries (
+    quiz_name TEXT NOT NULL,
+    hash TEXT NOT NULL,
+    position INTEGER NOT NULL,
+    PRIMARY KEY (quiz_name, hash)
+) WITHOUT ROWID;
+CREATE INDEX IF NOT EXISTS idx_bank_entries_hash ON bank_entries(hash);
+CREATE TABLE IF NOT EXISTS bank_terms (
+    term TEXT NOT NULL,
+    hash TEXT NOT NULL,
+    PRIMARY KEY (term, hash)
+) WITHOUT ROWID;
+CREATE TABLE IF NOT EXISTS bank_tags (
+    tag TEXT NOT NULL,
+    hash TEXT NOT NULL,
+    PRIMARY KEY (tag, hash)
+) WITHOUT ROWID;
+"""
+
+
+def question_terms(question: Dict) -> List[str]:
+    """Words a question is found by: its text and options, lowercased"""
+    words = _WORD.findall(str(question.get('text', '')).lower())
+    for option in question.get('options', []) or []:
+        words.extend(_WORD.findall(str(option).lower()))
+    return sorted(set(words))
+
+
+def question_tags(question: Dict) -> List[str]:
+    """A question's tags, lowercased"""
+    return sorted({str(tag).strip().lower() for tag in question.get('tags', []) or [] if str(tag).strip()})
+
+
+class QuestionBank:
+    """Indexes of the questions in a data folder's quiz files"""
+
+    def __init__(self, data_dir: str = DATA_DIR, quiz_store: Optional[QuizStore] = None):
+        self.data_dir = data_dir
+        self.quiz_store = quiz_store or get_quiz_store(data_dir)
+        self._local = threading.local()
+        self._sync_lock = threading.Lock()
+        conn = self._connect()
+        with conn:
+            conn.executescript(_SCHEMA)
+
+    def _connect(self) -> sqlite3.Connection:
+        """Return this thread's connection (re-opened after a fork)"""
+        conn = getattr(self._local, 'conn', None)
+        if conn is None or self._local.pid != os.getpid():
+            conn = sqlite3.connect(self.quiz_store.path, timeout=30)
+            conn.execute('PRAGMA journal_mode=WAL')
+            conn.execute('PRAGMA synchronous=NORMAL')
+            conn.row_factory = sqlite3.Row
+            self._local.conn = conn
+            self._local.pid = os.getpid()
+        return conn
+
+    def sync_files(self) -> Dict:
+        """
+        Bring the bank up to date with the quiz files in the data folder
+
+        Only files whose mtime or size changed since they were indexed are
+        read; quizzes whose file is gone leave the bank. Returns the number
+        of quiz files indexed and removed.
+        """
+        summary = {'indexed': 0, 'removed': 0}
+        with self._sync_lock:
+            conn = self._connect()
+            known = {row['filename']: row for row in conn.execute(
+                'SELECT filename, quiz_name, mtime_ns, size FROM bank_files')}
+            changed = []
+            seen = set()
+            with os.scandir(self.data_dir) as entries:
+                for entry in entries:
+                    if not entry.name.endswith('.json') or not entry.is_file():
+                        continue
+                    seen.add(entry.name)
+                    stat = entry.stat()
+                    record = known.get(entry.name)
+                    if record is None or record['mtime_ns'] != stat.st_mtime_ns or record['size'] != stat.st_size:
+                        changed.append((entry.name, stat))
+
+            for filename, stat in sorted(changed):
+                try:
+                    with open(os.path.join(self.data_dir, filename), 'r', encoding='utf-8') as f:
+                        quiz_data = json.load(f)
+                    questions = _valid_questions(quiz_data.get('questions', []), filename)
+                except (OSError, ValueError, AttributeError) as e:
+                    logger.warning(f"Question bank skipped {filename}: {e}")
+                    questions = []
+                self.quiz_store.put_questions(questions)
+                with conn:
+                    # Keyed by file name: that is how quizzes are loaded
+                    self._index_quiz(conn, filename[:-len('.json')], questions)
+                    conn.execute('INSERT OR REPLACE INTO bank_files (filename, quiz_name, mtime_ns, size) '
+                                 'VALUES (?, ?, ?, ?)',
+                                 (filename, filename[:-len('.json')], stat.st_mtime_ns, stat.st_size))
+                summary['indexed'] += 1
+
+            for filename in set(known) - seen:
+                with conn:
+                    self._index_quiz(conn, known[filename]['quiz_name'], [])
+                    conn.execute('DELETE FROM bank_files WHERE filename = ?', (filename,))
+                summary['removed'] += 1
+
+        if summary['indexed'] or summary['removed']:
+            logger.info(f"Question bank: {summary['indexed']} quiz files indexed, {summary['removed']} removed")
+        return summary
+
+    def _index_quiz(self, conn: sqlite3.Connection, quiz_name: str, questions: List[Dict]):
+        """Replace the bank's entries for one quiz (its questions are already in the quiz store)"""
+        hashes = [question_hash(question) for question in questions]
+        old = {row['hash'] for row in conn.execute('SELECT hash FROM bank_entries WHERE quiz_name = ?',
+                                                   (quiz_name,))}
+        conn.execute('DELETE FROM bank_entries WHERE quiz_name = ?', (quiz_name,))
+        for position, (h, question) in enumerate(zip(hashes, questions)):
+            conn.execute('INSERT OR IGNORE INTO bank_entries (quiz_name, hash, position) VALUES (?, ?, ?)',
+                         (quiz_name, h, position))
+            if conn.execute('INSERT OR IGNORE INTO bank_questions (hash, type) VALUES (?, ?)',
+                            (h, str(question.get('type', '')))).rowcount:
+                conn.executemany('INSERT OR IGNORE INTO bank_terms (term, hash) VALUES (?, ?)',
+                                 [(term, h) for term in question_terms(question)])
+                conn.executemany('INSERT OR IGNORE INTO bank_tags (tag, hash) VALUES (?, ?)',
+                                 [(tag, h) for tag in question_tags(question)])
+        # Questions no quiz uses any more leave the indexes (their bodies stay in the quiz store)
+        for h in old - set(hashes):
+            if conn.execute('SELECT 1 FROM bank_entries WHERE hash = ? LIMIT 1', (h,)).fetchone() is None:
+                for table in ('bank_questions', 'bank_terms', 'bank_tags'):
+                    conn.execute(f'DELETE FROM {table} WHERE hash = ?', (h,))
+
+    def _match(self, text: str = '', tags: Iterable[str] = (), types: Iterable[str] = (),
+               quizzes: Iterable[str] = ()):
+        """WHERE clause and parameters selecting bank_questions q by every given criterion"""
+        clauses = []
+        params: List = []
+        for word in _WORD.findall(text.lower()):
+            # Prefix match, so a search finds words as they are typed
+            clauses.append('q.hash IN (SELECT hash FROM bank_terms WHERE term >= ? AND term < ?)')
+            params.extend((word, word + '\uffff'))
+        for tag in {str(tag).strip().lower() for tag in tags if str(tag).strip()}:
+            clauses.append('q.hash IN (SELECT hash FROM bank_tags WHERE tag = ?)')
+            params.append(tag)
+        types = list(types)
+        if types:
+            clauses.append(f"q.type IN ({','.join('?' * len(types))})")
+            params.extend(types)
+        quizzes = list(quizzes)
+        if quizzes:
+            clauses.append(f"q.hash IN (SELECT hash FROM bank_entries WHERE quiz_name IN "
+                           f"({','.join('?' * len(quizzes))}))")
+            params.extend(quizzes)
+        return (' WHERE ' + ' AND '.join(clauses)) if clauses else '', params
+
+    def matching_hashes(self, text: str = '', tags: Iterable[str] = (), types: Iterable[str] = (),
+                        quizzes: Iterable[str] = ()) -> List[str]:
+        """Hashes of every matching question, in the order they entered the bank"""
+        where, params = self._match(text, tags, types, quizzes)
+        return [row['hash'] for row in self._connect().execute(
+            f'SELECT q.hash FROM bank_questions q{where} ORDER BY q.id', params)]
+
+    def count(self, text: str = '', tags: Iterable[str] = (), types: Iterable[str] = (),
+              quizzes: Iterable[str] = ()) -> int:
+        where, params = self._match(text, tags, types, quizzes)
+        return self._connect().execute(f'SELECT COUNT(*) FROM bank_questions q{where}', params).fetchone()[0]
+
+    def search(self, text: str = '', tags: Iterable[str] = (), types: Iterable[str] = (),
+               quizzes: Iterable[str] = (), limit: int = 50, offset: int = 0) -> List[Dict]:
+        """
+        One page of matching questions
+
+        Every word of text must start a word of the question's text or
+        options, and the question must have every tag; types and quizzes
+        match any. Each result is {'hash', 'question', 'quizzes'}.
+        """
+        where, params = self._match(text, tags, types, quizzes)
+        conn = self._connect()
+        hashes = [row['hash'] for row in conn.execute(
+            f'SELECT q.hash FROM bank_questions q{where} ORDER BY q.id LIMIT ? OFFSET ?', params + [limit, offset])]
+        questions = self.quiz_store.get_questions_by_hash(hashes)
+        results = []
+        for h in hashes:
+            used_in = [row['quiz_name'] for row in conn.execute(
+                'SELECT quiz_name FROM bank_entries WHERE hash = ? ORDER BY quiz_name', (h,))]
+            results.append({'hash': h, 'question': questions.get(h, {}), 'quizzes': used_in})
+        return results
+
+    def draw(self, count: int, text: str = '', tags: Iterable[str] = (), types: Iterable[str] = (),
+             quizzes: Iterable[str] = (), rng: Optional[random.Random] = None) -> List[Dict]:
+        """
+        count random questions matching the criteria (fewer if fewer match)
+
+        Only the matching hashes are read to make the choice, and only the
+        drawn questions' bodies.
+        """
+        hashes = self.matching_hashes(text, tags, types, quizzes)
+        chosen = (rng or random).sample(hashes, min(count, len(hashes)))
+        questions = self.quiz_store.get_questions_by_hash(chosen)
+        return [questions[h] for h in chosen if h in questions]
+
+
+def _valid_questions(questions: List, filename: str) -> List[Dict]:
+    """The questions of a quiz file that are valid on their own (the rest are logged and left out)"""
+    valid = []
+    for i, question in enumerate(questions):
+        is_valid, error_msg = validate_question(question, i + 1)
+        if is_valid:
+            valid.append(question)
+        else:
+            logger.warning(f"Question bank skipped a question of {filename}: {error_msg}")
+    return valid
+
+
+_banks: Dict[str, QuestionBank] = {}
+_banks_lock = threading.Lock()
+
+
+def get_question_bank(data_dir: str = DATA_DIR) -> QuestionBank:
+    """Return the shared QuestionBank of a data folder, opening it on first use"""
+    key = os.path.abspath(data_dir)
+    bank = _banks.get(key)
+    if bank is None:
+        with _banks_lock:
+            bank = _banks.get(key)
+            if bank is None:
+                bank = _banks[key] = QuestionBank(data_dir)
+    return bank
+
+
+def resolve_draws(quiz_data: Dict, bank: Optional[QuestionBank] = None,
+                  pool_limit: int = POOL_LIMIT, sync: bool = True) -> Dict:
+    """
+    The quiz as served: its own questions followed by a pool for each bank draw
+
+    A quiz file can list draws, each with a count and the criteria of
+    QuestionBank.search (text, tags, types, quizzes):
+
+        "bank_draws": [{"count": 5, "tags": ["fractions"], "types": ["multiple_choice_single"]}]
+
+    Every question matching a draw goes into its pool (at most pool_limit,
+    chosen the same way on every load), and draw_pools records where each
+    pool is and how many questions a session gets from it. Questions
+    already in the quiz, or in an earlier pool, are left out. Raises
+    ValueError if a draw matches fewer questions than its count. Without
+    sync the bank is used as last indexed (nothing is written).
+    """
+    draws = quiz_data.get('bank_draws')
+    if not draws:
+        return quiz_data
+    bank = bank or get_question_bank()
+    if sync:
+        bank.sync_files()
+
+    questions = list(quiz_data.get('questions', []))
+    taken_ids = {q['id'] for q in questions if q.get('id')}
+    taken_hashes = {question_hash(q) for q in questions}
+    pools = []
+    for i, draw in enumerate(draws):
+        hashes = [h for h in bank.matching_hashes(draw.get('text', ''), draw.get('tags', ()),
+                                                  draw.get('types', ()), draw.get('quizzes', ()))
+                  if h not in taken_hashes]
+        if len(hashes) > pool_limit:
+            # Seeded by quiz and draw, so reloading an unchanged bank gives the same pool
+            sampled = set(random.Random(f"{quiz_data.get('name', '')}:{i}").sample(hashes, pool_limit))
+            hashes = [h for h in hashes if h in sampled]
+        bodies = bank.quiz_store.get_questions_by_hash(hashes)
+        pool = []
+        for h in hashes:
+            question = bodies.get(h)
+            if question is None or (question.get('id') and question['id'] in taken_ids):
+                continue
+            if not validate_question(question)[0]:
+                # Indexed before the bank checked its questions
+                logger.warning(f"Draw {i + 1} of {quiz_data.get('name', '')}: skipped invalid bank question {h}")
+                continue
+            pool.append(question)
+            taken_hashes.add(h)
+            if question.get('id'):
+                taken_ids.add(question['id'])
+        if len(pool) < draw['count']:
+            raise ValueError(f"Draw {i + 1}: {len(pool)} questions in the bank match, {draw['count']} needed")
+        pools.append({'start': len(questions), 'size': len(pool), 'count': draw['count']})
+        questions.extend(pool)
+
+    resolved = dict(quiz_data)
+    resolved['questions'] = questions
+    resolved['draw_pools'] = pools
+    return resolved
+
+
+def main(argv: List[str]) -> int:
+    """Command line entry point"""
+    parser = argparse.ArgumentParser(prog='python -m server.question_bank',
+                                     description="Index and search the questions of every quiz in data/")
+    parser.add_argument('command', choices=('index', 'search'))
+    parser.add_argument('words', nargs='*', help="Words the question text or options must contain")
+    parser.add_argument('--tag', action='append', default=[], help="Required tag (repeatable)")
+    parser.add_argument('--type', action='append', default=[], help="Question type (repeatable)")
+    parser.add_argument('--quiz', action='append', default=[], help="Only questions of this quiz (repeatable)")
+    parser.add_argument('--limit', type=int, default=20)
+    args = parser.parse_args(argv)
+
+    logging.basicConfig(level=logging.INFO)
+    bank = get_question_bank()
+    summary = bank.sync_files()
+    if args.command == 'index':
+        print(f"Indexed {summary['indexed']} quiz files ({summary['removed']} removed), "
+              f"{bank.count()} questions in the bank")
+        return 0
+
+    criteria = dict(text=' '.join(args.words), tags=args.tag, types=args.type, quizzes=args.quiz)
+    print(f"{bank.count(**criteria)} matching questions")
+    for result in bank.search(limit=args.limit, **criteria):
+        question = result['question']
+        tags = f" [{', '.join(question_tags(question))}]" if question.get('tags') else ''
+        print(f"\n{result['hash']}  {question.get('type', '')}{tags}  ({', '.join(result['quizzes'])})")
+        print(f"  {question.get('text', '')}")
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main(sys.argv[1:]))
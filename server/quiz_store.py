@@ -0,0 +1,332 @@
+"""
+Content-addressed store of quiz versions
+
+A quiz file in data/ only holds the quiz as it is now. Every revision
+the builder saves or the server loads is also kept in data/quiz_store.db,
+addressed by content hash:
+
+- questions: each question once, under the hash of its JSON, shared by
+  every version and every quiz that contains it
+- versions: a quiz's questions as a list of question hashes, under the
+  hash results record as their quiz_version
+- revisions: the rest of the quiz file (title, timer, messages) and its
+  version, under the hash the server uses for hot reload
+- history: the revisions of each quiz in the order they were seen
+
+Results reference a version and look its questions up here, so a question
+is stored once however many students answered it and however many
+versions kept it. Two versions are compared by their lists of question
+hashes (see QuizStore.diff) without reading a single question.
+
+Usage:
+    python -m server.quiz_store history <quiz_name>
+    python -m server.quiz_store diff <quiz_name> [<old_version> [<new_version>]]
+"""
+import bisect
+import hashlib
+import json
+import logging
+import os
+import sqlite3
+import sys
+import threading
+from datetime import datetime
+from typing import Dict, List, Optional
+
+from server.grading import question_key
+
+logger = logging.getLogger(__name__)
+
+DATA_DIR = 'data'
+STORE_FILENAME = 'quiz_store.db'
+UNTRACKED_FIELDS = ('last_modified',)  # Changing these alone is not a new revision
+_QUERY_CHUNK = 500  # Hashes per IN (...) lookup, below SQLite's bound parameter limit
+
+_SCHEMA = """
+CREATE TABLE IF NOT EXISTS questions (
+    hash TEXT PRIMARY KEY,
+    body TEXT NOT NULL
+);
+CREATE TABLE IF NOT EXISTS versions (
+    version TEXT PRIMARY KEY,
+    questions TEXT NOT NULL,
+    question_keys TEXT NOT NULL
+);
+CREATE TABLE IF NOT EXISTS revisions (
+    revision TEXT PRIMARY KEY,
+    version TEXT NOT NULL REFERENCES versions(version),
+    settings TEXT NOT NULL
+);
+CREATE TABLE IF NOT EXISTS history (
+    id INTEGER PRIMARY KEY AUTOINCREMENT,
+    quiz_name TEXT NOT NULL,
+    revision TEXT NOT NULL REFERENCES revisions(revision),
+    saved TEXT NOT NULL
+);
+CREATE INDEX IF NOT EXISTS idx_history_quiz ON history(quiz_name, id);
+"""
+
+
+def _canonical(data) -> str:
+    """JSON that is identical for equal data, the input of every hash here"""
+    return json.dumps(data, ensure_ascii=False, sort_keys=True, separators=(',', ':'))
+
+
+def _hash(canonical: str) -> str:
+    return hashlib.sha256(canonical.encode('utf-8')).hexdigest()[:16]
+
+
+def quiz_version(quiz_data: Dict) -> str:
+    """Content hash identifying the questions a submission was graded against"""
+    return _hash(_canonical(quiz_data.get('questions', [])))
+
+
+def question_hash(question: Dict) -> str:
+    """Content hash a question is stored under"""
+    return _hash(_canonical(question))
+
+
+def quiz_revision(quiz_data: Dict) -> str:
+    """Content hash of everything in a quiz file that students or grading can see"""
+    return _hash(_canonical({key: value for key, value in quiz_data.items() if key not in UNTRACKED_FIELDS}))
+
+
+class QuizStore:
+    """Quiz revisions, versions and questions, each stored once under its hash"""
+
+    def __init__(self, data_dir: str = DATA_DIR):
+        self.path = os.path.join(data_dir, STORE_FILENAME)
+        self._local = threading.local()
+        os.makedirs(data_dir, exist_ok=True)
+        conn = self._connect()
+        with conn:
+            conn.executescript(_SCHEMA)
+
+    def _connect(self) -> sqlite3.Connection:
+        """Return this thread's connection (re-opened after a fork)"""
+        conn = getattr(self._local, 'conn', None)
+        if conn is None or self._local.pid != os.getpid():
+            conn = sqlite3.connect(self.path, timeout=30)
+            conn.execute('PRAGMA journal_mode=WAL')
+            conn.execute('PRAGMA synchronous=NORMAL')
+            conn.row_factory = sqlite3.Row
+            self._local.conn = conn
+            self._local.pid = os.getpid()
+        return conn
+
+    def close(self):
+        """Close the calling thread's connection"""
+        conn = getattr(self._local, 'conn', None)
+        if conn is not None:
+            conn.close()
+            self._local.conn = None
+
+    def _put_version(self, conn: sqlite3.Connection, questions: List[Dict]) -> str:
+        version = quiz_version({'questions': questions})
+        if conn.execute('SELECT 1 FROM versions WHERE version = ?', (version,)).fetchone():
+            return version
+        bodies = [_canonical(question) for question in questions]
+        hashes = [_hash(body) for body in bodies]
+        conn.executemany('INSERT OR IGNORE INTO questions (hash, body) VALUES (?, ?)', zip(hashes, bodies))
+        conn.execute('INSERT OR IGNORE INTO versions (version, questions, question_keys) VALUES (?, ?, ?)',
+                     (version, json.dumps(hashes),
+                      json.dumps([question_key(question, i) for i, question in enumerate(questions)])))
+        return version
+
+    def put_questions(self, questions: List[Dict]) -> str:
+        """Store a list of questions as a version and return its hash"""
+        conn = self._connect()
+        with conn:
+            return self._put_version(conn, questions)
+
+    def commit(self, quiz_data: Dict) -> str:
+        """
+        Store a quiz revision and add it to the quiz's history
+
+        Returns the version of its questions. Committing the revision the
+        quiz's history already ends with changes nothing, so the server
+        can commit every quiz it loads. A quiz as served with questions
+        drawn from the question bank only stores its questions: the
+        history is of the quiz file, not of the pools drawn for it.
+        """
+        if quiz_data.get('draw_pools'):
+            return self.put_questions(quiz_data.get('questions', []))
+        quiz_name = quiz_data.get('name', '')
+        revision = quiz_revision(quiz_data)
+        conn = self._connect()
+        # Saving or loading an unchanged quiz is the common case: one read, no write lock
+        row = conn.execute('SELECT h.revision, r.version FROM history h JOIN revisions r ON r.revision = h.revision '
+                           'WHERE h.quiz_name = ? ORDER BY h.id DESC LIMIT 1', (quiz_name,)).fetchone()
+        if row is not None and row['revision'] == revision:
+            return row['version']
+        settings = {key: value for key, value in quiz_data.items()
+                    if key != 'questions' and key not in UNTRACKED_FIELDS}
+        with conn:
+            # Under the write lock, so two processes loading the same quiz add it to the history once
+            conn.execute('BEGIN IMMEDIATE')
+            version = self._put_version(conn, quiz_data.get('questions', []))
+            conn.execute('INSERT OR IGNORE INTO revisions (revision, version, settings) VALUES (?, ?, ?)',
+                         (revision, version, _canonical(settings)))
+            last = conn.execute('SELECT revision FROM history WHERE quiz_name = ? ORDER BY id DESC LIMIT 1',
+                                (quiz_name,)).fetchone()
+            if last is not None and last['revision'] == revision:
+                return version
+            conn.execute('INSERT INTO history (quiz_name, revision, saved) VALUES (?, ?, ?)',
+                         (quiz_name, revision, quiz_data.get('last_modified') or datetime.now().isoformat()))
+        logger.info(f"Stored revision {revision} of {quiz_name} (questions version {version})")
+        return version
+
+    def _question_hashes(self, version: str) -> Optional[Dict]:
+        row = self._connect().execute('SELECT questions, question_keys FROM versions WHERE version = ?',
+                                      (version,)).fetchone()
+        if row is None:
+            return None
+        return {'hashes': json.loads(row['questions']), 'keys': json.loads(row['question_keys'])}
+
+    def get_questions(self, version: str) -> Optional[List[Dict]]:
+        """The questions of a version, in order (None if it isn't stored)"""
+        entry = self._question_hashes(version)
+        if entry is None:
+            return None
+        questions = self.get_questions_by_hash(entry['hashes'])
+        return [questions[h] for h in entry['hashes']]
+
+    def get_questions_by_hash(self, hashes: List[str]) -> Dict[str, Dict]:
+        """Stored questions by hash (hashes not stored are left out)"""
+        distinct = list(set(hashes))
+        conn = self._connect()
+        questions = {}
+        for start in range(0, len(distinct), _QUERY_CHUNK):
+            chunk = distinct[start:start + _QUERY_CHUNK]
+            rows = conn.execute(f"SELECT hash, body FROM questions WHERE hash IN ({','.join('?' * len(chunk))})",
+                                chunk)
+            questions.update((row['hash'], json.loads(row['body'])) for row in rows)
+        return questions
+
+    def load(self, revision: str) -> Optional[Dict]:
+        """The quiz data of a stored revision (None if it isn't stored)"""
+        row = self._connect().execute('SELECT version, settings FROM revisions WHERE revision = ?',
+                                      (revision,)).fetchone()
+        if row is None:
+            return None
+        quiz_data = json.loads(row['settings'])
+        quiz_data['questions'] = self.get_questions(row['version']) or []
+        return quiz_data
+
+    def history(self, quiz_name: str) -> List[Dict]:
+        """Revisions of a quiz, oldest first, with the version of their questions"""
+        rows = self._connect().execute(
+            'SELECT h.revision, h.saved, r.version FROM history h JOIN revisions r ON r.revision = h.revision '
+            'WHERE h.quiz_name = ? ORDER BY h.id', (quiz_name,))
+        return [{'revision': row['revision'], 'version': row['version'], 'saved': row['saved']} for row in rows]
+
+    def diff(self, old_version: str, new_version: str) -> Optional[Dict]:
+        """
+        How the questions changed between two versions, by question id
+
+        Returns lists of question ids (positions for quizzes without ids):
+        added, removed, changed (same id, different content) and moved
+        (kept, but outside the longest order both versions share - moving
+        one question reports just that one, and inserting or removing one
+        moves nothing); None if either version isn't stored.
+        """
+        old = self._question_hashes(old_version)
+        new = self._question_hashes(new_version)
+        if old is None or new is None:
+            return None
+        old_hashes = dict(zip(old['keys'], old['hashes']))
+        new_hashes = dict(zip(new['keys'], new['hashes']))
+        kept_new = [key for key in new['keys'] if key in old_hashes]
+        in_order = _longest_common_order(old['keys'], kept_new)
+        return {
+            'added': [key for key in new['keys'] if key not in old_hashes],
+            'removed': [key for key in old['keys'] if key not in new_hashes],
+            'changed': [key for key in new['keys'] if key in old_hashes and old_hashes[key] != new_hashes[key]],
+            'moved': [key for key in kept_new if key not in in_order]
+        }
+
+
+def _longest_common_order(old_keys: List[str], new_keys: List[str]) -> set:
+    """
+    The keys of a longest common subsequence of two key lists
+
+    Keys are unique, so this is the longest increasing run of old
+    positions taken in new order (O(n log n)). Every other key kept in
+    both lists is what moved.
+    """
+    old_positions = {key: i for i, key in enumerate(old_keys)}
+    positions = [old_positions[key] for key in new_keys if key in old_positions]
+    keys = [key for key in new_keys if key in old_positions]
+    tails: List[int] = []  # tails[k]: position in positions ending the best run of length k + 1
+    tail_values: List[int] = []
+    previous = [-1] * len(positions)
+    for i, position in enumerate(positions):
+        k = bisect.bisect_left(tail_values, position)
+        if k:
+            previous[i] = tails[k - 1]
+        if k == len(tails):
+            tails.append(i)
+            tail_values.append(position)
+        else:
+            tails[k] = i
+            tail_values[k] = position
+    in_order = set()
+    i = tails[-1] if tails else -1
+    while i >= 0:
+        in_order.add(keys[i])
+        i = previous[i]
+    return in_order
+
+
+_stores: Dict[str, QuizStore] = {}
+_stores_lock = threading.Lock()
+
+
+def get_quiz_store(data_dir: str = DATA_DIR) -> QuizStore:
+    """Return the shared QuizStore of a data folder, opening it on first use"""
+    key = os.path.abspath(data_dir)
+    store = _stores.get(key)
+    if store is None:
+        with _stores_lock:
+            store = _stores.get(key)
+            if store is None:
+                store = _stores[key] = QuizStore(data_dir)
+    return store
+
+
+def main(argv: List[str]) -> int:
+    """Command line entry point"""
+    if len(argv) < 2 or argv[0] not in ('history', 'diff') or (argv[0] == 'history' and len(argv) != 2) \
+            or len(argv) > 4:
+        print("Usage: python -m server.quiz_store history <quiz_name>\n"
+              "       python -m server.quiz_store diff <quiz_name> [<old_version> [<new_version>]]")
+        return 1
+
+    store = get_quiz_store()
+    quiz_name = argv[1].replace('.json', '')
+    history = store.history(quiz_name)
+    if argv[0] == 'history':
+        if not history:
+            print(f"No stored revisions of {quiz_name}")
+        for entry in history:
+            print(f"{entry['saved']}  revision {entry['revision']}  version {entry['version']}")
+        return 0
+
+    versions = []
+    for entry in history:
+        if not versions or versions[-1] != entry['version']:
+            versions.append(entry['version'])
+    old_version = argv[2] if len(argv) > 2 else (versions[-2] if len(versions) > 1 else None)
+    new_version = argv[3] if len(argv) > 3 else (versions[-1] if versions else None)
+    changes = store.diff(old_version, new_version) if old_version and new_version else None
+    if changes is None:
+        print(f"Need two stored versions of {quiz_name} to compare")
+        return 1
+    print(f"{quiz_name}: version {old_version} -> {new_version}")
+    for kind in ('added', 'removed', 'changed', 'moved'):
+        print(f"  {kind}: {', '.join(changes[kind]) if changes[kind] else '-'}")
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main(sys.argv[1:]))
@@ -0,0 +1,234 @@
+"""
+Registry of the quizzes one server is hosting
+
+A server process can run several quizzes at once (an exam in each of
+several rooms). Every hosted quiz is reached under its own URL prefix,
+/q/<prefix>/, and has its own session table, control events and
+deadline scheduler, so quizzes are loaded and unloaded independently and
+extending the time in one room leaves the others alone. The first quiz
+loaded is also served at the site root, as before.
+
+What does not depend on the students - the quiz data, its compiled answer
+key and the rendered page - is a QuizContent shared by every prefix that
+hosts the same revision of the same quiz, so two sections taking the same
+exam keep one copy.
+
+A hosted quiz can swap in a new revision of its file while students are
+taking it. Each session stays pinned to the revision it started on, so
+its page, timer and grading don't change under it. If the new revision
+keeps every question's identity and the quiz's timing, it is a correction
+(a typo in a question text or answer key): the old revision becomes an
+alias of the new one and the sessions in progress are migrated to it.
+
+Requests look quizzes up without locking: changes build a new mapping
+and publish it with a single assignment.
+"""
+import re
+import threading
+import time
+from datetime import datetime
+from typing import Callable, Dict, List, Optional, Tuple
+
+from server.grading import AnswerKey, compile_answer_key
+from server.quiz_store import quiz_revision
+
+PREFIX_PATTERN = re.compile(r'^[A-Za-z0-9_-]{1,64}$')
+MIGRATION_FIELDS = ('timer_minutes', 'shuffle_questions', 'shuffle_options',
+                    'draw_pools')  # Must match to migrate sessions
+
+
+def prefix_for(quiz_name: str) -> str:
+    """URL prefix for a quiz hosted under its own name"""
+    prefix = re.sub(r'[^A-Za-z0-9_-]+', '-', quiz_name).strip('-')[:64]
+    return prefix or 'quiz'
+
+
+def question_identity(question: Dict) -> Tuple:
+    """What a session relies on staying put: the question's id, type and options (answers are option text)"""
+    return (question.get('id'), question.get('type'),
+            tuple(str(option) for option in question.get('options', [])))
+
+
+def can_migrate(old: Dict, new: Dict) -> bool:
+    """True if sessions started on old can carry on under new (same questions, options and timing)"""
+    if any(old.get(field) != new.get(field) for field in MIGRATION_FIELDS):
+        return False
+    old_questions = old.get('questions', [])
+    new_questions = new.get('questions', [])
+    return len(old_questions) == len(new_questions) and all(
+        question_identity(a) == question_identity(b) for a, b in zip(old_questions, new_questions))
+
+
+class QuizContent:
+    """One revision of a quiz with its answer key and rendered page, shared by the prefixes hosting it"""
+
+    def __init__(self, name: str, data: Dict, version: str):
+        self.name = name
+        self.data = data
+        self.version = version  # Hash of the questions, recorded with each result
+        self.revision = quiz_revision(data)
+        self.answer_key: AnswerKey = compile_answer_key(data)
+        self._page: Optional[Tuple[str, str]] = None
+        self._page_lock = threading.Lock()
+
+    def page(self, render: Callable[[Dict], Tuple[str, str]]) -> Tuple[str, str]:
+        """(etag, html) of the quiz page, rendered by render(data) on first use"""
+        page = self._page
+        if page is None:
+            with self._page_lock:
+                page = self._page
+                if page is None:
+                    page = self._page = render(self.data)
+        return page
+
+
+class HostedQuiz:
+    """A quiz served under one prefix, with its own sessions, events and deadlines"""
+
+    def __init__(self, prefix: str, content: QuizContent, sessions, events, source: Optional[str] = None):
+        self.prefix = prefix
+        self.content = content  # Current revision: new sessions start on it
+        self.source = source  # Quiz file, re-read on reload
+        self.source_signature = None  # (mtime_ns, size) of source when it was last read
+        self._contents: Dict[str, QuizContent] = {content.revision: content}  # Revisions sessions are pinned to
+        self._retired: Dict[str, float] = {}  # Revision -> time.monotonic() it stopped being current
+        self.sessions = sessions
+        self.events = events
+        self.deadlines = None  # DeadlineScheduler, attached by the server once it can finalize
+        self.started = datetime.now()
+        self.session_key = f"session_id:{prefix}"  # Flask session entry, so one browser can take two quizzes
+
+    @property
+    def data(self) -> Dict:
+        return self.content.data
+
+    @property
+    def name(self) -> str:
+        return self.content.name
+
+    @property
+    def version(self) -> str:
+        return self.content.version
+
+    @property
+    def answer_key(self) -> AnswerKey:
+        return self.content.answer_key
+
+    def content_for(self, record) -> Optional[QuizContent]:
+        """The revision a session is pinned to (None if this process doesn't have it)"""
+        if record.revision is None:
+            return self.content
+        return self._contents.get(record.revision)
+
+    def swap(self, content: QuizContent, migrate: bool):
+        """
+        Make content the current revision
+        
+        With migrate, sessions pinned to the current revision (or to
+        revisions already migrated to it) move to the new one; otherwise
+        they keep theirs until they expire.
+        """
+        now = time.monotonic()
+        old = self.content
+        contents = dict(self._contents)
+        for revision in list(self._retired):
+            # Every session started on it has expired by now
+            if now - self._retired[revision] > self.sessions.ttl:
+                del self._retired[revision]
+                contents.pop(revision, None)
+        for revision, pinned in contents.items():
+            if pinned is old:
+                if migrate:
+                    contents[revision] = content
+                else:
+                    self._retired[revision] = now
+        contents[content.revision] = content
+        self._retired.pop(content.revision, None)
+        self._contents = contents
+        self.content = content
+
+    def pinned_revisions(self) -> int:
+        """Older revisions kept for sessions that started on them"""
+        return len({id(content) for content in self._contents.values() if content is not self.content})
+
+    def stop(self):
+        """Stop finalizing this quiz's sessions (it is being unloaded or replaced)"""
+        if self.deadlines is not None:
+            self.deadlines.stop()
+
+
+class QuizRegistry:
+    """Hosted quizzes by prefix, plus the shared content they are built from"""
+
+    def __init__(self):
+        self._hosted: Dict[str, HostedQuiz] = {}
+        self._default: Optional[str] = None
+        self._lock = threading.Lock()  # Serializes changes; lookups never take it
+
+    def content(self, name: str, data: Dict, version: str) -> QuizContent:
+        """The loaded content for this revision of quiz name, or a new one built from data"""
+        revision = quiz_revision(data)
+        for hosted in self._hosted.values():
+            if hosted.name == name and hosted.content.revision == revision:
+                return hosted.content
+        return QuizContent(name, data, version)
+
+    def add(self, hosted: HostedQuiz, default: bool = False) -> Optional[HostedQuiz]:
+        """Publish hosted under its prefix; returns the quiz it replaced (already stopped)"""
+        with self._lock:
+            hosted_map = dict(self._hosted)
+            replaced = hosted_map.get(hosted.prefix)
+            hosted_map[hosted.prefix] = hosted
+            self._hosted = hosted_map
+            if default or self._default is None:
+                self._default = hosted.prefix
+        if replaced is not None:
+            replaced.stop()
+        return replaced
+
+    def remove(self, prefix: str) -> Optional[HostedQuiz]:
+        """Stop hosting prefix; returns the removed quiz (already stopped)"""
+        with self._lock:
+            hosted_map = dict(self._hosted)
+            removed = hosted_map.pop(prefix, None)
+            self._hosted = hosted_map
+            if self._default == prefix:
+                self._default = next(iter(hosted_map), None)
+        if removed is not None:
+            removed.stop()
+        return removed
+
+    def get(self, prefix: Optional[str] = None) -> Optional[HostedQuiz]:
+        """The quiz hosted under prefix (the default quiz when prefix is None)"""
+        if prefix is None:
+            prefix = self._default
+            if prefix is None:
+                return None
+        return self._hosted.get(prefix)
+
+    @property
+    def default_prefix(self) -> Optional[str]:
+        return self._default
+
+    def find(self, data: Dict) -> Optional[HostedQuiz]:
+        """A hosted quiz whose content is this very quiz dict"""
+        for hosted in self._hosted.values():
+            if hosted.data is data:
+                return hosted
+        return None
+
+    def all(self) -> List[HostedQuiz]:
+        return list(self._hosted.values())
+
+    def __len__(self) -> int:
+        return len(self._hosted)
+
+    def clear(self) -> List[HostedQuiz]:
+        """Stop hosting everything; returns the removed quizzes"""
+        with self._lock:
+            removed = list(self._hosted.values())
+            self._hosted = {}
+            self._default = None
+        for hosted in removed:
+            hosted.stop()
+        return removed
@@ -0,0 +1,365 @@
+"""
+Bulk regrading of stored submissions
+
+Used after a teacher fixes a wrong correct_answer: every submission in the
+quiz's results store is loaded into a question x student answer matrix
+(answers re-keyed to the current questions by question id, or by type and
+text for versions saved before questions had ids),
+graded a whole column at a time against the compiled answer key, and the
+scores are updated in one transaction before the JSON/CSV exports are
+refreshed. Per-question results are only rebuilt for submissions whose
+points or verdicts changed.
+
+A submission is only scored on the questions it was asked: questions
+added to the quiz since don't count against it, and questions since
+removed keep the result they had. The stored answers and the quiz version
+they were given on are never changed, only the score.
+
+A dry run (--dry-run) reports the changes without writing anything: the
+quiz version is not registered and the scores and exports are left alone.
+
+Usage:
+    python -m server.regrade <quiz_name> [--dry-run]
+"""
+import json
+import logging
+import os
+import sys
+from array import array
+from typing import Dict, List, Tuple
+
+from server.grading import AnswerKey, compile_answer_key, question_key
+from server.question_bank import get_question_bank, resolve_draws
+from server.quiz_store import quiz_version
+from server.results_store import RESULTS_DIR, get_results_store, results_db_path
+from server.utils import result_question_key, validate_quiz_data
+
+try:
+    import numpy as np
+except ImportError:  # NumPy is optional - fall back to pure Python columns
+    np = None
+
+logger = logging.getLogger(__name__)
+
+DATA_DIR = 'data'
+
+MISSING = -1  # Code used in the matrix for unanswered questions
+_MISSING = object()
+
+
+def _question_identity(question: Dict) -> Tuple[str, str]:
+    """Identity used to line up a stored question with the current quiz"""
+    return question.get('type', ''), str(question.get('text', '')).strip()
+
+
+def _hashable(value):
+    """Hashable form of an answer (class included so True and 1 stay distinct)"""
+    if isinstance(value, list):
+        return list, tuple(_hashable(v) for v in value)
+    return value.__class__, value
+
+
+class AnswerMatrix:
+    """
+    Column-oriented answers for many submissions
+
+    Each question column is dictionary-encoded: codes[j][s] indexes into
+    values[j] (the distinct answers seen for question j), or is MISSING.
+    Grading a column then means grading each distinct answer once.
+    """
+
+    __slots__ = ('question_ids', 'codes', 'values', 'student_count', '_lookups')
+
+    def __init__(self, question_ids: List[str]):
+        self.question_ids = question_ids  # Answer key of each column
+        self.codes = [array('i') for _ in question_ids]
+        self.values: List[List] = [[] for _ in question_ids]
+        self.student_count = 0
+        self._lookups = [{} for _ in question_ids]
+
+    def append(self, answers: Dict):
+        """Add one submission (answers keyed by current question id)"""
+        for question_id, codes, values, lookup in zip(self.question_ids, self.codes, self.values, self._lookups):
+            answer = answers.get(question_id, _MISSING)
+            if answer is _MISSING:
+                codes.append(MISSING)
+                continue
+            key = _hashable(answer)
+            code = lookup.get(key)
+            if code is None:
+                code = lookup[key] = len(values)
+                values.append(answer)
+            codes.append(code)
+        self.student_count += 1
+
+    def grade(self, answer_key: AnswerKey):
+        """
+        Grade every column against the answer key
+
+        Returns (verdicts, earned) where verdicts[j][s] is True/False/None
+        for question j and student s, and earned[s] is the student's points.
+        """
+        n = self.student_count
+        verdicts = []
+        earned = np.zeros(n) if np is not None else [0] * n
+
+        for q, codes, values in zip(answer_key.questions, self.codes, self.values):
+            # Grade each distinct answer once; the trailing slot is for MISSING
+            distinct = [q.grader(v, q.correct) for v in values] + [False]
+            if np is not None:
+                idx = np.frombuffer(codes, dtype=np.int32) if n else np.zeros(0, dtype=np.int32)
+                table = np.array(distinct, dtype=object)
+                column = table[idx]
+                earned += (column == True) * q.weight  # noqa: E712 - elementwise on object array
+                verdicts.append(column.tolist())
+            else:
+                column = [distinct[c] for c in codes]
+                weight = q.weight
+                for s, verdict in enumerate(column):
+                    if verdict:
+                        earned[s] += weight
+                verdicts.append(column)
+
+        if np is not None:
+            earned = earned.tolist()
+        return verdicts, earned
+
+
+def _key_map(stored_questions: List[Dict], current_keys: Dict) -> Dict[str, str]:
+    """
+    Answer keys of a quiz version -> the current questions' answer keys
+
+    current_keys maps both question ids and type/text identities to the
+    current answer keys; a stored question with an id is matched by id,
+    one from before ids by its identity. Questions no longer in the quiz
+    are left out.
+    """
+    key_map = {}
+    for old_pos, question in enumerate(stored_questions):
+        if question.get('id'):
+            new_key = current_keys.get(question['id'])
+        else:
+            new_key = current_keys.get(_question_identity(question))
+        if new_key is not None:
+            key_map[question_key(question, old_pos)] = new_key
+    return key_map
+
+
+def _align_answers(answers: Dict, key_map: Dict[str, str]) -> Dict:
+    """Re-key a submission's answers from its quiz version to the current questions"""
+    return {key_map[key]: answer for key, answer in answers.items() if key in key_map}
+
+
+def _same_results(stored_results: List[Dict], key_map: Dict[str, str], graded: set,
+                  columns: Dict[str, List], weights: Dict, s: int) -> bool:
+    """Whether a submission's stored results already give each graded question its new verdict and weight"""
+    stored = {}
+    for result in stored_results:
+        key = key_map.get(result_question_key(result), result_question_key(result))
+        if key in graded:
+            stored[key] = (result.get('correct'), result.get('points_possible'))
+    if len(stored) != len(graded):
+        return False
+    return all(stored[key] == (columns[key][s], weights[key]) for key in graded)
+
+
+def regrade_quiz(quiz_name: str, data_dir: str = DATA_DIR, results_dir: str = RESULTS_DIR,
+                 dry_run: bool = False) -> Dict:
+    """
+    Regrade all stored submissions of a quiz against its current answer key
+
+    Returns a summary dict with the number of submissions, how many
+    scores changed, the changes (id, student_name, old and new
+    earned_points and total_points) and the path of the rewritten CSV.
+    With dry_run nothing is written, the quiz store included.
+    """
+    quiz_path = os.path.join(data_dir, f"{quiz_name}.json")
+    with open(quiz_path, 'r', encoding='utf-8') as f:
+        quiz_data = json.load(f)
+
+    is_valid, error_msg = validate_quiz_data(quiz_data)
+    if not is_valid:
+        raise ValueError(f"Invalid quiz data: {error_msg}")
+    if quiz_data.get('bank_draws'):
+        # A quiz drawing from the question bank is graded on each submission's own draw;
+        # a dry run uses the bank as last indexed rather than re-indexing changed files
+        quiz_data = resolve_draws(quiz_data, get_question_bank(data_dir), sync=not dry_run)
+
+    questions = quiz_data['questions']
+    answer_key = compile_answer_key(quiz_data)
+    csv_path = os.path.join(results_dir, quiz_name, f"{quiz_name}_results.csv")
+    if dry_run:
+        if not os.path.exists(results_db_path(quiz_name, results_dir)):
+            # Opening the store would create it
+            return {'quiz_name': quiz_name, 'submissions': 0, 'changed': 0, 'changes': [], 'csv_path': csv_path}
+        version = quiz_version(quiz_data)
+    store = get_results_store(quiz_name, results_dir)
+    if not dry_run:
+        version = store.register_version(quiz_data)
+    current_keys = {}
+    for q, question in zip(answer_key.questions, questions):
+        if question.get('id'):
+            current_keys[question['id']] = q.answer_id
+        current_keys.setdefault(_question_identity(question), q.answer_id)
+
+    current_ids = set(answer_key.question_ids)
+    submissions = list(store.iter_submissions())
+    stored_versions = {}
+    matrix = AnswerMatrix(answer_key.question_ids)
+    aligned_answers = []
+    key_maps = []
+    asked_keys = []
+    for submission in submissions:
+        submission_version = submission['quiz_version']
+        if submission_version not in stored_versions:
+            stored = store.get_version(submission_version) if submission_version != version else None
+            stored_versions[submission_version] = {
+                'keys': [question_key(question, i) for i, question in enumerate(stored['questions'])],
+                'key_map': _key_map(stored['questions'], current_keys)
+            } if stored else None
+        stored = stored_versions[submission_version]
+
+        # The questions this submission was asked: the ones its earlier results list (a
+        # draw from the bank is a few of its version's questions), else all of its version's
+        asked = [result_question_key(result) for result in submission['score'].get('question_results', [])]
+        if not asked:
+            asked = stored['keys'] if stored else list(answer_key.question_ids)
+        answers = submission['answers']
+        key_map = stored['key_map'] if stored is not None else {}
+        if stored is not None:
+            answers = _align_answers(answers, key_map)
+        # Results of an earlier regrade are already keyed by the current questions
+        asked = [key_map.get(key, key) for key in asked]
+        graded = {key for key in asked if key in current_ids}
+        kept = {key for key in asked if key not in current_ids}
+        # (current keys to grade, earlier keys of asked questions since removed)
+        asked_keys.append((graded, kept))
+        key_maps.append(key_map)
+        aligned_answers.append(answers)
+        matrix.append(answers)
+
+    verdicts, earned = matrix.grade(answer_key)
+    columns = dict(zip(answer_key.question_ids, verdicts))
+    weights = {q.answer_id: q.weight for q in answer_key.questions}
+
+    changed = 0
+    updates = []
+    changes = []
+    for s, (submission, answers, key_map, (graded, kept)) in enumerate(
+            zip(submissions, aligned_answers, key_maps, asked_keys)):
+        stored_score = submission['score']
+        stored_results = stored_score.get('question_results', [])
+        if graded == current_ids:
+            earned_points = earned[s]
+            total_points = answer_key.total_points
+        else:
+            earned_points = sum(weights[key] for key in graded if columns[key][s])
+            total_points = sum(weights[key] for key in graded)
+        # Asked questions no longer in the quiz can't be regraded: they keep their earlier result
+        kept_results = [result for result in stored_results if result_question_key(result) in kept]
+        for result in kept_results:
+            earned_points += result.get('points_earned', 0)
+            total_points += result.get('points_possible', 0)
+        if isinstance(earned_points, float) and earned_points.is_integer():
+            earned_points = int(earned_points)
+
+        if (earned_points == stored_score.get('earned_points') and total_points == stored_score.get('total_points')
+                and _same_results(stored_results, key_map, graded, columns, weights, s)):
+            continue
+
+        question_results = []
+        for q, column in zip(answer_key.questions, verdicts):
+            if q.answer_id not in graded:
+                continue
+            user_answer = answers.get(q.answer_id, _MISSING)
+            if user_answer is _MISSING:
+                question_results.append({
+                    'question_num': q.question_num,
+                    'question_id': q.answer_id,
+                    'correct': False,
+                    'points_earned': 0,
+                    'points_possible': q.weight,
+                    'type': q.q_type or 'unknown'
+                })
+                continue
+            is_correct = column[s]
+            question_results.append({
+                'question_num': q.question_num,
+                'question_id': q.answer_id,
+                'correct': is_correct,
+                'points_earned': q.weight if is_correct else 0,
+                'points_possible': q.weight,
+                'type': q.q_type,
+                'user_answer': user_answer
+            })
+        question_results.extend(kept_results)
+
+        percentage = (earned_points / total_points * 100) if total_points > 0 else 0
+        score_result = {
+            'total_points': total_points,
+            'earned_points': earned_points,
+            'percentage': round(percentage, 2),
+            'question_results': question_results
+        }
+
+        if score_result != stored_score:
+            changed += 1
+            updates.append({'id': submission['id'], 'score': score_result})
+            changes.append({
+                'id': submission['id'],
+                'student_name': submission['student_name'],
+                'old_points': stored_score.get('earned_points', 0),
+                'old_total': stored_score.get('total_points', 0),
+                'new_points': earned_points,
+                'new_total': total_points
+            })
+
+    if not dry_run:
+        # Unchanged scores agree with the new key too - the whole store is now graded against it
+        store.update_scores(updates, graded_version=version,
+                            through_id=max((submission['id'] for submission in submissions), default=0))
+        csv_path = store.export()['csv_path']
+
+    if dry_run:
+        logger.info(f"Dry run: regrading {len(submissions)} submissions for {quiz_name} would change {changed}")
+    else:
+        logger.info(f"Regraded {len(submissions)} submissions for {quiz_name} ({changed} changed)")
+    return {
+        'quiz_name': quiz_name,
+        'submissions': len(submissions),
+        'changed': changed,
+        'changes': changes,
+        'csv_path': csv_path
+    }
+
+
+def main(argv: List[str]) -> int:
+    """Command line entry point"""
+    args = [a for a in argv if not a.startswith('--')]
+    if len(args) != 1:
+        print("Usage: python -m server.regrade <quiz_name> [--dry-run]")
+        return 1
+
+    logging.basicConfig(level=logging.INFO)
+    quiz_name = args[0].replace('.json', '')
+    dry_run = '--dry-run' in argv
+    try:
+        summary = regrade_quiz(quiz_name, dry_run=dry_run)
+    except Exception as e:
+        print(f"Error: {e}")
+        return 1
+
+    if dry_run:
+        for change in summary['changes']:
+            print(f"  #{change['id']} {change['student_name']}: {change['old_points']}/{change['old_total']} -> "
+                  f"{change['new_points']}/{change['new_total']}")
+        print(f"Dry run: {summary['changed']} of {summary['submissions']} scores would change (nothing written)")
+        return 0
+    print(f"Regraded {summary['submissions']} submissions "
+          f"({summary['changed']} changed)")
+    print(f"CSV: {summary['csv_path']}")
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main(sys.argv[1:]))
@@ -0,0 +1,92 @@
+"""
+Quiz file watcher for hot reload
+
+One thread per process polls the modification time and size of every
+hosted quiz's file (polling is portable and cheap for a handful of
+files) and calls back with the prefixes whose file changed. The callback
+re-reads, validates and swaps in the new revision off the request path.
+
+Like the metrics reporter, the thread is started from requests, so
+forked workers each run their own and the parent never starts one
+before forking.
+"""
+import logging
+import os
+import threading
+from typing import Callable, Dict, Optional, Tuple
+
+logger = logging.getLogger(__name__)
+
+RELOAD_INTERVAL = 2.0  # Seconds between checks (QUIZ_RELOAD_INTERVAL, 0 disables hot reload)
+
+Signature = Tuple[int, int]
+
+
+def file_signature(path: str) -> Optional[Signature]:
+    """(mtime_ns, size) of a file, None if it can't be read"""
+    try:
+        stat = os.stat(path)
+    except OSError:
+        return None
+    return stat.st_mtime_ns, stat.st_size
+
+
+def reload_interval() -> float:
+    """Check interval from QUIZ_RELOAD_INTERVAL (seconds, 0 disables)"""
+    try:
+        return float(os.environ.get('QUIZ_RELOAD_INTERVAL', RELOAD_INTERVAL))
+    except ValueError:
+        return RELOAD_INTERVAL
+
+
+class QuizWatcher:
+    """Calls on_change(prefix) when a watched quiz file's signature changes"""
+
+    def __init__(self, on_change: Callable[[str], None]):
+        self.on_change = on_change
+        self._files: Dict[str, Tuple[str, Optional[Signature]]] = {}
+        self._lock = threading.Lock()
+        self._stop = threading.Event()
+        self._thread: Optional[threading.Thread] = None
+        self._pid = None
+
+    def watch(self, prefix: str, path: str, signature: Optional[Signature]):
+        """Watch path for prefix; signature is what the loaded revision was read from"""
+        with self._lock:
+            self._files[prefix] = (path, signature)
+
+    def unwatch(self, prefix: str):
+        with self._lock:
+            self._files.pop(prefix, None)
+
+    def start(self, interval: float):
+        """Start the watcher thread (once per process; safe to call on every request)"""
+        if interval <= 0 or (self._thread is not None and self._pid == os.getpid()):
+            return
+        with self._lock:
+            if self._thread is not None and self._pid == os.getpid():
+                return
+            self._stop.clear()
+            self._pid = os.getpid()
+            self._thread = threading.Thread(target=self._run, args=(interval,),
+                                            name='quiz-reloader', daemon=True)
+            self._thread.start()
+
+    def check(self):
+        """Call on_change for every prefix whose file changed since it was read"""
+        with self._lock:
+            files = list(self._files.items())
+        for prefix, (path, signature) in files:
+            current = file_signature(path)
+            if current is not None and current != signature:
+                try:
+                    self.on_change(prefix)
+                except Exception as e:
+                    logger.error(f"Error reloading /q/{prefix}/ from {path}: {e}", exc_info=True)
+
+    def _run(self, interval: float):
+        while not self._stop.wait(interval):
+            self.check()
+
+    def stop(self):
+        self._stop.set()
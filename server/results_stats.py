@@ -0,0 +1,132 @@
+"""
+Running statistics over stored submissions
+
+ResultsAggregator folds submissions in one at a time and can be read at
+any point, so the results viewer shows figures while a large store is
+still being streamed, and picks up new submissions without starting over.
+Memory is O(submissions) for the exact median (two heaps of scores) and
+O(questions) for everything else.
+"""
+import heapq
+import math
+from typing import Dict, List, Optional
+
+from server.utils import result_question_key
+
+SCORE_BINS = 10  # Score distribution in 10-percentage-point bins (100% goes in the last one)
+
+
+class QuestionStats:
+    """Outcome counts for one question"""
+
+    __slots__ = ('question_id', 'seen', 'answered', 'correct', 'manual')
+
+    def __init__(self, question_id: str):
+        self.question_id = question_id
+        self.seen = 0  # Submissions graded on a version that had this question
+        self.answered = 0
+        self.correct = 0
+        self.manual = 0  # Needs manual grading (no auto-grade result)
+
+    def correct_rate(self) -> Optional[float]:
+        """Share of auto-graded submissions that got it right (None if none were auto-graded)"""
+        graded = self.seen - self.manual
+        return self.correct / graded if graded > 0 else None
+
+
+class ResultsAggregator:
+    """Incrementally maintained score statistics for one quiz"""
+
+    def __init__(self):
+        self.count = 0
+        self.last_id = 0  # Highest submission id folded in, for resuming
+        self.statuses: Dict[str, int] = {}
+        self.bins = [0] * SCORE_BINS
+        self.questions: List[QuestionStats] = []  # In the order first seen
+        self._by_id: Dict[str, QuestionStats] = {}
+        self._mean = 0.0
+        self._m2 = 0.0  # Welford's running sum of squared deviations
+        self._min = None
+        self._max = None
+        self._low: List[float] = []   # Max-heap (negated) of the lower half of the scores
+        self._high: List[float] = []  # Min-heap of the upper half
+
+    def add(self, submission: Dict):
+        """Fold in one submission (as yielded by ResultsStore.iter_scores)"""
+        score = submission['score']
+        percentage = float(score.get('percentage', 0))
+
+        self.count += 1
+        self.last_id = max(self.last_id, submission.get('id', 0))
+        status = submission.get('status', 'submitted')
+        self.statuses[status] = self.statuses.get(status, 0) + 1
+
+        delta = percentage - self._mean
+        self._mean += delta / self.count
+        self._m2 += delta * (percentage - self._mean)
+        self._min = percentage if self._min is None else min(self._min, percentage)
+        self._max = percentage if self._max is None else max(self._max, percentage)
+        self.bins[min(SCORE_BINS - 1, max(0, int(percentage * SCORE_BINS // 100)))] += 1
+
+        if not self._low or percentage <= -self._low[0]:
+            heapq.heappush(self._low, -percentage)
+        else:
+            heapq.heappush(self._high, percentage)
+        if len(self._low) > len(self._high) + 1:
+            heapq.heappush(self._high, -heapq.heappop(self._low))
+        elif len(self._high) > len(self._low):
+            heapq.heappush(self._low, -heapq.heappop(self._high))
+
+        for result in score.get('question_results', []):
+            # Keyed by question id, so submissions from before a reorder count towards the same question
+            question_id = result_question_key(result)
+            stats = self._by_id.get(question_id)
+            if stats is None:
+                stats = self._by_id[question_id] = QuestionStats(question_id)
+                self.questions.append(stats)
+            stats.seen += 1
+            if 'user_answer' in result:
+                stats.answered += 1
+            correct = result.get('correct')
+            if correct is None:
+                stats.manual += 1
+            elif correct:
+                stats.correct += 1
+
+    @property
+    def mean(self) -> Optional[float]:
+        return self._mean if self.count else None
+
+    @property
+    def median(self) -> Optional[float]:
+        if not self.count:
+            return None
+        if len(self._low) > len(self._high):
+            return -self._low[0]
+        return (-self._low[0] + self._high[0]) / 2
+
+    @property
+    def stdev(self) -> Optional[float]:
+        """Sample standard deviation of the percentages"""
+        return math.sqrt(self._m2 / (self.count - 1)) if self.count > 1 else None
+
+    def summary(self) -> Dict:
+        """Current figures as plain values"""
+        return {
+            'count': self.count,
+            'mean': self.mean,
+            'median': self.median,
+            'stdev': self.stdev,
+            'min': self._min,
+            'max': self._max,
+            'statuses': dict(self.statuses),
+            'bins': list(self.bins),
+            'questions': [{
+                'question_num': i + 1,
+                'question_id': stats.question_id,
+                'answered': stats.answered,
+                'correct': stats.correct,
+                'manual': stats.manual,
+                'correct_rate': stats.correct_rate()
+            } for i, stats in enumerate(self.questions)]
+        }
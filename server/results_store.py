@@ -0,0 +1,625 @@
+"""
+Append-only results store
+
+Each quiz gets one SQLite database (WAL mode) at
+results/<quiz_name>/<quiz_name>_results.db. Submissions store only the
+answers, the score and a reference to the quiz version they were graded
+against; the questions of each version live in the content-addressed quiz
+store (see server.quiz_store), where a question is stored once across
+versions and quizzes.
+
+The per-student JSON files and the aggregate CSV are exports derived
+from the store (see ResultsStore.export); the JSON files reference the
+quiz version too rather than copying its questions. The store also catalogs the
+exported files by mtime and size, so result files copied in or edited
+by hand are picked up incrementally (see ResultsStore.sync_files), and
+the submission list is sorted and searched through indexes rather than
+by reading files.
+
+Usage:
+    python -m server.results_store export <quiz_name>
+    python -m server.results_store sync <quiz_name>
+"""
+import csv
+import json
+import logging
+import os
+import sqlite3
+import sys
+import threading
+from datetime import datetime
+from typing import Dict, Iterator, List, Optional
+
+from server.grading import question_key
+from server.quiz_store import QuizStore, get_quiz_store
+from server.utils import csv_header, csv_row, result_question_key
+
+logger = logging.getLogger(__name__)
+
+RESULTS_DIR = 'results'
+
+# Submission status: sent by the student, or recorded by the server at the deadline
+SUBMITTED = 'submitted'
+AUTO_FINALIZED = 'auto_finalized'
+
+_SCHEMA = """
+CREATE TABLE IF NOT EXISTS quiz_versions (
+    version TEXT PRIMARY KEY,
+    quiz_title TEXT NOT NULL,
+    questions TEXT NOT NULL,  -- '' once the questions are in the quiz store
+    created TEXT NOT NULL  -- When the version was last registered (served or regraded)
+);
+CREATE TABLE IF NOT EXISTS submissions (
+    id INTEGER PRIMARY KEY AUTOINCREMENT,
+    session_id TEXT NOT NULL,
+    student_name TEXT NOT NULL,
+    timestamp TEXT NOT NULL,
+    filename TEXT NOT NULL,
+    quiz_version TEXT NOT NULL REFERENCES quiz_versions(version),
+    answers TEXT NOT NULL,
+    score TEXT NOT NULL,
+    earned_points REAL NOT NULL,
+    total_points REAL NOT NULL,
+    percentage REAL NOT NULL,
+    exported INTEGER NOT NULL DEFAULT 0,
+    status TEXT NOT NULL DEFAULT 'submitted'
+);
+CREATE INDEX IF NOT EXISTS idx_submissions_exported ON submissions(exported);
+CREATE INDEX IF NOT EXISTS idx_submissions_percentage ON submissions(percentage);
+CREATE INDEX IF NOT EXISTS idx_submissions_timestamp ON submissions(timestamp);
+CREATE INDEX IF NOT EXISTS idx_submissions_student ON submissions(student_name COLLATE NOCASE);
+CREATE TABLE IF NOT EXISTS export_files (
+    filename TEXT PRIMARY KEY,
+    submission_id INTEGER NOT NULL,
+    mtime_ns INTEGER NOT NULL,
+    size INTEGER NOT NULL
+);
+CREATE TABLE IF NOT EXISTS meta (
+    key TEXT PRIMARY KEY,
+    value TEXT NOT NULL
+);
+CREATE TABLE IF NOT EXISTS analysis_cache (
+    name TEXT PRIMARY KEY,
+    state TEXT NOT NULL
+);
+"""
+
+# Columns the submission list can be sorted by (all indexed)
+SORT_COLUMNS = {'id': 'id', 'student_name': 'student_name COLLATE NOCASE',
+                'timestamp': 'timestamp', 'percentage': 'percentage'}
+
+
+def _dumps(data) -> str:
+    """Compact JSON used for stored columns"""
+    return json.dumps(data, ensure_ascii=False, separators=(',', ':'))
+
+
+def results_db_path(quiz_name: str, results_dir: str = RESULTS_DIR) -> str:
+    """Path of a quiz's results database"""
+    return os.path.join(results_dir, quiz_name, f"{quiz_name}_results.db")
+
+
+def result_filename(student_name: str, when: datetime, submission_id: int) -> str:
+    """
+    Per-student JSON export filename
+
+    The submission id keeps it unique: two submissions under the same name
+    in the same second (anonymous students finalized together at the
+    deadline) would otherwise overwrite each other's file.
+    """
+    # Sanitize filename
+    safe_name = "".join(c for c in student_name if c.isalnum() or c in (' ', '-', '_')).strip()[:50]
+    if not safe_name:
+        safe_name = 'Student'
+    return f"{safe_name}_{when.strftime('%Y%m%d_%H%M%S')}_{submission_id}.json"
+
+
+class ResultsStore:
+    """Append-only submission log for one quiz"""
+
+    def __init__(self, quiz_name: str, results_dir: str = RESULTS_DIR,
+                 quiz_store: Optional[QuizStore] = None):
+        self.quiz_name = quiz_name
+        self.quiz_store = quiz_store or get_quiz_store()
+        self.results_dir = os.path.join(results_dir, quiz_name)
+        self.path = results_db_path(quiz_name, results_dir)
+        self._local = threading.local()
+        self._export_lock = threading.Lock()
+
+        os.makedirs(self.results_dir, exist_ok=True)
+        is_new = not os.path.exists(self.path)
+        conn = self._connect()
+        with conn:
+            has_catalog = is_new or conn.execute(
+                "SELECT 1 FROM sqlite_master WHERE type = 'table' AND name = 'export_files'").fetchone()
+            columns = {row['name'] for row in conn.execute('PRAGMA table_info(submissions)')}
+            if columns and 'status' not in columns:
+                # Stores created before auto-finalization only hold student submissions
+                conn.execute(f"ALTER TABLE submissions ADD COLUMN status TEXT NOT NULL DEFAULT '{SUBMITTED}'")
+            conn.executescript(_SCHEMA)
+            if not has_catalog:
+                self._catalog_existing_exports(conn)
+            self._move_questions_to_quiz_store(conn)
+            self._rename_pending_exports(conn)
+        if is_new:
+            # Result files written before the store existed
+            self.sync_files(force=True)
+
+    def _catalog_existing_exports(self, conn: sqlite3.Connection):
+        """Record the files already exported by a store that predates the file catalog"""
+        for row in conn.execute('SELECT id, filename FROM submissions WHERE exported = 1 ORDER BY id').fetchall():
+            try:
+                stat = os.stat(os.path.join(self.results_dir, row['filename']))
+            except OSError:
+                continue
+            conn.execute('INSERT OR REPLACE INTO export_files (filename, submission_id, mtime_ns, size) '
+                         'VALUES (?, ?, ?, ?)', self._file_record(row['id'], row['filename'], stat))
+        self._mark_directory_synced(conn)
+
+    def _rename_pending_exports(self, conn: sqlite3.Connection):
+        """Give submissions not yet exported under the old, id-less filenames their unique filename"""
+        # Only those never written: a re-exported file keeps the name it was first written under
+        rows = conn.execute('SELECT id, student_name, timestamp, filename FROM submissions WHERE exported = 0 '
+                            'AND id NOT IN (SELECT submission_id FROM export_files)').fetchall()
+        renames = []
+        for row in rows:
+            if not row['filename'].endswith(f"_{row['id']}.json"):
+                filename = result_filename(row['student_name'], datetime.fromisoformat(row['timestamp']), row['id'])
+                renames.append((filename, row['id']))
+        conn.executemany('UPDATE submissions SET filename = ? WHERE id = ?', renames)
+
+    def _move_questions_to_quiz_store(self, conn: sqlite3.Connection):
+        """Move the questions a store from before the quiz store kept inline into the quiz store"""
+        for row in conn.execute("SELECT version, questions FROM quiz_versions WHERE questions != ''").fetchall():
+            if self.quiz_store.put_questions(json.loads(row['questions'])) == row['version']:
+                conn.execute("UPDATE quiz_versions SET questions = '' WHERE version = ?", (row['version'],))
+
+    def _connect(self) -> sqlite3.Connection:
+        """Return this thread's connection (SQLite connections are per thread and process)"""
+        conn = getattr(self._local, 'conn', None)
+        if conn is None or self._local.pid != os.getpid():
+            # Never reuse a connection inherited from the parent of a forked worker
+            conn = sqlite3.connect(self.path, timeout=30)
+            conn.execute('PRAGMA journal_mode=WAL')
+            conn.execute('PRAGMA synchronous=FULL')
+            conn.row_factory = sqlite3.Row
+            self._local.conn = conn
+            self._local.pid = os.getpid()
+        return conn
+
+    def close(self):
+        """Close the calling thread's connection"""
+        conn = getattr(self._local, 'conn', None)
+        if conn is not None:
+            conn.close()
+            self._local.conn = None
+
+    def register_version(self, quiz_data: Dict) -> str:
+        """
+        Commit a quiz revision to the quiz store and return the version of its questions
+
+        The version becomes the latest one even if it was registered
+        before (a quiz switched back to an earlier version).
+        """
+        version = self.quiz_store.commit(quiz_data)
+        now = datetime.now().isoformat()
+        conn = self._connect()
+        with conn:
+            conn.execute(
+                "INSERT OR IGNORE INTO quiz_versions (version, quiz_title, questions, created) "
+                "VALUES (?, ?, '', ?)",
+                (version, quiz_data.get('title', ''), now)
+            )
+            conn.execute('UPDATE quiz_versions SET quiz_title = ?, created = ? WHERE version = ?',
+                         (quiz_data.get('title', ''), now, version))
+        return version
+
+    def get_version(self, version: str) -> Optional[Dict]:
+        """Return {'quiz_title', 'questions'} for a stored quiz version"""
+        row = self._connect().execute(
+            'SELECT quiz_title, questions FROM quiz_versions WHERE version = ?', (version,)
+        ).fetchone()
+        if row is None:
+            return None
+        if row['questions']:
+            # Not moved to the quiz store (it held a different list under this hash)
+            questions = json.loads(row['questions'])
+        else:
+            questions = self.quiz_store.get_questions(version) or []
+        return {'quiz_title': row['quiz_title'], 'questions': questions}
+
+    def latest_version(self) -> Optional[Dict]:
+        """Return {'version', 'quiz_title', 'questions'} for the quiz version registered last"""
+        row = self._connect().execute(
+            'SELECT version FROM quiz_versions ORDER BY created DESC LIMIT 1').fetchone()
+        if row is None:
+            return None
+        return dict(self.get_version(row['version']), version=row['version'])
+
+    def question_keys(self) -> List[str]:
+        """Answer keys of the latest version's questions, in their current order"""
+        latest = self.latest_version()
+        if latest is None:
+            return []
+        return [question_key(question, i) for i, question in enumerate(latest['questions'])]
+
+    def append(self, student_name: str, session_id: str, answers: Dict,
+               score_result: Dict, version: str, when: Optional[datetime] = None) -> int:
+        """Append one submission and return its id"""
+        return self.append_many([{
+            'student_name': student_name,
+            'session_id': session_id,
+            'answers': answers,
+            'score': score_result,
+            'quiz_version': version,
+            'when': when or datetime.now()
+        }])[-1]
+
+    def append_many(self, records: List[Dict]) -> List[int]:
+        """Append several submissions in a single transaction"""
+        conn = self._connect()
+        ids = []
+        with conn:
+            for record in records:
+                when = record['when']
+                score = record['score']
+                submission_id = conn.execute(
+                    "INSERT INTO submissions (session_id, student_name, timestamp, filename, "
+                    "quiz_version, answers, score, earned_points, total_points, percentage, status) "
+                    "VALUES (?, ?, ?, '', ?, ?, ?, ?, ?, ?, ?)",
+                    (record['session_id'], record['student_name'], when.isoformat(), record['quiz_version'],
+                     _dumps(record['answers']), _dumps(score), score['earned_points'],
+                     score['total_points'], score['percentage'], record.get('status', SUBMITTED))
+                ).lastrowid
+                # The filename carries the id, which is only known once the row exists
+                conn.execute('UPDATE submissions SET filename = ? WHERE id = ?',
+                             (result_filename(record['student_name'], when, submission_id), submission_id))
+                ids.append(submission_id)
+        return ids
+
+    def iter_submissions(self, where: str = '', params=()) -> Iterator[Dict]:
+        """Yield stored submissions in insertion order"""
+        query = 'SELECT * FROM submissions'
+        if where:
+            query += f' WHERE {where}'
+        query += ' ORDER BY id'
+        for row in self._connect().execute(query, params):
+            yield {
+                'id': row['id'],
+                'session_id': row['session_id'],
+                'student_name': row['student_name'],
+                'timestamp': row['timestamp'],
+                'filename': row['filename'],
+                'quiz_version': row['quiz_version'],
+                'answers': json.loads(row['answers']),
+                'score': json.loads(row['score']),
+                'status': row['status']
+            }
+
+    def iter_scores(self, after_id: int = 0) -> Iterator[Dict]:
+        """Yield submissions after after_id without their answers (for statistics and listings)"""
+        rows = self._connect().execute(
+            'SELECT id, student_name, timestamp, status, quiz_version, score FROM submissions '
+            'WHERE id > ? ORDER BY id',
+            (after_id,)
+        )
+        for row in rows:
+            yield {
+                'id': row['id'],
+                'student_name': row['student_name'],
+                'timestamp': row['timestamp'],
+                'status': row['status'],
+                'quiz_version': row['quiz_version'],
+                'score': json.loads(row['score'])
+            }
+
+    def get_submission(self, submission_id: int) -> Optional[Dict]:
+        """One stored submission with the questions it was graded against (see graded_version)"""
+        submission = next(self.iter_submissions('id = ?', (submission_id,)), None)
+        if submission is not None:
+            version = self.graded_version(submission_id, submission['quiz_version'])
+            submission['questions'] = (self.get_version(version) or {}).get('questions', [])
+        return submission
+
+    def _search_clause(self, name_prefix: str):
+        """WHERE clause matching student names that start with name_prefix (case-insensitive, indexed)"""
+        if not name_prefix:
+            return '', ()
+        # A range on the NOCASE index instead of LIKE, which could not use it
+        return ('WHERE student_name COLLATE NOCASE >= ? AND student_name COLLATE NOCASE < ?',
+                (name_prefix, name_prefix + '\U0010ffff'))
+
+    def list_submissions(self, name_prefix: str = '', order_by: str = 'id', descending: bool = False,
+                         limit: int = 100, offset: int = 0) -> List[Dict]:
+        """One page of the submission catalog (no answers), sorted and filtered through the indexes"""
+        where, params = self._search_clause(name_prefix)
+        direction = 'DESC' if descending else 'ASC'
+        # Ties broken by id in the same direction, so the index alone gives the order
+        rows = self._connect().execute(
+            'SELECT id, student_name, timestamp, status, earned_points, total_points, percentage '
+            f'FROM submissions {where} ORDER BY {SORT_COLUMNS[order_by]} {direction}, id {direction} '
+            'LIMIT ? OFFSET ?',
+            params + (limit, offset)
+        )
+        return [dict(row) for row in rows]
+
+    def count(self, name_prefix: str = '') -> int:
+        """Number of stored submissions (whose student name starts with name_prefix)"""
+        where, params = self._search_clause(name_prefix)
+        return self._connect().execute(f'SELECT COUNT(*) FROM submissions {where}', params).fetchone()[0]
+
+    def update_scores(self, updates: List[Dict], graded_version: Optional[str] = None, through_id: int = 0):
+        """
+        Replace the scores of existing submissions (used by regrading)
+
+        Each update has 'id' and 'score'. The answers and the quiz version
+        they were given on stay as submitted. Updated rows are re-exported
+        on the next export. With graded_version, every submission up to
+        through_id is noted as graded against that version's answer key,
+        whether or not its score changed (see graded_version).
+        """
+        conn = self._connect()
+        with conn:
+            if graded_version is not None:
+                conn.executemany('INSERT OR REPLACE INTO meta (key, value) VALUES (?, ?)',
+                                 [('regraded_version', graded_version), ('regraded_through', str(through_id))])
+            conn.executemany(
+                'UPDATE submissions SET score = ?, '
+                'earned_points = ?, total_points = ?, percentage = ?, exported = 0 WHERE id = ?',
+                [(_dumps(u['score']),
+                  u['score']['earned_points'], u['score']['total_points'],
+                  u['score']['percentage'], u['id']) for u in updates]
+            )
+            if updates:
+                self._bump_revision(conn)
+
+    def _bump_revision(self, conn: sqlite3.Connection):
+        """Note that stored scores changed in place (invalidates incremental caches)"""
+        conn.execute("INSERT OR IGNORE INTO meta (key, value) VALUES ('scores_revision', '0')")
+        conn.execute("UPDATE meta SET value = CAST(value AS INTEGER) + 1 WHERE key = 'scores_revision'")
+
+    def graded_version(self, submission_id: int, quiz_version: str) -> str:
+        """
+        Version whose answer key a submission's score comes from
+
+        That is the version of the last regrade if it covered the
+        submission, else quiz_version (the one it was given on).
+        """
+        rows = {row['key']: row['value'] for row in self._connect().execute(
+            "SELECT key, value FROM meta WHERE key IN ('regraded_version', 'regraded_through')")}
+        if 'regraded_version' in rows and submission_id <= int(rows.get('regraded_through', 0)):
+            return rows['regraded_version']
+        return quiz_version
+
+    def scores_revision(self) -> int:
+        """Counter bumped whenever stored scores are changed rather than appended"""
+        row = self._connect().execute("SELECT value FROM meta WHERE key = 'scores_revision'").fetchone()
+        return int(row['value']) if row else 0
+
+    def load_cache(self, name: str) -> Optional[Dict]:
+        """Saved state of a derived report (see server.item_analysis)"""
+        row = self._connect().execute('SELECT state FROM analysis_cache WHERE name = ?', (name,)).fetchone()
+        return json.loads(row['state']) if row else None
+
+    def save_cache(self, name: str, state: Dict):
+        conn = self._connect()
+        with conn:
+            conn.execute('INSERT OR REPLACE INTO analysis_cache (name, state) VALUES (?, ?)', (name, _dumps(state)))
+
+    def export(self) -> Dict:
+        """
+        Write per-student JSON files for new or changed submissions and
+        rebuild the aggregate CSV
+
+        Returns a dict with the number of JSON files written and the CSV path.
+        """
+        with self._export_lock:
+            titles = {}
+            written = 0
+            exported_ids = []
+            exported_files = []
+            for submission in self.iter_submissions('exported = 0'):
+                version = submission['quiz_version']
+                if version not in titles:
+                    row = self._connect().execute('SELECT quiz_title FROM quiz_versions WHERE version = ?',
+                                                  (version,)).fetchone()
+                    titles[version] = row['quiz_title'] if row else ''
+                # The questions are looked up by quiz_version in the quiz store, not copied into every file
+                result_data = {
+                    'quiz_name': self.quiz_name,
+                    'quiz_title': titles[version],
+                    'quiz_version': version,
+                    'student_name': submission['student_name'],
+                    'session_id': submission['session_id'],
+                    'timestamp': submission['timestamp'],
+                    'status': submission['status'],
+                    'score': submission['score'],
+                    'answers': submission['answers']
+                }
+                json_path = os.path.join(self.results_dir, submission['filename'])
+                tmp_path = f"{json_path}.tmp"
+                with open(tmp_path, 'w', encoding='utf-8') as f:
+                    json.dump(result_data, f, indent=2, ensure_ascii=False)
+                os.replace(tmp_path, json_path)
+                exported_ids.append((submission['id'],))
+                exported_files.append(self._file_record(submission['id'], submission['filename'],
+                                                        os.stat(json_path)))
+                written += 1
+
+            csv_path = os.path.join(self.results_dir, f"{self.quiz_name}_results.csv")
+            if written or not os.path.exists(csv_path):
+                self._export_csv(csv_path)
+
+            conn = self._connect()
+            with conn:
+                if exported_ids:
+                    conn.executemany('UPDATE submissions SET exported = 1 WHERE id = ?', exported_ids)
+                    conn.executemany('INSERT OR REPLACE INTO export_files (filename, submission_id, mtime_ns, size) '
+                                     'VALUES (?, ?, ?, ?)', exported_files)
+                # Our own writes are not external changes
+                self._mark_directory_synced(conn)
+
+        if written:
+            logger.info(f"Exported {written} result files for {self.quiz_name}")
+        return {'json_written': written, 'csv_path': csv_path}
+
+    def _export_csv(self, csv_path: str):
+        """
+        Rewrite the aggregate CSV from the log
+
+        Question columns follow the latest version's order and are matched
+        by question id; questions since removed get columns at the end.
+        """
+        submissions = list(self.iter_submissions())
+        question_keys = self.question_keys()
+        known = set(question_keys)
+        for submission in submissions:
+            for q_result in submission['score']['question_results']:
+                key = result_question_key(q_result)
+                if key not in known:
+                    known.add(key)
+                    question_keys.append(key)
+        rows = [csv_row(submission['timestamp'], submission['student_name'], submission['session_id'],
+                        submission['answers'], submission['score'], question_keys)
+                for submission in submissions]
+
+        tmp_path = f"{csv_path}.tmp"
+        with open(tmp_path, 'w', newline='', encoding='utf-8') as f:
+            writer = csv.writer(f)
+            writer.writerow(csv_header(question_keys))
+            writer.writerows(rows)
+        os.replace(tmp_path, csv_path)
+
+    def _file_record(self, submission_id: int, filename: str, stat: os.stat_result) -> tuple:
+        return (filename, submission_id, stat.st_mtime_ns, stat.st_size)
+
+    def _mark_directory_synced(self, conn: sqlite3.Connection):
+        """Remember the results folder's mtime, so an unchanged folder needs no scan"""
+        conn.execute("INSERT OR REPLACE INTO meta (key, value) VALUES ('dir_mtime_ns', ?)",
+                     (str(os.stat(self.results_dir).st_mtime_ns),))
+
+    def sync_files(self, force: bool = False) -> Dict:
+        """
+        Bring the catalog up to date with JSON files changed outside the store
+
+        Result files the store does not know (copied in, or written before
+        the store existed) are imported, and exported files edited since
+        they were written (e.g. a manually graded score) update their
+        submission. Only files whose mtime or size changed are parsed, and
+        unless force is set the folder is only scanned when its own mtime
+        has changed - one stat when nothing happened.
+
+        Returns the number of files imported and updated.
+        """
+        summary = {'imported': 0, 'updated': 0}
+        conn = self._connect()
+        dir_mtime = str(os.stat(self.results_dir).st_mtime_ns)
+        row = conn.execute("SELECT value FROM meta WHERE key = 'dir_mtime_ns'").fetchone()
+        if not force and row is not None and row['value'] == dir_mtime:
+            return summary
+
+        with self._export_lock:
+            known = {row['filename']: row for row in conn.execute(
+                'SELECT filename, submission_id, mtime_ns, size FROM export_files')}
+            changed = []
+            with os.scandir(self.results_dir) as entries:
+                for entry in entries:
+                    if not entry.name.endswith('.json') or not entry.is_file():
+                        continue
+                    stat = entry.stat()
+                    record = known.get(entry.name)
+                    if record is None or record['mtime_ns'] != stat.st_mtime_ns or record['size'] != stat.st_size:
+                        changed.append((entry.name, stat, record['submission_id'] if record else None))
+
+            with conn:
+                for filename, stat, submission_id in sorted(changed):
+                    try:
+                        with open(os.path.join(self.results_dir, filename), 'r', encoding='utf-8') as f:
+                            result_data = json.load(f)
+                        score = result_data.get('score', {})
+                        if submission_id is None:
+                            submission_id = self._import_result(conn, filename, result_data)
+                            summary['imported'] += 1
+                        else:
+                            conn.execute(
+                                'UPDATE submissions SET student_name = ?, answers = ?, score = ?, '
+                                'earned_points = ?, total_points = ?, percentage = ? WHERE id = ?',
+                                (result_data.get('student_name', ''), _dumps(result_data.get('answers', {})),
+                                 _dumps(score), score.get('earned_points', 0), score.get('total_points', 0),
+                                 score.get('percentage', 0), submission_id)
+                            )
+                            summary['updated'] += 1
+                            self._bump_revision(conn)
+                    except Exception as e:
+                        logger.error(f"Skipping unreadable result file {filename}: {e}")
+                        continue
+                    conn.execute('INSERT OR REPLACE INTO export_files (filename, submission_id, mtime_ns, size) '
+                                 'VALUES (?, ?, ?, ?)', self._file_record(submission_id, filename, stat))
+                self._mark_directory_synced(conn)
+
+        if summary['imported'] or summary['updated']:
+            logger.info(f"Synced result files of {self.quiz_name}: {summary['imported']} imported, "
+                        f"{summary['updated']} updated")
+        return summary
+
+    def _import_result(self, conn: sqlite3.Connection, filename: str, result_data: Dict) -> int:
+        """Insert a result JSON file as an (already exported) submission"""
+        if 'questions' in result_data or not result_data.get('quiz_version'):
+            # Written before results referenced the quiz store: store the questions it carries
+            version = self.quiz_store.put_questions(result_data.get('questions', []))
+        else:
+            version = result_data['quiz_version']
+        conn.execute(
+            "INSERT OR IGNORE INTO quiz_versions (version, quiz_title, questions, created) "
+            "VALUES (?, ?, '', ?)",
+            (version, result_data.get('quiz_title', ''), datetime.now().isoformat())
+        )
+        score = result_data.get('score', {})
+        return conn.execute(
+            'INSERT INTO submissions (session_id, student_name, timestamp, filename, '
+            'quiz_version, answers, score, earned_points, total_points, percentage, exported, status) '
+            'VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, 1, ?)',
+            (result_data.get('session_id', ''), result_data.get('student_name', ''),
+             result_data.get('timestamp', ''), filename, version,
+             _dumps(result_data.get('answers', {})), _dumps(score),
+             score.get('earned_points', 0), score.get('total_points', 0),
+             score.get('percentage', 0), result_data.get('status', SUBMITTED))
+        ).lastrowid
+
+
+_stores: Dict[str, ResultsStore] = {}
+_stores_lock = threading.Lock()
+
+
+def get_results_store(quiz_name: str, results_dir: str = RESULTS_DIR) -> ResultsStore:
+    """Return the shared ResultsStore for a quiz, opening it on first use"""
+    key = os.path.join(results_dir, quiz_name)
+    store = _stores.get(key)
+    if store is None:
+        with _stores_lock:
+            store = _stores.get(key)
+            if store is None:
+                store = _stores[key] = ResultsStore(quiz_name, results_dir)
+    return store
+
+
+def main(argv: List[str]) -> int:
+    """Command line entry point"""
+    if len(argv) != 2 or argv[0] not in ('export', 'sync'):
+        print("Usage: python -m server.results_store export|sync <quiz_name>")
+        return 1
+
+    logging.basicConfig(level=logging.INFO)
+    quiz_name = argv[1].replace('.json', '')
+    if argv[0] == 'sync':
+        summary = get_results_store(quiz_name).sync_files(force=True)
+        print(f"Imported {summary['imported']} and updated {summary['updated']} result files")
+        return 0
+    summary = get_results_store(quiz_name).export()
+    print(f"Exported {summary['json_written']} result files")
+    print(f"CSV: {summary['csv_path']}")
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main(sys.argv[1:]))
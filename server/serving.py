@@ -0,0 +1,211 @@
+"""
+WSGI serving modes for the quiz server
+
+'production' serves the app from a fixed pool of worker threads with a
+deep listen backlog, so a whole lecture hall connecting at once queues
+instead of failing. It uses waitress (HTTP/1.1 keep-alive, idle
+connections parked off the worker threads) when it is installed, and
+otherwise a thread-pool server built on Werkzeug, which closes every
+connection after one request. 'development' is Flask's built-in server,
+as before.
+
+Workers are threads of one process, so they share the quiz and session
+state in server.app (which is safe for concurrent use). For large exams
+start_workers() pre-forks several such processes on one listening socket
+(POSIX only); the app must then keep its sessions in a shared store.
+"""
+import logging
+import os
+import signal
+import socket
+import time
+from concurrent.futures import ThreadPoolExecutor
+from typing import Callable, List, Optional
+
+from werkzeug.serving import BaseWSGIServer, WSGIRequestHandler
+
+from server.utils import stop_logging
+
+try:
+    import waitress
+except ImportError:  # Optional - fall back to the Werkzeug thread pool
+    waitress = None
+
+logger = logging.getLogger(__name__)
+
+SERVE_MODES = ('production', 'development')
+DEFAULT_MODE = 'production'
+DEFAULT_THREADS = 32            # Worker threads handling requests
+DEFAULT_BACKLOG = 1024          # Pending connections the OS queues for us
+DEFAULT_KEEPALIVE = 30          # Seconds an idle (keep-alive) connection is kept open
+DEFAULT_CONNECTION_LIMIT = 2000  # Open connections accepted at once (waitress)
+
+
+class PooledWSGIServer(BaseWSGIServer):
+    """Werkzeug server that hands connections to a bounded worker pool"""
+
+    multithread = True
+
+    def __init__(self, host: str, port: int, app, threads: int = DEFAULT_THREADS,
+                 backlog: int = DEFAULT_BACKLOG, keepalive: int = DEFAULT_KEEPALIVE,
+                 fd: Optional[int] = None):
+        # Read by server_activate() inside BaseWSGIServer.__init__
+        self.request_queue_size = backlog
+        self._pool = ThreadPoolExecutor(max_workers=threads, thread_name_prefix='quiz-worker')
+        # Werkzeug closes every connection after one response; the timeout
+        # only stops slow clients from holding a worker
+        handler = type('PooledRequestHandler', (WSGIRequestHandler,), {'timeout': keepalive})
+        super().__init__(host, port, app, handler=handler, fd=fd)
+
+    def process_request(self, request, client_address):
+        """Queue the connection for a worker instead of handling it inline"""
+        self._pool.submit(self._process_request_worker, request, client_address)
+
+    def _process_request_worker(self, request, client_address):
+        try:
+            self.finish_request(request, client_address)
+        except Exception:
+            self.handle_error(request, client_address)
+        finally:
+            self.shutdown_request(request)
+
+    def server_close(self):
+        super().server_close()
+        self._pool.shutdown(wait=False)
+
+
+def serve(app, host: str = '127.0.0.1', port: int = 5000, mode: str = DEFAULT_MODE,
+          threads: int = DEFAULT_THREADS, backlog: int = DEFAULT_BACKLOG,
+          keepalive: int = DEFAULT_KEEPALIVE, sock: Optional[socket.socket] = None):
+    """
+    Serve a WSGI app until interrupted (blocks the calling thread)
+    
+    If sock is given (production mode only), requests are accepted from
+    that already-listening socket instead of binding host:port.
+    """
+    if mode not in SERVE_MODES:
+        raise ValueError(f"Unknown serving mode: {mode} (expected one of {', '.join(SERVE_MODES)})")
+
+    if mode == 'development':
+        if sock is not None:
+            raise ValueError("The development server can not serve a shared socket")
+        logger.info(f"Serving on http://{host}:{port} (Flask development server)")
+        app.run(host=host, port=port, debug=False, threaded=True, use_reloader=False)
+        return
+
+    if waitress is not None:
+        logger.info(f"Serving on http://{host}:{port} (waitress, {threads} threads, backlog {backlog})")
+        if sock is not None:
+            listen = {'sockets': [sock]}
+        else:
+            listen = {'host': host, 'port': port, 'backlog': backlog}
+        waitress.serve(app, threads=threads, channel_timeout=keepalive,
+                       connection_limit=DEFAULT_CONNECTION_LIMIT, ident='QuizBuilder', **listen)
+        return
+
+    logger.info(f"Serving on http://{host}:{port} (thread pool, {threads} threads, backlog {backlog})")
+    server = PooledWSGIServer(host, port, app, threads=threads, backlog=backlog, keepalive=keepalive,
+                              fd=sock.fileno() if sock is not None else None)
+    try:
+        server.serve_forever()
+    finally:
+        server.server_close()
+
+
+class WorkerPool:
+    """Handle on pre-forked worker processes, used by the parent process"""
+
+    def __init__(self, pids: List[int], sock: socket.socket):
+        self.pids = pids
+        self.sock = sock
+        self._alive = set(pids)
+
+    def _reap(self, pid: int, block: bool) -> bool:
+        """Collect a worker's exit status; True once it is gone"""
+        try:
+            done, status = os.waitpid(pid, 0 if block else os.WNOHANG)
+        except ChildProcessError:
+            done, status = pid, 0  # Already reaped elsewhere
+        if done == 0:
+            return False
+        if pid in self._alive:
+            self._alive.discard(pid)
+            code = os.WEXITSTATUS(status) if os.WIFEXITED(status) else -os.WTERMSIG(status)
+            if code != 0:
+                logger.error(f"Worker {pid} exited with code {code}")
+        return True
+
+    def wait(self):
+        """Block until every worker has exited"""
+        for pid in self.pids:
+            self._reap(pid, block=True)
+
+    def stop(self, timeout: float = 30):
+        """Ask workers to drain and exit, killing any that take too long"""
+        for pid in list(self._alive):
+            try:
+                os.kill(pid, signal.SIGTERM)
+            except ProcessLookupError:
+                pass
+        deadline = time.monotonic() + timeout
+        while self._alive and time.monotonic() < deadline:
+            for pid in list(self._alive):
+                self._reap(pid, block=False)
+            time.sleep(0.1)
+        for pid in list(self._alive):
+            logger.error(f"Worker {pid} did not stop in time, killing it")
+            os.kill(pid, signal.SIGKILL)
+            self._reap(pid, block=True)
+        self.sock.close()
+
+
+def start_workers(app, host: str = '127.0.0.1', port: int = 5000, workers: int = 2,
+                  threads: int = DEFAULT_THREADS, backlog: int = DEFAULT_BACKLOG,
+                  on_exit: Optional[Callable[[], None]] = None) -> WorkerPool:
+    """
+    Fork worker processes that all accept from one listening socket
+
+    Call this before starting other threads (the logging listener started
+    by server.utils.setup_logging is the exception: it is stopped for each
+    fork and restarted in the parent and in every worker). Each worker
+    serves in production mode until it receives SIGTERM, then runs on_exit
+    (e.g. to flush queued results) and exits.
+    """
+    if not hasattr(os, 'fork'):
+        raise RuntimeError("Multi-process serving needs os.fork (not available on this platform)")
+
+    sock = socket.create_server((host, port), backlog=backlog)
+    pids = []
+    for _ in range(workers):
+        pid = os.fork()
+        if pid == 0:
+            _run_worker(app, sock, threads, on_exit)
+        pids.append(pid)
+
+    logger.info(f"Started {workers} worker processes on http://{host}:{port}: {pids}")
+    return WorkerPool(pids, sock)
+
+
+def _run_worker(app, sock: socket.socket, threads: int, on_exit: Optional[Callable[[], None]]):
+    """Body of a forked worker process (never returns)"""
+    def handle_sigterm(signum, frame):
+        try:
+            if on_exit:
+                on_exit()
+        finally:
+            stop_logging()  # os._exit skips atexit - write out queued log records first
+            os._exit(0)
+
+    signal.signal(signal.SIGTERM, handle_sigterm)
+    signal.signal(signal.SIGINT, signal.SIG_IGN)  # Ctrl+C is handled by the parent
+    code = 0
+    try:
+        serve(app, mode='production', threads=threads, sock=sock)
+    except BaseException:
+        logger.exception(f"Worker {os.getpid()} crashed")
+        code = 1
+    finally:
+        if on_exit:
+            on_exit()
+        stop_logging()
+        os._exit(code)
@@ -0,0 +1,501 @@
+"""
+Bounded, expiring session table for quiz takers
+
+Sessions are created on every page load, so the table must not grow
+with refreshes, crawlers and link-preview bots. Sessions created under
+the same timer have the same lifetime (timer plus a grace period, plus
+any extensions, which move every session alike), so among them creation
+order is also expiry order. Each table keeps one insertion-ordered dict
+per timer (a new one starts when the quiz's timer changes) and sweeps
+each from the front. When full, it evicts the submitted session that
+expires first, else the idle one (page loaded, quiz never started) that
+expires first. A quiz in progress is only evicted when there is nothing
+else, and is then handed to on_evict (the server finalizes it) rather
+than dropped.
+
+The server is threaded, so the table is split into lock-striped shards
+(picked by session id hash). Requests for different sessions rarely
+share a lock, and the submitted flag is claimed with an atomic
+compare-and-set under the session's shard lock.
+
+Each session also buffers the student's answers as they are autosaved
+(keyed by display position, last write wins per question), so the final
+submit only carries what changed since the last autosave.
+
+When the server runs several worker processes, SharedSessionStore keeps
+the same table in a SQLite file so a submit can land on any worker.
+"""
+import json
+import logging
+import os
+import sqlite3
+import threading
+import time
+from collections import OrderedDict
+from datetime import datetime
+from typing import Callable, Dict, List, Optional
+
+logger = logging.getLogger(__name__)
+
+GRACE_SECONDS = 10 * 60      # Kept past the timer so late submits are still recognised
+MAX_SESSIONS = 20000         # Hard cap on live sessions (split across shards)
+SWEEP_INTERVAL = 30.0        # Seconds between opportunistic sweeps of a shard
+SHARDS = 16                  # Number of lock stripes
+
+
+class SessionRecord:
+    """State of one quiz-taking session"""
+
+    __slots__ = ('session_id', 'started', 'expires', 'submitted', 'submitted_at',
+                 'student_name', 'seed', 'revision', 'variant', 'answers')
+
+    def __init__(self, session_id: str, started: datetime, expires: float, seed: Optional[int],
+                 revision: Optional[str] = None):
+        self.session_id = session_id
+        self.started = started
+        self.expires = expires  # Drop deadline (time.monotonic(); time.time() when shared)
+        self.submitted = False
+        self.submitted_at = None
+        self.student_name = None
+        self.seed = seed
+        self.revision = revision  # Quiz revision the session started on (see server.quizzes)
+        self.variant = None
+        self.answers = None  # Autosaved answers, created on the first save
+
+    @property
+    def in_progress(self) -> bool:
+        """Started (or answering) and not yet submitted"""
+        return not self.submitted and (self.student_name is not None or self.answers is not None)
+
+
+class _Shard:
+    """One lock stripe of the session table"""
+
+    __slots__ = ('lock', 'buckets', 'next_sweep', 'expired', 'evicted', 'submitted')
+
+    def __init__(self):
+        self.lock = threading.Lock()
+        # Timer (seconds) -> sessions created under it, in expiry order. Replaced, never
+        # resized in place, so lookups can iterate it without the lock.
+        self.buckets: 'Dict[float, OrderedDict[str, SessionRecord]]' = {}
+        self.next_sweep = time.monotonic() + SWEEP_INTERVAL
+        self.expired = 0
+        self.evicted = 0
+        self.submitted = 0
+
+    def __len__(self) -> int:
+        return sum(len(bucket) for bucket in self.buckets.values())
+
+    def find(self, session_id: str) -> Optional[SessionRecord]:
+        for bucket in self.buckets.values():
+            record = bucket.get(session_id)
+            if record is not None:
+                return record
+        return None
+
+    def add_locked(self, timer_seconds: float, record: SessionRecord):
+        """Append a record to its timer's bucket (caller holds the lock)"""
+        bucket = self.buckets.get(timer_seconds)
+        if bucket is None:
+            bucket = OrderedDict()
+            buckets = dict(self.buckets)
+            buckets[timer_seconds] = bucket
+            self.buckets = buckets
+        bucket[record.session_id] = record
+
+    def sweep_locked(self, now: float) -> int:
+        """Pop expired records from the front of every bucket (caller holds the lock)"""
+        removed = 0
+        for bucket in self.buckets.values():
+            while bucket:
+                record = next(iter(bucket.values()))
+                if record.expires > now:
+                    break
+                bucket.popitem(last=False)
+                removed += 1
+        if not all(self.buckets.values()):
+            self.buckets = {timer: bucket for timer, bucket in self.buckets.items() if bucket}
+        self.expired += removed
+        self.next_sweep = now + SWEEP_INTERVAL
+        return removed
+
+    def evict_locked(self) -> Optional[SessionRecord]:
+        """
+        Drop one record to make room (caller holds the lock)
+        
+        Submitted sessions go first, then idle ones, each the one that
+        expires first. Only when every session is in progress is the one
+        that expires first dropped; it is returned so it can be finalized.
+        """
+        for evictable in (lambda record: record.submitted, lambda record: not record.in_progress):
+            victim = None
+            for bucket in self.buckets.values():
+                # Each bucket is in expiry order - its first match is its earliest
+                record = next((record for record in bucket.values() if evictable(record)), None)
+                if record is not None and (victim is None or record.expires < victim[1].expires):
+                    victim = (bucket, record)
+            if victim is not None:
+                del victim[0][victim[1].session_id]
+                self.evicted += 1
+                return None
+        bucket = min((bucket for bucket in self.buckets.values() if bucket),
+                     key=lambda bucket: next(iter(bucket.values())).expires)
+        _, record = bucket.popitem(last=False)
+        self.evicted += 1
+        return record
+
+
+class SessionStore:
+    """Sharded session table with TTL expiry, a size cap and monitoring counters"""
+
+    def __init__(self, timer_minutes: float, grace_seconds: float = GRACE_SECONDS,
+                 max_sessions: int = MAX_SESSIONS, shards: int = SHARDS):
+        self.timer_seconds = timer_minutes * 60
+        self.ttl = timer_minutes * 60 + grace_seconds
+        self._shards = [_Shard() for _ in range(shards)]
+        self._shard_cap = max(1, max_sessions // shards)
+        # Called (outside the shard lock) with quizzes in progress evicted because the table was full
+        self.on_evict: Optional[Callable[[List[SessionRecord]], None]] = None
+
+    def _shard(self, session_id: str) -> _Shard:
+        return self._shards[hash(session_id) % len(self._shards)]
+
+    def create(self, session_id: str, seed: Optional[int] = None, revision: Optional[str] = None) -> SessionRecord:
+        """Register a new session"""
+        now = time.monotonic()
+        record = SessionRecord(session_id, datetime.now(), now + self.ttl, seed, revision)
+        shard = self._shard(session_id)
+        evicted = []
+        with shard.lock:
+            if now >= shard.next_sweep:
+                shard.sweep_locked(now)
+            if len(shard) >= self._shard_cap:
+                # Expired sessions go before any live one is evicted
+                shard.sweep_locked(now)
+                while len(shard) >= self._shard_cap:
+                    victim = shard.evict_locked()
+                    if victim is not None:
+                        evicted.append(victim)
+            shard.add_locked(self.timer_seconds, record)
+        if evicted:
+            _hand_over_evicted(self.on_evict, evicted)
+        return record
+
+    def get(self, session_id: Optional[str]) -> Optional[SessionRecord]:
+        """Return a live session, or None if unknown or expired"""
+        if not session_id:
+            return None
+        shard = self._shard(session_id)
+        record = shard.find(session_id)
+        if record is None or record.expires > time.monotonic():
+            return record
+        # Expired - sweeping drops it (and everything expiring before it) from the shard
+        with shard.lock:
+            shard.sweep_locked(time.monotonic())
+        return None
+
+    def __contains__(self, session_id: str) -> bool:
+        return self.get(session_id) is not None
+
+    def __len__(self) -> int:
+        return sum(len(shard) for shard in self._shards)
+
+    def start(self, record: SessionRecord, student_name: str):
+        """Note that the student has started the quiz under this name"""
+        record.student_name = student_name
+
+    def set_timer(self, timer_minutes: float):
+        """Give new sessions a different timer (existing sessions keep their expiry)"""
+        self.ttl += timer_minutes * 60 - self.timer_seconds
+        self.timer_seconds = timer_minutes * 60
+
+    def extend(self, seconds: float):
+        """Push every session's expiry (and new sessions' lifetime) back by seconds"""
+        self.ttl += seconds
+        for shard in self._shards:
+            with shard.lock:
+                for bucket in shard.buckets.values():
+                    for record in bucket.values():
+                        record.expires += seconds
+
+    def save_answers(self, record: SessionRecord, changes: Dict) -> bool:
+        """Merge changed answers into the session's buffer (False once submitted)"""
+        shard = self._shard(record.session_id)
+        with shard.lock:
+            if record.submitted:
+                return False
+            if record.answers is None:
+                record.answers = {}
+            record.answers.update(changes)
+        return True
+
+    def answers(self, record: SessionRecord) -> Dict:
+        """Copy of the session's autosaved answers"""
+        shard = self._shard(record.session_id)
+        with shard.lock:
+            return dict(record.answers or {})
+
+    def try_submit(self, record: SessionRecord) -> bool:
+        """
+        Atomically claim the session's one submission
+
+        Returns False if the session was already submitted, so two
+        near-simultaneous submits can never both be accepted. Autosaves
+        are refused from then on, so the buffer read afterwards is final.
+        """
+        shard = self._shard(record.session_id)
+        with shard.lock:
+            if record.submitted:
+                return False
+            record.submitted = True
+            record.submitted_at = datetime.now()
+            shard.submitted += 1
+        return True
+
+    def release_submit(self, record: SessionRecord):
+        """Undo try_submit when the submission could not be processed"""
+        shard = self._shard(record.session_id)
+        with shard.lock:
+            if record.submitted:
+                record.submitted = False
+                record.submitted_at = None
+                shard.submitted -= 1
+
+    def sweep(self) -> int:
+        """Drop expired sessions from every shard and return how many were removed"""
+        removed = 0
+        now = time.monotonic()
+        for shard in self._shards:
+            with shard.lock:
+                removed += shard.sweep_locked(now)
+        return removed
+
+    def stats(self) -> Dict[str, int]:
+        """Counters for monitoring (submitted/expired/evicted are cumulative)"""
+        return {
+            'live': len(self),
+            'submitted': sum(shard.submitted for shard in self._shards),
+            'expired': sum(shard.expired for shard in self._shards),
+            'evicted': sum(shard.evicted for shard in self._shards)
+        }
+
+
+def _hand_over_evicted(on_evict, records: List[SessionRecord]):
+    """Pass quizzes in progress that had to be evicted to on_evict (or at least log them)"""
+    if on_evict is None:
+        logger.warning(f"Session table full - dropped {len(records)} quizzes in progress: "
+                       f"{', '.join(record.session_id for record in records)}")
+        return
+    try:
+        on_evict(records)
+    except Exception as e:
+        logger.error(f"Error finalizing {len(records)} evicted sessions: {e}", exc_info=True)
+
+
+class SharedSessionStore:
+    """
+    Session table shared between worker processes (SQLite, WAL mode)
+
+    Same interface as SessionStore. Expiry uses wall-clock time, and the
+    submitted flag is claimed with a conditional UPDATE so resubmission
+    detection holds whichever worker a request lands on.
+    """
+
+    _SCHEMA = """
+    CREATE TABLE IF NOT EXISTS sessions (
+        session_id TEXT PRIMARY KEY,
+        started TEXT NOT NULL,
+        expires REAL NOT NULL,
+        seed INTEGER,
+        revision TEXT,
+        student_name TEXT,
+        answers TEXT,
+        submitted INTEGER NOT NULL DEFAULT 0,
+        submitted_at TEXT
+    );
+    CREATE INDEX IF NOT EXISTS idx_sessions_expires ON sessions(expires);
+    CREATE TABLE IF NOT EXISTS counters (
+        name TEXT PRIMARY KEY,
+        value INTEGER NOT NULL
+    );
+    """
+
+    def __init__(self, path: str, timer_minutes: float, grace_seconds: float = GRACE_SECONDS,
+                 max_sessions: int = MAX_SESSIONS, reset: bool = True):
+        self.path = path
+        self.timer_seconds = timer_minutes * 60
+        self.ttl = timer_minutes * 60 + grace_seconds
+        self.max_sessions = max_sessions
+        self.on_evict: Optional[Callable[[List[SessionRecord]], None]] = None  # See SessionStore
+        self._local = threading.local()
+        self._next_sweep = time.time() + SWEEP_INTERVAL
+
+        os.makedirs(os.path.dirname(path) or '.', exist_ok=True)
+        conn = self._connect()
+        with conn:
+            if reset:
+                # A newly loaded quiz starts with no sessions, like SessionStore
+                conn.executescript('DROP TABLE IF EXISTS sessions; DROP TABLE IF EXISTS counters;')
+            conn.executescript(self._SCHEMA)
+            for name in ('expired', 'evicted', 'extension'):
+                conn.execute('INSERT OR IGNORE INTO counters (name, value) VALUES (?, 0)', (name,))
+
+    def _connect(self) -> sqlite3.Connection:
+        """Return this thread's connection (re-opened after a fork)"""
+        conn = getattr(self._local, 'conn', None)
+        if conn is None or self._local.pid != os.getpid():
+            conn = sqlite3.connect(self.path, timeout=30)
+            conn.execute('PRAGMA journal_mode=WAL')
+            conn.execute('PRAGMA synchronous=NORMAL')
+            self._local.conn = conn
+            self._local.pid = os.getpid()
+        return conn
+
+    def create(self, session_id: str, seed: Optional[int] = None, revision: Optional[str] = None) -> SessionRecord:
+        """Register a new session"""
+        now = time.time()
+        record = SessionRecord(session_id, datetime.now(), now + self.ttl, seed, revision)
+        if now >= self._next_sweep:
+            self.sweep()
+        conn = self._connect()
+        with conn:
+            # Time extensions granted by any worker push the expiry back too
+            conn.execute(
+                'INSERT OR REPLACE INTO sessions (session_id, started, expires, seed, revision) VALUES '
+                "(?, ?, ? + (SELECT value FROM counters WHERE name = 'extension'), ?, ?)",
+                (session_id, record.started.isoformat(), record.expires, seed, revision)
+            )
+        return record
+
+    def get(self, session_id: Optional[str]) -> Optional[SessionRecord]:
+        """Return a live session, or None if unknown or expired"""
+        if not session_id:
+            return None
+        row = self._connect().execute(
+            'SELECT started, expires, seed, revision, student_name, submitted, submitted_at FROM sessions '
+            'WHERE session_id = ? AND expires > ?', (session_id, time.time())
+        ).fetchone()
+        if row is None:
+            return None
+        record = SessionRecord(session_id, datetime.fromisoformat(row[0]), row[1], row[2], row[3])
+        record.student_name = row[4]
+        record.submitted = bool(row[5])
+        record.submitted_at = datetime.fromisoformat(row[6]) if row[6] else None
+        return record
+
+    def __contains__(self, session_id: str) -> bool:
+        return self.get(session_id) is not None
+
+    def __len__(self) -> int:
+        return self._connect().execute(
+            'SELECT COUNT(*) FROM sessions WHERE expires > ?', (time.time(),)
+        ).fetchone()[0]
+
+    def start(self, record: SessionRecord, student_name: str):
+        """Note that the student has started the quiz under this name"""
+        conn = self._connect()
+        with conn:
+            conn.execute('UPDATE sessions SET student_name = ? WHERE session_id = ?',
+                         (student_name, record.session_id))
+        record.student_name = student_name
+
+    def set_timer(self, timer_minutes: float):
+        """Give new sessions (created by this worker) a different timer; existing ones keep their expiry"""
+        self.ttl += timer_minutes * 60 - self.timer_seconds
+        self.timer_seconds = timer_minutes * 60
+
+    def extend(self, seconds: float):
+        """Push every session's expiry (and new sessions' lifetime, in every worker) back by seconds"""
+        conn = self._connect()
+        with conn:
+            conn.execute('UPDATE sessions SET expires = expires + ?', (seconds,))
+            conn.execute("UPDATE counters SET value = value + ? WHERE name = 'extension'", (seconds,))
+
+    def save_answers(self, record: SessionRecord, changes: Dict) -> bool:
+        """Merge changed answers into the session's buffer (False once submitted)"""
+        conn = self._connect()
+        with conn:
+            # Read-merge-write under the write lock, so concurrent saves and the submit claim serialize
+            conn.execute('BEGIN IMMEDIATE')
+            row = conn.execute('SELECT answers, submitted FROM sessions WHERE session_id = ?',
+                               (record.session_id,)).fetchone()
+            if row is None or row[1]:
+                return False
+            answers = json.loads(row[0]) if row[0] else {}
+            answers.update(changes)
+            conn.execute('UPDATE sessions SET answers = ? WHERE session_id = ?',
+                         (json.dumps(answers, ensure_ascii=False), record.session_id))
+        return True
+
+    def answers(self, record: SessionRecord) -> Dict:
+        """The session's autosaved answers"""
+        row = self._connect().execute('SELECT answers FROM sessions WHERE session_id = ?',
+                                      (record.session_id,)).fetchone()
+        return json.loads(row[0]) if row and row[0] else {}
+
+    def try_submit(self, record: SessionRecord) -> bool:
+        """Atomically claim the session's one submission, across all workers"""
+        submitted_at = datetime.now()
+        conn = self._connect()
+        with conn:
+            cursor = conn.execute(
+                'UPDATE sessions SET submitted = 1, submitted_at = ? '
+                'WHERE session_id = ? AND submitted = 0',
+                (submitted_at.isoformat(), record.session_id)
+            )
+        if cursor.rowcount != 1:
+            return False
+        record.submitted = True
+        record.submitted_at = submitted_at
+        return True
+
+    def release_submit(self, record: SessionRecord):
+        """Undo try_submit when the submission could not be processed"""
+        conn = self._connect()
+        with conn:
+            conn.execute('UPDATE sessions SET submitted = 0, submitted_at = NULL WHERE session_id = ?',
+                         (record.session_id,))
+        record.submitted = False
+        record.submitted_at = None
+
+    # Sessions beyond the size cap, in eviction order reversed: the table keeps quizzes in
+    # progress first, then idle sessions, then submitted ones, each the latest expiring first
+    _OVER_CAP = ('SELECT session_id FROM sessions ORDER BY '
+                 'CASE WHEN submitted = 1 THEN 2 WHEN student_name IS NULL AND answers IS NULL THEN 1 ELSE 0 END, '
+                 'expires DESC LIMIT -1 OFFSET ?')
+
+    def sweep(self) -> int:
+        """Drop expired sessions and enforce the size cap (see SessionStore for the eviction order)"""
+        now = time.time()
+        self._next_sweep = now + SWEEP_INTERVAL
+        conn = self._connect()
+        with conn:
+            expired = conn.execute('DELETE FROM sessions WHERE expires <= ?', (now,)).rowcount
+            conn.execute('UPDATE counters SET value = value + ? WHERE name = ?', (expired, 'expired'))
+        in_progress = []
+        for row in conn.execute('SELECT session_id, started, expires, seed, revision, student_name FROM sessions '
+                                'WHERE submitted = 0 AND (student_name IS NOT NULL OR answers IS NOT NULL) '
+                                f'AND session_id IN ({self._OVER_CAP})', (self.max_sessions,)):
+            record = SessionRecord(row[0], datetime.fromisoformat(row[1]), row[2], row[3], row[4])
+            record.student_name = row[5]
+            in_progress.append(record)
+        if in_progress:
+            # Finalized (which marks them submitted) while their rows are still there
+            _hand_over_evicted(self.on_evict, in_progress)
+        with conn:
+            evicted = conn.execute(f'DELETE FROM sessions WHERE session_id IN ({self._OVER_CAP})',
+                                   (self.max_sessions,)).rowcount
+            conn.execute('UPDATE counters SET value = value + ? WHERE name = ?', (evicted, 'evicted'))
+        return expired
+
+    def stats(self) -> Dict[str, int]:
+        """Counters for monitoring (expired/evicted are cumulative)"""
+        conn = self._connect()
+        now = time.time()
+        counters = dict(conn.execute('SELECT name, value FROM counters'))
+        return {
+            'live': conn.execute('SELECT COUNT(*) FROM sessions WHERE expires > ?', (now,)).fetchone()[0],
+            'submitted': conn.execute('SELECT COUNT(*) FROM sessions WHERE submitted = 1').fetchone()[0],
+            'expired': counters.get('expired', 0),
+            'evicted': counters.get('evicted', 0)
+        }
@@ -1,31 +1,131 @@
 """
 Utility functions for server operations
 """
+import atexit
 import logging
+import logging.handlers
 import os
+import queue
+import uuid
 from datetime import datetime
-from typing import Tuple
+from typing import Dict, List, Optional, Tuple
+
+AUDIT_LOGGER = 'quiz.audit'  # Submission audit records (JSON lines, own file)
+LOG_FORMAT = '%(asctime)s - %(name)s - %(levelname)s - %(message)s'
+MULTIPLE_CHOICE_TYPES = frozenset(('multiple_choice_single', 'multiple_choice_multiple'))
+
+# Background thread that writes queued log records to the real handlers
+_log_listener: Optional[logging.handlers.QueueListener] = None
+
+
+class _DeferredQueueHandler(logging.handlers.QueueHandler):
+    """
+    Queue records unformatted so formatting also happens on the listener thread
+    
+    The queue never leaves the process, so records need not be flattened
+    to strings first (which is all QueueHandler.prepare is for).
+    """
+
+    def prepare(self, record: logging.LogRecord) -> logging.LogRecord:
+        return record
+
+
+class _AuditFilter(logging.Filter):
+    """Route audit records to the audit file only (accept=True) or keep them out"""
+
+    def __init__(self, accept: bool):
+        super().__init__()
+        self.accept = accept
+
+    def filter(self, record: logging.LogRecord) -> bool:
+        return (record.name == AUDIT_LOGGER) == self.accept
 
 
 def setup_logging():
-    """Configure logging for the application"""
+    """
+    Configure logging for the application
+    
+    Request threads only put records on a queue; a listener thread does
+    the formatting and the file and console I/O. The listener is stopped
+    across os.fork and each process gets its own afterwards. Submission
+    audit records go to logs/audit_<date>.jsonl (see server.audit).
+    """
+    global _log_listener
+    if _log_listener is not None:
+        return logging.getLogger(__name__)
+    
     logs_dir = 'logs'
     os.makedirs(logs_dir, exist_ok=True)
     
-    log_file = os.path.join(logs_dir, f"quiz_server_{datetime.now().strftime('%Y%m%d')}.log")
+    today = datetime.now().strftime('%Y%m%d')
+    log_file = os.path.join(logs_dir, f"quiz_server_{today}.log")
+    audit_file = os.path.join(logs_dir, f"audit_{today}.jsonl")
+    
+    formatter = logging.Formatter(LOG_FORMAT)
+    file_handler = logging.FileHandler(log_file, encoding='utf-8')
+    stream_handler = logging.StreamHandler()
+    audit_handler = logging.FileHandler(audit_file, encoding='utf-8', delay=True)
+    for handler in (file_handler, stream_handler):
+        handler.setFormatter(formatter)
+        handler.addFilter(_AuditFilter(accept=False))
+    audit_handler.setFormatter(logging.Formatter('%(message)s'))
+    audit_handler.addFilter(_AuditFilter(accept=True))
+    
+    log_queue = queue.SimpleQueue()
+    _log_listener = logging.handlers.QueueListener(
+        log_queue, file_handler, stream_handler, audit_handler, respect_handler_level=True)
+    _log_listener.start()
     
-    logging.basicConfig(
-        level=logging.INFO,
-        format='%(asctime)s - %(name)s - %(levelname)s - %(message)s',
-        handlers=[
-            logging.FileHandler(log_file, encoding='utf-8'),
-            logging.StreamHandler()
-        ]
-    )
+    root = logging.getLogger()
+    root.setLevel(logging.INFO)
+    root.addHandler(_DeferredQueueHandler(log_queue))
+    atexit.register(stop_logging)
+    if hasattr(os, 'register_at_fork'):
+        os.register_at_fork(before=_pause_logging, after_in_parent=_resume_logging,
+                            after_in_child=_restart_logging_in_child)
     
     return logging.getLogger(__name__)
 
 
+def stop_logging():
+    """Write out every queued log record and stop the listener thread"""
+    global _log_listener
+    listener, _log_listener = _log_listener, None
+    if listener is not None:
+        listener.stop()
+
+
+def _pause_logging():
+    """
+    Before fork: write out the queue and stop the listener thread
+    
+    A thread running at fork time could be holding a handler's or a
+    stream's lock, which the child would then never see released.
+    """
+    if _log_listener is not None:
+        _log_listener.stop()
+
+
+def _resume_logging():
+    """After fork, in the parent: start the listener thread again"""
+    if _log_listener is not None:
+        _log_listener.start()
+
+
+def _restart_logging_in_child():
+    """The listener thread does not survive fork - give the child its own queue and thread"""
+    global _log_listener
+    if _log_listener is None:
+        return
+    log_queue = queue.SimpleQueue()
+    for handler in logging.getLogger().handlers:
+        if isinstance(handler, logging.handlers.QueueHandler):
+            handler.queue = log_queue
+    _log_listener = logging.handlers.QueueListener(
+        log_queue, *_log_listener.handlers, respect_handler_level=True)
+    _log_listener.start()
+
+
 def validate_quiz_data(quiz_data: dict) -> Tuple[bool, str]:
     """
     Validate quiz data structure
@@ -42,32 +142,170 @@ def validate_quiz_data(quiz_data: dict) -> Tuple[bool, str]:
     if not isinstance(quiz_data['questions'], list):
         return False, "Questions must be a list"
     
-    if len(quiz_data['questions']) == 0:
+    draws = quiz_data.get('bank_draws', [])
+    if not isinstance(draws, list):
+        return False, "bank_draws must be a list"
+    for i, draw in enumerate(draws):
+        if not isinstance(draw, dict):
+            return False, f"Draw {i+1} must be an object"
+        count = draw.get('count')
+        if not isinstance(count, int) or isinstance(count, bool) or count < 1:
+            return False, f"Draw {i+1}: count must be a positive whole number"
+        if not isinstance(draw.get('text', ''), str):
+            return False, f"Draw {i+1}: text must be a string"
+        for field in ('tags', 'types', 'quizzes'):
+            values = draw.get(field, [])
+            if not isinstance(values, list) or not all(isinstance(v, str) for v in values):
+                return False, f"Draw {i+1}: {field} must be a list of strings"
+    
+    # Questions drawn from the question bank count towards the minimum of one
+    if len(quiz_data['questions']) == 0 and not draws:
         return False, "Quiz must have at least one question"
     
     # Validate each question
+    seen_ids = set()
     for i, question in enumerate(quiz_data['questions']):
-        if 'type' not in question:
-            return False, f"Question {i+1} missing type"
-        
-        if 'text' not in question or not question['text'].strip():
-            return False, f"Question {i+1} missing text"
-        
-        q_type = question['type']
+        is_valid, error_msg = validate_question(question, i + 1)
+        if not is_valid:
+            return False, error_msg
         
-        if q_type in ['multiple_choice_single', 'multiple_choice_multiple']:
-            if 'options' not in question or len(question.get('options', [])) < 2:
-                return False, f"Question {i+1}: Multiple choice needs at least 2 options"
-        
-        if 'weight' in question:
-            try:
-                float(question['weight'])
-            except (ValueError, TypeError):
-                return False, f"Question {i+1}: Weight must be a number"
+        question_id = question.get('id')
+        if question_id:
+            if question_id in seen_ids:
+                return False, f"Question {i+1}: Duplicate question id {question_id}"
+            seen_ids.add(question_id)
     
     return True, ""
 
 
+def validate_question(question: dict, number: int = 1) -> Tuple[bool, str]:
+    """
+    Validate one question (number is its position in messages)
+    
+    Returns:
+        (is_valid, error_message)
+    """
+    if not isinstance(question, dict):
+        return False, f"Question {number} must be an object"
+    
+    if 'type' not in question:
+        return False, f"Question {number} missing type"
+    
+    text = question.get('text')
+    if not isinstance(text, str) or not text.strip():
+        return False, f"Question {number} missing text"
+    
+    if question['type'] in MULTIPLE_CHOICE_TYPES:
+        options = question.get('options')
+        if not isinstance(options, list) or len(options) < 2:
+            return False, f"Question {number}: Multiple choice needs at least 2 options"
+    
+    if 'weight' in question:
+        try:
+            float(question['weight'])
+        except (ValueError, TypeError):
+            return False, f"Question {number}: Weight must be a number"
+    
+    # Tags are optional, but must be a list of strings
+    if 'tags' in question:
+        tags = question['tags']
+        if not isinstance(tags, list) or not all(isinstance(tag, str) for tag in tags):
+            return False, f"Question {number}: Tags must be a list of strings"
+    
+    return True, ""
+
+
+def new_question_id() -> str:
+    """A fresh question id (random, so ids from different quizzes don't collide)"""
+    return uuid.uuid4().hex[:12]
+
+
+def assign_question_ids(quiz_data: dict) -> int:
+    """
+    Give every question without an id (or with a duplicate one) a new id
+    
+    Results are keyed by question id, so an id must never change once a
+    quiz has been taken; only questions that lack one are touched.
+    
+    Returns:
+        Number of ids assigned
+    """
+    seen = set()
+    assigned = 0
+    for question in quiz_data.get('questions', []):
+        question_id = question.get('id')
+        if not question_id or question_id in seen:
+            question_id = question['id'] = new_question_id()
+            assigned += 1
+        seen.add(question_id)
+    return assigned
+
+
+def result_question_key(q_result: Dict) -> str:
+    """Key of a graded question's answer (results saved before question ids are keyed by position)"""
+    return q_result.get('question_id') or str(q_result['question_num'] - 1)
+
+
+def csv_header(question_keys: List[str]) -> List[str]:
+    """
+    Build the header row of the aggregate results CSV
+    
+    Question columns are labelled with the question keys csv_row matches
+    them by (ids, or positions for results saved before ids), so a label
+    keeps naming the same question after a reorder or insert.
+    """
+    header = ['Timestamp', 'Student Name', 'Session ID', 'Total Points',
+              'Earned Points', 'Percentage']
+    # Add question columns
+    for key in question_keys:
+        header.extend([f'{key}_Answer', f'{key}_Correct', f'{key}_Points'])
+    return header
+
+
+def csv_row(timestamp: str, student_name: str, session_id: str,
+            answers: Dict, score_result: Dict,
+            question_keys: Optional[List[str]] = None) -> List:
+    """
+    Build one data row of the aggregate results CSV
+    
+    With question_keys, the question columns follow that order (matched by
+    question id) and questions the submission didn't have are left blank,
+    so rows graded before a reorder line up with later ones.
+    """
+    row = [
+        timestamp,
+        student_name,
+        session_id,
+        score_result['total_points'],
+        score_result['earned_points'],
+        score_result['percentage']
+    ]
+    
+    q_results = score_result['question_results']
+    if question_keys is None:
+        columns = [(result_question_key(q_result), q_result) for q_result in q_results]
+    else:
+        by_key = {result_question_key(q_result): q_result for q_result in q_results}
+        columns = [(key, by_key.get(key)) for key in question_keys]
+    
+    # Add question answers
+    for key, q_result in columns:
+        if q_result is None:
+            row.extend(['', '', ''])
+            continue
+        # A regraded result carries the answer under the current question id; the
+        # stored answers keep the keys of the version they were given on
+        user_ans = q_result['user_answer'] if 'user_answer' in q_result else answers.get(key, '')
+        if isinstance(user_ans, list):
+            user_ans = '; '.join(str(a) for a in user_ans)
+        row.extend([
+            str(user_ans),
+            str(q_result['correct']) if q_result['correct'] is not None else 'Manual',
+            f"{q_result['points_earned']}/{q_result['points_possible']}"
+        ])
+    return row
+
+
 def graceful_shutdown(server_thread=None, ngrok_url=None):
     """Gracefully shutdown server and cleanup resources"""
     import logging
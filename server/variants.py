@@ -0,0 +1,81 @@
+"""
+Per-session quiz variants
+
+A shuffled quiz is never copied per student. Each session gets a seed,
+and the question order (and option orders, when enabled) are derived
+from it on demand as compact index arrays. Answers arrive keyed by
+display position and are mapped back to question positions for grading.
+
+A quiz that draws from the question bank (see server.question_bank) has a
+pool of questions per draw; the seed also picks which of each pool the
+session gets, so its question order lists only the drawn questions.
+"""
+import random
+import secrets
+from array import array
+from typing import Dict, List, Optional
+
+
+def new_seed(quiz_data: Dict) -> Optional[int]:
+    """Seed for a new session, or None when the quiz is neither shuffled nor drawn from the bank"""
+    if quiz_data.get('shuffle_questions', False) or quiz_data.get('shuffle_options', False) \
+            or quiz_data.get('draw_pools'):
+        return secrets.randbits(32)
+    return None
+
+
+class Variant:
+    """Question/option permutation for one session, derived from its seed"""
+
+    __slots__ = ('question_order', 'option_orders', 'drawn')
+
+    def __init__(self, seed: int, quiz_data: Dict):
+        questions = quiz_data.get('questions', [])
+        rng = random.Random(seed)
+
+        order = list(range(len(questions)))
+        pools = quiz_data.get('draw_pools')
+        self.drawn = bool(pools)  # True if order is a subset of the questions
+        if pools:
+            pooled = set()
+            drawn = set()
+            for pool in pools:
+                candidates = range(pool['start'], pool['start'] + pool['size'])
+                pooled.update(candidates)
+                drawn.update(rng.sample(candidates, pool['count']))
+            order = [i for i in order if i not in pooled or i in drawn]
+        if quiz_data.get('shuffle_questions', False):
+            rng.shuffle(order)
+        # display position -> question index
+        self.question_order = array('I', order)
+
+        # question index -> display position of each option
+        self.option_orders: Dict[int, array] = {}
+        if quiz_data.get('shuffle_options', False):
+            shown = set(order) if pools else None
+            for i, question in enumerate(questions):
+                if shown is not None and i not in shown:
+                    continue
+                options = question.get('options')
+                if options and len(options) > 1:
+                    option_order = list(range(len(options)))
+                    rng.shuffle(option_order)
+                    self.option_orders[i] = array('I', option_order)
+
+    def to_canonical(self, answers: Dict) -> Dict:
+        """Re-key answers from display positions to question positions"""
+        order = self.question_order
+        canonical = {}
+        for position, answer in answers.items():
+            try:
+                canonical[str(order[int(position)])] = answer
+            except (ValueError, IndexError):
+                continue  # Unknown position - nothing to grade it against
+        return canonical
+
+    def to_json(self) -> Dict[str, List[int]]:
+        """Index arrays as sent to the browser"""
+        return {
+            'question_order': self.question_order.tolist(),
+            'option_orders': {str(i): o.tolist() for i, o in self.option_orders.items()}
+        }
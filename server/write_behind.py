@@ -0,0 +1,200 @@
+"""
+Write-behind queue for submission persistence
+
+Request threads hand submissions to a bounded in-process queue and a
+single writer thread group-commits them to the results store (one
+transaction, one fsync per batch). A request waits a short time for its
+batch to be journaled; if the writer is behind it gets a 'pending'
+acknowledgement instead of blocking on disk. A batch that fails to commit
+is retried one submission at a time, so one bad record cannot sink the
+others.
+"""
+import logging
+import os
+import queue
+import threading
+import time
+from typing import Dict, List, Optional
+
+from server.metrics import METRICS
+
+logger = logging.getLogger(__name__)
+
+MAX_PENDING = 10000   # Queue bound - beyond this, submits are written synchronously
+BATCH_SIZE = 256      # Max submissions per group commit
+ACK_TIMEOUT = 2.0     # Seconds a request waits for its submission to be journaled
+
+JOURNALED = 'journaled'
+PENDING = 'pending'
+FAILED = 'failed'
+
+COMMIT_SECONDS = METRICS.histogram('quiz_results_commit_duration_seconds',
+                                   'Time the results writer spends on one group commit')
+COMMIT_BATCH = METRICS.histogram('quiz_results_commit_batch_size', 'Submissions per group commit',
+                                 buckets=(1, 2, 4, 8, 16, 32, 64, 128, 256, 512), unit='submissions')
+
+
+class _Item:
+    """One queued submission and its acknowledgement"""
+
+    __slots__ = ('store', 'record', 'done', 'status')
+
+    def __init__(self, store, record: Dict):
+        self.store = store
+        self.record = record
+        self.done = threading.Event()
+        self.status = PENDING
+
+
+_STOP = object()
+
+
+class WriteBehindQueue:
+    """Bounded submission queue drained by one group-committing writer thread"""
+
+    def __init__(self, max_pending: int = MAX_PENDING, batch_size: int = BATCH_SIZE,
+                 ack_timeout: float = ACK_TIMEOUT):
+        self.batch_size = batch_size
+        self.ack_timeout = ack_timeout
+        self.max_pending = max_pending
+        self._queue = queue.Queue(maxsize=max_pending)
+        self._thread: Optional[threading.Thread] = None
+        self._pid = None
+        self._lock = threading.Lock()
+        self._closed = False
+
+    def _ensure_started(self):
+        """Start the writer thread on first use (in this process)"""
+        if self._thread is not None and self._pid == os.getpid():
+            return
+        if self._pid is not None and self._pid != os.getpid():
+            # Forked: the writer thread, and whatever it had queued, stayed with the parent
+            self._lock = threading.Lock()
+            self._queue = queue.Queue(maxsize=self.max_pending)
+            self._thread = None
+            self._pid = os.getpid()
+        with self._lock:
+            if self._thread is None:
+                self._thread = threading.Thread(target=self._run, name='results-writer', daemon=True)
+                self._pid = os.getpid()
+                self._thread.start()
+
+    def depth(self) -> int:
+        """Number of submissions waiting to be written"""
+        return self._queue.qsize()
+
+    def submit(self, store, record: Dict, wait: bool = True) -> str:
+        """
+        Queue a submission for the given ResultsStore
+
+        Returns JOURNALED once it is committed, PENDING if it is still
+        queued after ack_timeout (or wait is False), or FAILED if the
+        write failed - nothing of it is stored then, and the caller can
+        let the student submit again.
+        """
+        item = _Item(store, record)
+        if self._closed:
+            return self._write_now(item)
+
+        self._ensure_started()
+        try:
+            self._queue.put_nowait(item)
+        except queue.Full:
+            # Backpressure: write on the request thread rather than drop it
+            logger.warning("Results queue full, writing submission synchronously")
+            return self._write_now(item)
+
+        if wait:
+            item.done.wait(self.ack_timeout)
+        return item.status
+
+    def _write_now(self, item: _Item) -> str:
+        """Write a single submission on the calling thread"""
+        self._commit([item])
+        return item.status
+
+    def _run(self):
+        """Writer thread: collect a batch, commit it, acknowledge it"""
+        while True:
+            item = self._queue.get()
+            if item is _STOP:
+                return
+            batch = [item]
+            stop = False
+            while len(batch) < self.batch_size:
+                try:
+                    item = self._queue.get_nowait()
+                except queue.Empty:
+                    break
+                if item is _STOP:
+                    stop = True
+                    break
+                batch.append(item)
+
+            self._commit(batch)
+            if stop:
+                return
+
+    def _commit(self, batch: List[_Item]):
+        """Group-commit a batch, one transaction per results store"""
+        started = time.perf_counter()
+        by_store = {}
+        for item in batch:
+            by_store.setdefault(id(item.store), []).append(item)
+
+        for items in by_store.values():
+            store = items[0].store
+            try:
+                store.append_many([item.record for item in items])
+                status = JOURNALED
+            except Exception as e:
+                if len(items) == 1:
+                    logger.error(f"Error storing result of session {items[0].record.get('session_id')}: {e}",
+                                 exc_info=True)
+                    status = FAILED
+                else:
+                    # The transaction was rolled back - retry each submission on its own
+                    logger.warning(f"Error storing {len(items)} results, retrying them one by one: {e}")
+                    for item in items:
+                        self._commit_one(item)
+                    continue
+            for item in items:
+                item.status = status
+                item.done.set()
+        COMMIT_SECONDS.observe(time.perf_counter() - started)
+        COMMIT_BATCH.observe(len(batch))
+
+    def _commit_one(self, item: _Item):
+        """Write a single submission of a failed batch and acknowledge it"""
+        try:
+            item.store.append_many([item.record])
+            item.status = JOURNALED
+        except Exception as e:
+            logger.error(f"Error storing result of session {item.record.get('session_id')}: {e}", exc_info=True)
+            item.status = FAILED
+        item.done.set()
+
+    def drain(self, timeout: Optional[float] = None):
+        """Stop accepting queued work and flush everything still pending"""
+        self._closed = True
+        thread = self._thread
+        if thread is None or not thread.is_alive():
+            return
+        self._queue.put(_STOP)
+        thread.join(timeout)
+        if thread.is_alive():
+            logger.error(f"Results writer did not finish draining ({self.depth()} submissions left)")
+            return
+
+        # Submits that raced with the stop marker are written here
+        leftovers = []
+        while True:
+            try:
+                item = self._queue.get_nowait()
+            except queue.Empty:
+                break
+            if item is not _STOP:
+                leftovers.append(item)
+        if leftovers:
+            self._commit(leftovers)
+        logger.info("Results queue drained")